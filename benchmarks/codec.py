@@ -0,0 +1,76 @@
+"""
+Compares the binary `Quote` codec with the previous JSON cache format:
+    python -m benchmarks.codec
+"""
+from dataclasses import asdict
+from json import dumps, loads
+from timeit import timeit
+
+from quotes_suggestions_service.clients.dtos import Quote, quotes_from_bytes, quotes_to_bytes
+
+
+QUOTES = tuple(
+    Quote(
+        quote=f'Life is what happens to you while you are busy making other plans {number}. '
+              f'Imagine all the people living life in peace.',
+        author='John Lennon',
+        description='Beautiful Boy (Darling Boy), 1980' if number % 2 else None)
+    for number in range(2000)
+)
+REPEATS = 20
+PAGE_SIZE = 5
+
+
+def encode_json(quotes):
+    return dumps({num: asdict(value) for num, value in enumerate(quotes)})
+
+
+def decode_json(data):
+    return tuple(Quote(**raw_quote) for raw_quote in loads(data).values())
+
+
+def encode_binary(quotes, compress):
+    return [quote.to_bytes(compress) for quote in quotes]
+
+
+def decode_binary(elements):
+    return tuple(Quote.from_bytes(element) for element in elements)
+
+
+def main():
+    json_data = encode_json(QUOTES)
+    cases = {
+        'json blob': (
+            lambda: encode_json(QUOTES), lambda: decode_json(json_data), len(json_data)),
+    }
+
+    for compress in (False, True):
+        elements = encode_binary(QUOTES, compress)
+        cases[f'binary list elements (compress={compress})'] = (
+            lambda compress=compress: encode_binary(QUOTES, compress),
+            lambda elements=elements: decode_binary(elements),
+            sum(len(element) for element in elements))
+
+        sequence = quotes_to_bytes(QUOTES, compress)
+        cases[f'binary sequence (compress={compress})'] = (
+            lambda compress=compress: quotes_to_bytes(QUOTES, compress),
+            lambda sequence=sequence: quotes_from_bytes(sequence),
+            len(sequence))
+
+    # A page request decoded the whole JSON blob, the list layout decodes only the page
+    page = encode_binary(QUOTES[:PAGE_SIZE], compress=True)
+    cases[f'page of {PAGE_SIZE}: json blob'] = (
+        lambda: None, lambda: decode_json(json_data)[:PAGE_SIZE], len(json_data))
+    cases[f'page of {PAGE_SIZE}: binary list elements'] = (
+        lambda: None, lambda: decode_binary(page), sum(len(element) for element in page))
+
+    print(f'{len(QUOTES)} quotes, mean of {REPEATS} runs')
+    for name, (encode, decode, size) in cases.items():
+        encode_time = timeit(encode, number=REPEATS) / REPEATS * 1000
+        decode_time = timeit(decode, number=REPEATS) / REPEATS * 1000
+        print(f'{name:40} encode {encode_time:7.2f} ms  decode {decode_time:7.2f} ms  '
+              f'size {size / 1024:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Deduplication of quotes with the precomputed identity key and the previous `Quote`,
+which normalized the text on every hash and comparison:
+    python -m benchmarks.quote_identity
+"""
+from dataclasses import dataclass
+from sys import getsizeof
+from timeit import repeat
+from typing import Optional
+
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.utils.helpers import return_only_lower_letters
+
+
+@dataclass(frozen=True)
+class PreviousQuote:
+
+    quote: str
+    author: str
+    description: Optional[str] = None
+
+    def __hash__(self):
+        return hash(return_only_lower_letters(self.quote.lower() + self.author.lower()))
+
+    def __eq__(self, other):
+        if isinstance(other, PreviousQuote):
+            return self.__hash__() == other.__hash__()
+
+
+# A large author result: every quote comes from two sources, formatted slightly differently
+RAW_QUOTES = tuple(
+    (text, 'Mark Twain', None)
+    for number in range(10000)
+    for text in (
+        f'The secret of getting ahead is getting started, part {number}.',
+        f'The secret of getting ahead is getting started - part {number}',
+    )
+)
+REPEATS = 5
+
+
+def main():
+    print(f'{len(RAW_QUOTES)} quotes, best of {REPEATS} runs')
+
+    for quote_class in (PreviousQuote, Quote):
+        quotes = [quote_class(*raw_quote) for raw_quote in RAW_QUOTES]
+        unique_quotes = set(quotes)
+        cases = {
+            'construct': lambda: [quote_class(*raw_quote) for raw_quote in RAW_QUOTES],
+            'dedup into a set': lambda: set(quotes),
+            'merge with cached': lambda: unique_quotes.union(quotes),
+            'membership': lambda: sum(quote in unique_quotes for quote in quotes),
+        }
+
+        size = getsizeof(quotes[0]) + (
+            getsizeof(vars(quotes[0])) if hasattr(quotes[0], '__dict__') else 0)
+        print(f'{quote_class.__name__} ({size} bytes per instance without the strings)')
+        for name, case in cases.items():
+            elapsed = min(repeat(case, number=1, repeat=REPEATS)) * 1000
+            print(f'    {name:20} {elapsed:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
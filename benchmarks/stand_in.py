@@ -0,0 +1,209 @@
+"""
+Local stand-in of brainyquote.com and the WikiQuote API, it replays the recorded fixtures
+of `benchmarks/fixtures` with a configurable latency, so benchmarks need no network access:
+    python -m benchmarks.stand_in --latency 50
+"""
+import json
+import random
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from quotes_suggestions_service.clients import EN_QUOTES_API_CLIENTS, BrainyQuoteClient
+from quotes_suggestions_service.clients.wikiquote.client import WikiQuoteClient
+
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+WIKIQUOTE_API_PATH = '/w/api.php'
+# Redirect pages of the recorded authors, as WikiQuote has them
+WIKIQUOTE_REDIRECTS = {
+    'Samuel Clemens': 'Mark Twain',
+    'Twain': 'Mark Twain',
+    'Ben Franklin': 'Benjamin Franklin',
+    'Wilde': 'Oscar Wilde',
+}
+NOT_FOUND_PAGE = b'<!DOCTYPE html>\n<html><body><h1>Page Not Found</h1></body></html>\n'
+
+
+class StandInServer:
+    """
+    Threaded HTTP server on a free local port. Every response is delayed by `latency`
+    plus a uniformly random part of up to `jitter` seconds, as an upstream round trip is
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, fixtures: Path = FIXTURES):
+        self.latency = latency
+        self.jitter = jitter
+        self.fixtures = fixtures
+        self.requests = 0
+
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _get_handler_class(self))
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StandInServer':
+        self._thread = Thread(
+            target=self.serve_forever, name='stand-in-server', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        """
+        :return: (status, content type, body) of the request
+        """
+        with self._lock:
+            self.requests += 1
+        sleep(self.latency + random.uniform(0, self.jitter))
+
+        if path == WIKIQUOTE_API_PATH:
+            return 200, 'application/json; charset=utf-8', json.dumps(
+                self._get_wikiquote_response(query)).encode()
+
+        fixture = self.fixtures / 'brainyquote' / f'{path.strip("/")}.html'
+        if '..' in path or not fixture.is_file():
+            return 404, 'text/html; charset=utf-8', NOT_FOUND_PAGE
+
+        return 200, 'text/html; charset=utf-8', fixture.read_bytes()
+
+    def _get_wikiquote_response(self, query: Dict[str, List[str]]) -> dict:
+        action = query.get('action', [''])[0]
+
+        if action == 'query':
+            return self._get_titles_response(query.get('titles', [''])[0].split('|'))
+        elif action == 'parse':
+            fixture = self._get_page_fixture(
+                self._resolve_title(query.get('page', [''])[0]))
+            if fixture is not None:
+                return json.loads(fixture.read_text())
+
+            return {'error': {'code': 'missingtitle', 'info': "The page doesn't exist."}}
+
+        return {'error': {'code': 'badvalue', 'info': f'Unrecognized action: {action}'}}
+
+    def _get_titles_response(self, titles: List[str]) -> dict:
+        normalized = [
+            {'from': title, 'to': _normalize_title(title)}
+            for title in titles if _normalize_title(title) != title
+        ]
+        redirects = [
+            {'from': title, 'to': WIKIQUOTE_REDIRECTS[title]}
+            for title in map(_normalize_title, titles) if title in WIKIQUOTE_REDIRECTS
+        ]
+
+        pages = {}
+        for number, title in enumerate(dict.fromkeys(map(self._resolve_title, titles)), 1):
+            fixture = self._get_page_fixture(title)
+            if fixture is not None:
+                pages[str(json.loads(fixture.read_text())['parse']['pageid'])] = {
+                    'ns': 0, 'title': title}
+            else:
+                pages[str(-number)] = {'ns': 0, 'title': title, 'missing': ''}
+
+        return {'batchcomplete': '', 'query': {
+            'normalized': normalized, 'redirects': redirects, 'pages': pages}}
+
+    def _get_page_fixture(self, title: str) -> Optional[Path]:
+        fixture = self.fixtures / 'wikiquote' / f'{title.replace(" ", "_")}.json'
+
+        return fixture if '/' not in title and fixture.is_file() else None
+
+    @staticmethod
+    def _resolve_title(title: str) -> str:
+        title = _normalize_title(title)
+
+        return WIKIQUOTE_REDIRECTS.get(title, title)
+
+
+def _normalize_title(title: str) -> str:
+    title = ' '.join(title.replace('_', ' ').split())
+
+    return title[:1].upper() + title[1:]
+
+
+def _get_handler_class(server: StandInServer) -> type:
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # connections are kept alive as upstreams do
+        # Headers and body are separate writes, Nagle's algorithm would delay the body
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            status, content_type, body = server.respond(url.path, parse_qs(url.query))
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+@contextmanager
+def use_stand_in(url: str) -> Iterator[None]:
+    """
+    Points the quotes clients of the service to the stand-in server at `url`
+    """
+    brainyquote_urls = (
+        BrainyQuoteClient.api_url, BrainyQuoteClient.topics_url, BrainyQuoteClient.authors_url)
+    wikiquote_clients = [
+        client for client in EN_QUOTES_API_CLIENTS if isinstance(client, WikiQuoteClient)]
+    wikiquote_urls = [client.api_url for client in wikiquote_clients]
+
+    BrainyQuoteClient.api_url = url
+    BrainyQuoteClient.topics_url = f'{url}/topics'
+    BrainyQuoteClient.authors_url = f'{url}/authors'
+    for client in wikiquote_clients:
+        client.api_url = f'{url}{WIKIQUOTE_API_PATH}'
+
+    try:
+        yield
+    finally:
+        BrainyQuoteClient.api_url, BrainyQuoteClient.topics_url, \
+            BrainyQuoteClient.authors_url = brainyquote_urls
+        for client, api_url in zip(wikiquote_clients, wikiquote_urls):
+            client.api_url = api_url
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0, help='per response, in ms')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra latency, in ms')
+    arguments = parser.parse_args()
+
+    server = StandInServer(arguments.latency / 1000, arguments.jitter / 1000)
+    print(f'Serving the fixtures at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,352 @@
+"""
+Offline benchmarks of the parsing, ranking, cache and end-to-end paths:
+    python -m benchmarks.suite --latency 50 --json results.json
+Upstreams are replaced with `benchmarks.stand_in` replaying the recorded fixtures.
+Cache and end-to-end cases use Redis at `--redis` URL, which is flushed, or fakeredis
+if it's installed, they are skipped without both.
+Every case reports throughput and p50/p99 latency, end-to-end ones for cold requests
+(Redis and the in-process cache are flushed before each one), requests served from Redis
+and requests served from the in-process cache
+"""
+import json
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from pathlib import Path
+from threading import Lock, local
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+from redis import Redis
+
+from quotes_suggestions_service.clients import BrainyQuoteClient
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.clients.wikiquote.parsers import LxmlQuotesParser, SoupQuotesParser
+from quotes_suggestions_service.setting import RANKING_MAX_QUOTES
+
+from .stand_in import FIXTURES, StandInServer, use_stand_in
+
+
+SECTIONS = ('parsing', 'ranking', 'cache', 'e2e')
+# Author and topic queries of the recorded fixtures, brainyquote pages of topics are paginated
+E2E_QUERIES = (
+    {'authors': 'Mark Twain'},
+    {'authors': 'Oscar Wilde,Benjamin Franklin'},
+    {'authors': 'Samuel Clemens', 'keywords': 'truth'},
+    {'keywords': 'love'},
+    {'keywords': 'life,love'},
+)
+RANKING_KEYWORDS = (('love', ), ('life', 'truth'), ('temptation', 'secret', 'time'))
+CACHE_KEYS = 5  # read at once, as results of a query split by authors are
+
+
+class Result(NamedTuple):
+
+    section: str
+    case: str
+    durations: Tuple[float, ...]  # of every call, in seconds
+    elapsed: float  # wall time of all calls, in seconds
+
+    @property
+    def throughput(self) -> float:
+        return len(self.durations) / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def percentile(self, percent: float) -> float:
+        """
+        Nearest-rank percentile of the durations
+        """
+        durations = sorted(self.durations)
+        rank = max(int(len(durations) * percent / 100 + 0.5), 1)
+
+        return durations[min(rank, len(durations)) - 1]
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            'section': self.section,
+            'case': self.case,
+            'runs': len(self.durations),
+            'throughput': round(self.throughput, 2),
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+        }
+
+
+def measure(
+        section: str,
+        case: str,
+        call: Callable[[], object],
+        runs: int,
+        concurrency: int = 1,
+        prepare: Optional[Callable[[], object]] = None) -> Result:
+    """
+    Times `runs` calls made by `concurrency` threads.
+    `prepare` is called before every call outside of the timing, it's meant for sequential runs
+    """
+    durations = []
+    lock = Lock()
+
+    def run(_):
+        if prepare is not None:
+            prepare()
+        started = perf_counter()
+        call()
+        duration = perf_counter() - started
+        with lock:
+            durations.append(duration)
+
+    started = perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, range(runs)))
+    else:
+        for number in range(runs):
+            run(number)
+    elapsed = perf_counter() - started
+
+    if prepare is not None:
+        # Preparations, e.g. flushes of caches, aren't a part of the throughput
+        elapsed = sum(durations) / concurrency
+
+    return Result(section, case, tuple(durations), elapsed)
+
+
+def load_wikiquote_pages() -> Dict[str, str]:
+    """
+    :return: {title: raw page} of the recorded `action=parse` responses
+    """
+    pages = {}
+    for path in sorted((FIXTURES / 'wikiquote').glob('*.json')):
+        response = json.loads(path.read_text())['parse']
+        pages[response['title']] = response['text']['*']
+
+    return pages
+
+
+def load_brainyquote_pages() -> Dict[str, str]:
+    """
+    :return: {path: raw page} of the recorded pages
+    """
+    root = FIXTURES / 'brainyquote'
+
+    return {
+        str(path.relative_to(root).with_suffix('')): path.read_text()
+        for path in sorted(root.glob('*/*.html'))
+    }
+
+
+def load_quotes() -> Tuple[Quote, ...]:
+    quotes = {
+        quote
+        for title, page in load_wikiquote_pages().items()
+        for quote in LxmlQuotesParser().parse(title, page)
+    }
+    quotes.update(BrainyQuoteClient._parse_quotes_from_pages(load_brainyquote_pages().values()))
+
+    return tuple(quotes)
+
+
+def benchmark_parsing(arguments: Namespace, redis: Optional[Redis]) -> List[Result]:
+    results = []
+
+    for title, page in load_wikiquote_pages().items():
+        for parser in (LxmlQuotesParser(), SoupQuotesParser()):
+            results.append(measure(
+                'parsing', f'wikiquote {title} ({type(parser).__name__})',
+                lambda parser=parser, title=title, page=page: parser.parse(title, page),
+                arguments.runs))
+
+    for path, page in load_brainyquote_pages().items():
+        results.append(measure(
+            'parsing', f'brainyquote {path}',
+            lambda page=page: BrainyQuoteClient._parse_quotes_from_pages((page, )),
+            arguments.runs))
+
+    return results
+
+
+def benchmark_ranking(arguments: Namespace, redis: Optional[Redis]) -> List[Result]:
+    from quotes_suggestions_service.quotes_generator import QuotesGenerator
+    from quotes_suggestions_service.utils.ranking import QuotesRanker
+
+    quotes = load_quotes()
+    warm_ranker = QuotesRanker(QuotesGenerator.ranker.analyze, RANKING_MAX_QUOTES)
+    warm_ranker.index(quotes)
+    results = []
+
+    for keywords in RANKING_KEYWORDS:
+        # Cold ranking analyzes every quote, warm one takes their terms from the memo
+        results.append(measure(
+            'ranking', f'{len(quotes)} quotes by {",".join(keywords)} (cold)',
+            lambda keywords=keywords: QuotesRanker(
+                QuotesGenerator.ranker.analyze, RANKING_MAX_QUOTES).rank(keywords, quotes)[:5],
+            arguments.runs))
+        results.append(measure(
+            'ranking', f'{len(quotes)} quotes by {",".join(keywords)} (warm)',
+            lambda keywords=keywords: warm_ranker.rank(keywords, quotes)[:5],
+            arguments.runs))
+
+    return results
+
+
+def benchmark_cache(arguments: Namespace, redis: Optional[Redis]) -> List[Result]:
+    from quotes_suggestions_service.quotes_generator import QuotesGenerator
+
+    storage = QuotesGenerator.cache_storage
+    storage.storage = redis
+    storage.reset_cache()
+
+    quotes = load_quotes()
+    keys = tuple(range(CACHE_KEYS))
+    for key in keys:
+        storage.set_cache(key, quotes)
+
+    return [
+        measure(
+            'cache', f'set {len(quotes)} quotes', lambda: storage.set_cache(0, quotes),
+            arguments.runs, arguments.concurrency),
+        measure(
+            'cache', f'get {len(quotes)} quotes', lambda: storage.get_cache(0),
+            arguments.runs, arguments.concurrency),
+        measure(
+            'cache', 'get a page of 5 quotes', lambda: storage.get_cache(0, 5, 0),
+            arguments.runs, arguments.concurrency),
+        measure(
+            'cache', f'get {len(keys)} keys in one round trip',
+            lambda: storage.get_many_with_stale_keys(keys),
+            arguments.runs, arguments.concurrency),
+    ]
+
+
+def benchmark_e2e(arguments: Namespace, redis: Optional[Redis]) -> List[Result]:
+    from quotes_suggestions_service import app
+    from quotes_suggestions_service.quotes_generator import QuotesGenerator
+    from quotes_suggestions_service.utils.local_cache import LocalQuotesCache
+
+    QuotesGenerator.cache_storage.storage = redis
+    # Requests are answered by the upstreams only, background work would skew the latencies
+    QuotesGenerator.corpus = None
+    QuotesGenerator.hot_queries = None
+
+    urls = [f'/suggestions?{urlencode(query)}' for query in E2E_QUERIES]
+    requests = cycle(urls)
+    clients = local()
+
+    def get(url: Optional[str] = None):
+        if not hasattr(clients, 'client'):
+            clients.client = app.test_client()
+
+        url = url or next(requests)
+        response = clients.client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} has failed with {response.status_code}: {response.data}')
+
+    def flush():
+        QuotesGenerator.cache_storage.reset_cache()
+        QuotesGenerator.local_cache.clear()
+
+    local_cache = QuotesGenerator.local_cache
+    results = []
+
+    with StandInServer(arguments.latency / 1000, arguments.jitter / 1000) as server, \
+            use_stand_in(server.url):
+        # Cold requests are made one by one, every one of them starts with empty caches
+        results.append(measure('e2e', 'cold', get, arguments.requests, prepare=flush))
+        upstream_requests = server.requests
+
+        for url in urls:
+            get(url)
+
+        # The in-process cache keeps nothing, so every request reads Redis
+        QuotesGenerator.local_cache = LocalQuotesCache(max_quotes=0, ttl=0)
+        results.append(measure(
+            'e2e', 'warm (Redis)', get, arguments.requests, arguments.concurrency))
+
+        QuotesGenerator.local_cache = local_cache
+        for url in urls:
+            get(url)
+        results.append(measure(
+            'e2e', 'warm (in-process cache)', get, arguments.requests, arguments.concurrency))
+
+    print(f'e2e: {upstream_requests / arguments.requests:.1f} upstream requests '
+          f'per cold request, {arguments.latency:g} ms latency each')
+
+    return results
+
+
+BENCHMARKS = {
+    'parsing': benchmark_parsing,
+    'ranking': benchmark_ranking,
+    'cache': benchmark_cache,
+    'e2e': benchmark_e2e,
+}
+REDIS_SECTIONS = ('cache', 'e2e')
+
+
+def get_redis(url: Optional[str]) -> Tuple[Optional[Redis], str]:
+    """
+    :return: (client or None, description of the storage)
+    """
+    if url is not None:
+        return Redis.from_url(url), f'Redis at {url}'
+
+    try:
+        import fakeredis
+    except ImportError:
+        return None, 'neither --redis nor fakeredis'
+
+    return fakeredis.FakeRedis(), 'fakeredis'
+
+
+def run(arguments: Namespace) -> List[Result]:
+    redis, storage = get_redis(arguments.redis)
+    print(f'Cache storage: {storage}')
+    results = []
+
+    for section in arguments.only or SECTIONS:
+        if section in REDIS_SECTIONS and redis is None:
+            print(f'{section}: skipped, {storage}')
+            continue
+
+        results.extend(BENCHMARKS[section](arguments, redis))
+
+    return results
+
+
+def print_results(results: Iterable[Result]):
+    print(f'{"case":60} {"runs":>6} {"per s":>10} {"p50 ms":>10} {"p99 ms":>10}')
+    for result in results:
+        summary = result.summary()
+        print(f'{result.section + ": " + result.case:60} {summary["runs"]:6} '
+              f'{summary["throughput"]:10.1f} {summary["p50_ms"]:10.3f} {summary["p99_ms"]:10.3f}')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=SECTIONS, help='sections to run')
+    parser.add_argument('--runs', type=int, default=50, help='calls per micro-benchmark case')
+    parser.add_argument('--requests', type=int, default=50, help='requests per end-to-end case')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads of warm cases')
+    parser.add_argument('--latency', type=float, default=50, help='of the upstreams, in ms')
+    parser.add_argument('--jitter', type=float, default=10, help='of the upstreams, in ms')
+    parser.add_argument('--redis', help='URL of a Redis database, it is flushed')
+    parser.add_argument('--json', type=Path, help='file to write the results to')
+    arguments = parser.parse_args()
+
+    results = run(arguments)
+    print_results(results)
+
+    if arguments.json is not None:
+        arguments.json.write_text(json.dumps(
+            {
+                'arguments': {
+                    name: value for name, value in vars(arguments).items()
+                    if name not in ('json', 'redis')
+                },
+                'results': [result.summary() for result in results],
+            },
+            indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Parse time of WikiQuote pages: `python -m benchmarks.wikiquote_parser`.
+Pages are the test fixtures repeated to the size of a large author page
+"""
+from pathlib import Path
+from timeit import repeat
+
+from quotes_suggestions_service.clients.wikiquote.parsers import LxmlQuotesParser, SoupQuotesParser
+
+
+FIXTURES = Path(__file__).parent.parent / 'tests' / 'fixtures' / 'wikiquote'
+PAGES = ('john_lennon', 'mark_twain')
+COPIES = 20  # quote blocks per page
+REPEATS = 20
+
+
+def _enlarge(raw_response: str) -> str:
+    """
+    Repeats the quotes block, so the page has as many quotes as popular authors do
+    """
+    start = raw_response.index('<h2><span class="mw-headline" id="Quotes">')
+    end = raw_response.index('<h2>', start + 1)
+    block = raw_response[raw_response.index('</h2>', start) + len('</h2>'):end]
+
+    return raw_response[:end] + block * COPIES + raw_response[end:]
+
+
+if __name__ == '__main__':
+    print(f'{COPIES} copies of the quotes block, best of {REPEATS} runs')
+
+    for page in PAGES:
+        raw_response = _enlarge((FIXTURES / f'{page}.html').read_text())
+
+        for parser in (SoupQuotesParser(), LxmlQuotesParser()):
+            best = min(repeat(
+                lambda: parser.parse('Author', raw_response), number=1, repeat=REPEATS))
+            print(f'{page:15} {type(parser).__name__:20} {best * 1000:8.2f} ms  '
+                  f'{len(raw_response) / 1024:6.1f} KiB')
@@ -3,6 +3,15 @@
 if [[ "${1}" = "run" ]]
 then
     exec flask run --host=0.0.0.0 --port="${PORT}"
+elif [[ "${1}" = "run-asgi" ]]
+then
+    exec uvicorn quotes_suggestions_service.asgi:app --host=0.0.0.0 --port="${PORT}"
+elif [[ "${1}" = "run-gunicorn" ]]
+then
+    exec gunicorn -c gunicorn.conf.py quotes_suggestions_service:app
+elif [[ "${1}" = "warmup" ]]
+then
+    exec python -m quotes_suggestions_service.warmup "${@:2}"
 else
     exec "$@"
 fi
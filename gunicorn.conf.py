@@ -0,0 +1,31 @@
+"""
+Pre-fork server settings: `gunicorn -c gunicorn.conf.py quotes_suggestions_service:app`
+"""
+from os import environ
+
+
+bind = f'0.0.0.0:{environ.get("PORT", "5000")}'
+workers = int(environ.get('GUNICORN_WORKERS', 2))
+threads = int(environ.get('GUNICORN_THREADS', 8))
+# The app and its models are loaded once in the master and shared by the forked workers
+preload_app = True
+
+
+def on_starting(server):
+    from quotes_suggestions_service.startup import preload
+
+    preload()
+
+
+def post_fork(server, worker):
+    from quotes_suggestions_service.utils.process_pool import process_pool
+
+    # Every worker has its own processes for parsing and NER, if they are enabled,
+    # they are spawned and load the models before the worker takes requests
+    process_pool.start()
+
+
+def worker_exit(server, worker):
+    from quotes_suggestions_service.utils.process_pool import process_pool
+
+    process_pool.shutdown()
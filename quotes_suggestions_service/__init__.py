@@ -1,8 +1,20 @@
-from flask import Flask, jsonify, request, make_response
+from dataclasses import asdict
+
+from flask import (
+    Flask, Response, abort, g, jsonify, request, make_response, stream_with_context,
+)
 
 from quotes_suggestions_service.clients import EN_QUOTES_API_CLIENTS
 from quotes_suggestions_service.clients.dtos import Quote
-from quotes_suggestions_service.quotes_generator import QuotesGenerator
+from quotes_suggestions_service.quotes_generator import QuotesGenerator, QuotesFetchInProgressError
+from quotes_suggestions_service.setting import METRICS_ENABLED, SUGGESTIONS_BATCH_MAX_QUERIES
+from quotes_suggestions_service.utils.enums import ResponseMode
+from quotes_suggestions_service.utils.helpers import (
+    SERVER_TIMING_REQUEST_HEADER, STREAM_CONTENT_TYPES, encode_stream_end, encode_stream_items,
+    is_server_timing_requested, parse_batch_suggestions_arguments, parse_response_mode,
+    parse_suggestions_arguments,
+)
+from quotes_suggestions_service.utils.metrics import PROMETHEUS_CONTENT_TYPE, RequestTimings
 
 
 app = Flask(__name__, static_url_path="")
@@ -19,21 +31,72 @@ def not_found(error):
     return make_response(jsonify({'error': error.args}), 400)
 
 
+@app.errorhandler(QuotesFetchInProgressError)
+def fetch_in_progress(error):
+    return make_response(
+        jsonify({'error': 'Quotes are being fetched by another request, retry later'}), 503)
+
+
+@app.before_request
+def start_server_timing():
+    if is_server_timing_requested(request.headers.get(SERVER_TIMING_REQUEST_HEADER)):
+        g.request_timings = RequestTimings().activate()
+
+
+@app.after_request
+def add_server_timing(response: Response) -> Response:
+    # Streamed responses get the timings of the work done before the first quotes only
+    if 'request_timings' in g:
+        response.headers['Server-Timing'] = g.request_timings.get_header()
+
+    return response
+
+
+@app.teardown_request
+def stop_server_timing(error):
+    if 'request_timings' in g:
+        g.request_timings.deactivate()
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+
+    return Response(quotes_generator.render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.route('/suggestions', methods=['GET'])
 def get_suggestions():
-    keywords = request.args.get('keywords')
-    authors = request.args.get('authors')
-    limit = int(request.args.get('limit', 5))
-    offset = int(request.args.get('offset', 0))
-
-    keywords = tuple(keyword.strip() for keyword in keywords.split(',')) \
-        if keywords is not None else ()
-    authors = tuple(keyword.strip() for keyword in authors.split(',')) \
-        if authors is not None else ()
+    authors, keywords, limit, offset = parse_suggestions_arguments(request.args)
+    mode = parse_response_mode(request.args)
 
-    if len(authors) == 0 and len(keywords) == 0:
-        raise ValueError('"authors" or "keywords" URI-parameters should be passed')
+    if mode in STREAM_CONTENT_TYPES:
+        return Response(
+            stream_with_context(_stream_quotes(mode, authors, keywords, limit)),
+            content_type=STREAM_CONTENT_TYPES[mode],
+            headers={'Cache-Control': 'no-cache'})
 
-    response = quotes_generator.get_quotes(authors, keywords, limit, offset)
+    if mode is ResponseMode.EARLY:
+        response = quotes_generator.get_quotes_early(authors, keywords, limit, offset)
+    else:
+        response = quotes_generator.get_quotes(authors, keywords, limit, offset)
 
     return jsonify(response)
+
+
+@app.route('/suggestions/batch', methods=['POST'])
+def get_batch_suggestions():
+    queries = parse_batch_suggestions_arguments(
+        request.get_json(force=True), SUGGESTIONS_BATCH_MAX_QUERIES)
+
+    results = quotes_generator.get_quotes_many([query[1:] for query in queries])
+
+    return jsonify({'results': {query[0]: quotes for query, quotes in zip(queries, results)}})
+
+
+def _stream_quotes(mode: ResponseMode, authors, keywords, limit: int):
+    for quotes in quotes_generator.iter_quotes(authors, keywords, limit):
+        yield encode_stream_items(mode, (asdict(quote) for quote in quotes))
+
+    yield encode_stream_end(mode)
@@ -0,0 +1,222 @@
+"""
+ASGI entry point of the service: `uvicorn quotes_suggestions_service.asgi:app`.
+Serves `/suggestions` on the event loop, so cold requests don't pin a thread each
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import asdict
+import asyncio
+from json import dumps, loads
+from typing import Any, AsyncIterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+from weakref import WeakSet
+
+from quotes_suggestions_service.setting import (
+    METRICS_ENABLED, PRELOAD_ON_STARTUP, SERVER_TIMING, SUGGESTIONS_BATCH_MAX_QUERIES,
+)
+from quotes_suggestions_service.clients.base import QuotesApiClient
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.quotes_generator import QuotesGenerator, QuotesFetchInProgressError
+from quotes_suggestions_service.startup import preload
+from quotes_suggestions_service.utils.enums import ResponseMode
+from quotes_suggestions_service.utils.helpers import (
+    SERVER_TIMING_REQUEST_HEADER, STREAM_CONTENT_TYPES, encode_stream_end, encode_stream_items,
+    is_server_timing_requested, parse_batch_suggestions_arguments, parse_response_mode,
+    parse_suggestions_arguments,
+)
+from quotes_suggestions_service.utils.metrics import PROMETHEUS_CONTENT_TYPE, RequestTimings
+from quotes_suggestions_service.utils.process_pool import process_pool
+
+
+quotes_generator = QuotesGenerator()
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class QuotesStream(NamedTuple):
+
+    mode: ResponseMode
+    batches: AsyncIterator[Tuple[Quote, ...]]
+
+
+class TextBody(NamedTuple):
+
+    content_type: str
+    text: str
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _handle_lifespan(receive, send)
+    elif scope['type'] == 'http':
+        timings = _start_server_timing(scope)
+        try:
+            status, body = await _handle_http(scope, receive)
+
+            headers = []
+            if timings is not None:
+                headers.append((b'server-timing', timings.get_header().encode()))
+
+            if isinstance(body, QuotesStream):
+                await _send_stream(send, body, headers)
+            elif isinstance(body, TextBody):
+                await _send_body(send, status, body.content_type, body.text.encode(), headers)
+            else:
+                await _send_json(send, status, body, headers)
+        finally:
+            if timings is not None:
+                timings.deactivate()
+
+
+async def _handle_http(scope, receive) -> Tuple[int, Any]:
+    if scope['path'] == '/metrics' and scope['method'] == 'GET' and METRICS_ENABLED:
+        return 200, TextBody(PROMETHEUS_CONTENT_TYPE, quotes_generator.render_metrics())
+    if scope['path'] == '/suggestions/batch' and scope['method'] == 'POST':
+        return await _handle_batch(await _read_body(receive))
+    if scope['path'] != '/suggestions' or scope['method'] != 'GET':
+        return 404, {'error': 'Not found'}
+
+    arguments = {
+        name: values[0]
+        for name, values in parse_qs(scope['query_string'].decode('latin-1')).items()
+    }
+
+    try:
+        authors, keywords, limit, offset = parse_suggestions_arguments(arguments)
+        mode = parse_response_mode(arguments)
+    except ValueError as error:
+        return 400, {'error': error.args}
+
+    if mode in STREAM_CONTENT_TYPES:
+        return 200, QuotesStream(mode, quotes_generator.aiter_quotes(authors, keywords, limit))
+
+    try:
+        if mode is ResponseMode.EARLY:
+            response = await quotes_generator.aget_quotes_early(authors, keywords, limit, offset)
+        else:
+            response = await quotes_generator.aget_quotes(authors, keywords, limit, offset)
+    except QuotesFetchInProgressError:
+        return 503, {'error': 'Quotes are being fetched by another request, retry later'}
+
+    return 200, [asdict(quote) for quote in response]
+
+
+async def _handle_batch(body: bytes) -> Tuple[int, Any]:
+    try:
+        queries = parse_batch_suggestions_arguments(loads(body), SUGGESTIONS_BATCH_MAX_QUERIES)
+    except ValueError as error:
+        return 400, {'error': error.args}
+
+    results = await quotes_generator.aget_quotes_many([query[1:] for query in queries])
+
+    return 200, {
+        'results': {
+            query[0]: [asdict(quote) for quote in quotes]
+            for query, quotes in zip(queries, results)
+        },
+    }
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+    return body
+
+
+async def _handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+            if SERVER_TIMING:
+                _use_context_executor()
+            if PRELOAD_ON_STARTUP:
+                await asyncio.get_running_loop().run_in_executor(None, preload)
+            # Worker processes load the models before the first request, if they are enabled
+            await asyncio.get_running_loop().run_in_executor(None, process_pool.start)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await QuotesApiClient.async_transport.close()
+            await asyncio.get_running_loop().run_in_executor(None, process_pool.shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def _start_server_timing(scope) -> Optional[RequestTimings]:
+    """
+    Activates timings of the request if it has asked for the `Server-Timing` header
+    """
+    header_name = SERVER_TIMING_REQUEST_HEADER.lower().encode()
+    header = next((value for name, value in scope['headers'] if name == header_name), None)
+    if header is None or not is_server_timing_requested(header.decode('latin-1')):
+        return None
+
+    _use_context_executor()
+
+    return RequestTimings().activate()
+
+
+class _ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    Runs calls in copies of the contexts submitting them, as `asyncio` tasks are run,
+    so spans of the calls made by `run_in_executor` reach the timings of the request
+    """
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return super().submit(copy_context().run, fn, *args, **kwargs)
+
+
+_loops_with_context_executor: 'WeakSet[asyncio.AbstractEventLoop]' = WeakSet()
+
+
+def _use_context_executor():
+    loop = asyncio.get_running_loop()
+    if loop not in _loops_with_context_executor:
+        loop.set_default_executor(_ContextThreadPoolExecutor())
+        _loops_with_context_executor.add(loop)
+
+
+async def _send_json(send, status: int, body: Any, headers: Headers = ()):
+    # Keys are sorted as Flask `jsonify` does, so both entry points return the same payload
+    encoded_body = dumps(body, sort_keys=True).encode()
+
+    await _send_body(send, status, 'application/json', encoded_body, headers)
+
+
+async def _send_body(send, status: int, content_type: str, body: bytes, headers: Headers = ()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode()),
+            (b'content-length', str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_stream(send, stream: QuotesStream, headers: Headers = ()):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', STREAM_CONTENT_TYPES[stream.mode].encode()),
+            (b'cache-control', b'no-cache'),
+            *headers,
+        ],
+    })
+
+    async for quotes in stream.batches:
+        await send({
+            'type': 'http.response.body',
+            'body': encode_stream_items(stream.mode, (asdict(quote) for quote in quotes)),
+            'more_body': True,
+        })
+
+    await send({'type': 'http.response.body', 'body': encode_stream_end(stream.mode)})
@@ -1,11 +1,83 @@
-from typing import Iterable, Tuple
+import asyncio
+from functools import partial
+from typing import AsyncIterator, Iterable, Iterator, Tuple
+
+from quotes_suggestions_service.setting import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF_FACTOR, HTTP_POOL_MAXSIZE,
+)
 
 from .dtos import Quote
+from .transport import AsyncHttpTransport, HttpTransport
+
+
+SubQuery = Tuple[Tuple[str, ...], Tuple[str, ...]]  # (authors, keywords)
 
 
 class QuotesApiClient:
     """
     Interface for api clients
     """
+
+    # Identifies the source in cache keys of its results
+    name: str = None
+
+    # Shared by all clients, so connections to each host are kept alive between requests
+    transport = HttpTransport(
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        retries=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        pool_maxsize=HTTP_POOL_MAXSIZE)
+    async_transport = AsyncHttpTransport(
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        retries=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        pool_maxsize=HTTP_POOL_MAXSIZE)
+
     def get_quotes(self, authors: Iterable[str], keywords: Iterable[str]) -> Tuple[Quote, ...]:
         raise NotImplemented()
+
+    async def aget_quotes(
+            self, authors: Iterable[str], keywords: Iterable[str]) -> Tuple[Quote, ...]:
+        """
+        Asynchronous variant of `get_quotes`.
+        Clients without native async I/O run `get_quotes` in the default executor of the loop
+        """
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            None, partial(self.get_quotes, authors=authors, keywords=keywords))
+
+    def iter_quotes(
+            self, authors: Iterable[str], keywords: Iterable[str]) -> Iterator[Tuple[Quote, ...]]:
+        """
+        Streaming variant of `get_quotes`, quotes are yielded in batches as soon as they're parsed.
+        Clients without pagination yield all the quotes at once
+        """
+        yield tuple(self.get_quotes(authors=authors, keywords=keywords))
+
+    async def aiter_quotes(
+            self,
+            authors: Iterable[str],
+            keywords: Iterable[str]) -> AsyncIterator[Tuple[Quote, ...]]:
+        """
+        Asynchronous variant of `iter_quotes`
+        """
+        yield tuple(await self.aget_quotes(authors=authors, keywords=keywords))
+
+    def prepare_query(self, authors: Tuple[str], keywords: Tuple[str]):
+        """
+        Hook called once per query before it's split and fanned out,
+        so clients can do batched work shared by all the sub-queries
+        """
+
+    def split_query(self, authors: Tuple[str], keywords: Tuple[str]) -> Tuple[SubQuery, ...]:
+        """
+        Splits query into independent sub-queries which can be fetched concurrently.
+        Authors take precedence over keywords, as in `get_quotes` implementations
+        """
+        if len(authors) != 0:
+            return tuple(((author, ), ()) for author in authors)
+
+        return tuple(((), (keyword, )) for keyword in keywords)
@@ -1,11 +1,18 @@
-from typing import Tuple, Set
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Tuple, Set
+from weakref import WeakKeyDictionary
 
-import requests
-from requests import Response
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
+from quotes_suggestions_service.setting import (
+    BRAINYQUOTE_PAGES_CONCURRENCY, BRAINYQUOTE_MAX_PAGES,
+)
 from quotes_suggestions_service.utils import NAME_VALIDATORS_MAPPING
 from quotes_suggestions_service.utils.enums import Localization
+from quotes_suggestions_service.utils.metrics import metrics
+from quotes_suggestions_service.utils.process_pool import process_pool
 
 from ..dtos import Quote
 from ..base import QuotesApiClient
@@ -16,80 +23,203 @@ class BrainyQuoteClient(QuotesApiClient):
     Single-language (EN) client
     """
 
+    name = 'brainyquote'
     api_url = 'https://www.brainyquote.com'
     topics_url = f'{api_url}/topics'
     authors_url = f'{api_url}/authors'
     validator = NAME_VALIDATORS_MAPPING[Localization.ENGLISH]
+    max_pages = BRAINYQUOTE_MAX_PAGES
+    # Shared by all requests, so it caps the number of pages in flight to brainyquote.com
+    pages_executor = ThreadPoolExecutor(
+        max_workers=BRAINYQUOTE_PAGES_CONCURRENCY, thread_name_prefix='brainyquote-pages')
+    _pages_semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = WeakKeyDictionary()
 
     def get_quotes(self, authors: Tuple[str], keywords: Tuple[str]) -> Set[Quote]:
+        quotes = set(
+            quote
+            for page_quotes in self.iter_quotes(authors, keywords)
+            for quote in page_quotes)
+
+        return quotes
+
+    def iter_quotes(
+            self, authors: Tuple[str], keywords: Tuple[str]) -> Iterator[Tuple[Quote, ...]]:
+        # Quotes of every page are yielded as soon as it's parsed
+        for url in self._get_urls(authors, keywords):
+            yield from self._iter_url_quotes(url)
+
+    async def aget_quotes(self, authors: Tuple[str], keywords: Tuple[str]) -> Set[Quote]:
+        quotes = set()
+        async for page_quotes in self.aiter_quotes(authors, keywords):
+            quotes.update(page_quotes)
+
+        return quotes
+
+    async def aiter_quotes(
+            self, authors: Tuple[str], keywords: Tuple[str]) -> AsyncIterator[Tuple[Quote, ...]]:
+        loop = asyncio.get_running_loop()
+        # Keywords NER is CPU-bound, so it's kept off the event loop as HTML parsing is
+        urls = await loop.run_in_executor(None, self._get_urls, authors, keywords)
+
+        # Pages of all the urls are downloaded concurrently
+        async for page_quotes in _merge(*(self._aiter_url_quotes(url) for url in urls)):
+            yield page_quotes
+
+    def prepare_query(self, authors: Tuple[str], keywords: Tuple[str]):
+        # Keywords are checked for persons in one NER batch, sub-queries hit the memo then
+        if len(authors) == 0 and len(keywords) != 0:
+            self.validator.is_person_many(keywords)
+
+    def _get_urls(self, authors: Tuple[str], keywords: Tuple[str]) -> Tuple[str, ...]:
         if len(authors) != 0:
-            quotes = set(
-                quote
-                for author in authors
-                for quote in self._get_quotes_by_author(author))
+            urls = tuple(self._get_author_url(author) for author in authors)
         elif len(authors) == 0 and len(keywords) != 0:
-            quotes = set(
-                quote
-                for keyword in keywords
-                for quote in self._get_keyword_quotes(keyword))
+            urls = tuple(self._get_keyword_url(keyword) for keyword in keywords)
         else:
             raise ValueError("At least one of argument should be passed")
 
-        return quotes
+        return urls
 
-    def _get_quotes_by_author(self, author: str) -> Tuple[Quote, ...]:
+    def _get_author_url(self, author: str) -> str:
         prepared_name = '-'.join(author.lower().split())
-        pages = self._get_paginated_pages(f'{self.authors_url}/{prepared_name}')
 
-        return self._parse_quotes_from_pages(pages)
+        return f'{self.authors_url}/{prepared_name}'
 
-    def _get_keyword_quotes(self, keyword: str) -> Tuple[Quote, ...]:
+    def _get_keyword_url(self, keyword: str) -> str:
         if self.validator.is_person(keyword):
-            quotes = self._get_quotes_about_person(keyword)
+            url = self._get_person_topic_url(keyword)
         else:
-            quotes = self._get_quotes_by_keyword(keyword)
+            url = self._get_topic_url(keyword)
 
-        return quotes
+        return url
 
-    def _get_quotes_about_person(self, person_name: str) -> Tuple[Quote, ...]:
+    def _get_person_topic_url(self, person_name: str) -> str:
         person_name = person_name.lower().replace('about', '').split()
         prepared_name = '-'.join(person_name)
-        pages = self._get_paginated_pages(f'{self.topics_url}/{prepared_name}')
 
-        return self._parse_quotes_from_pages(pages)
+        return f'{self.topics_url}/{prepared_name}'
 
-    def _get_quotes_by_keyword(self, keyword: str) -> Tuple[Quote, ...]:
+    def _get_topic_url(self, keyword: str) -> str:
         prepared_keyword = '-'.join(keyword.lower().split())
-        pages = self._get_paginated_pages(f'{self.topics_url}/{prepared_keyword}')
 
-        return self._parse_quotes_from_pages(pages)
+        return f'{self.topics_url}/{prepared_keyword}'
+
+    def _iter_url_quotes(self, url: str) -> Iterator[Tuple[Quote, ...]]:
+        """
+        Yields quotes of the first page and then of the rest ones in order of download.
+        Only the pagination of the first page is read before the rest ones are requested,
+        so every page is parsed while the others are still in flight
+        """
+        first_page = self.transport.get(url).text
+        rest_pages = [
+            # The copied context carries the fetch deadline of the calling task
+            self.pages_executor.submit(
+                copy_context().run, self.transport.get, self.api_url + path)
+            for path in self._get_pages_paths(first_page)
+        ]
+
+        try:
+            yield process_pool.run(
+                'parse.brainyquote', self._parse_quotes_from_pages, (first_page, ))
+
+            for page in as_completed(rest_pages):
+                yield process_pool.run(
+                    'parse.brainyquote', self._parse_quotes_from_pages, (page.result().text, ))
+        finally:
+            for page in rest_pages:
+                page.cancel()
+
+    async def _aiter_url_quotes(self, url: str) -> AsyncIterator[Tuple[Quote, ...]]:
+        """
+        Asynchronous variant of `_iter_url_quotes`: pages are parsed in the default executor
+        or in the worker processes as soon as they are downloaded
+        """
+        first_page = await self._aget_page(url)
+        rest_pages = [
+            asyncio.ensure_future(self._aget_page(self.api_url + path))
+            for path in self._get_pages_paths(first_page)
+        ]
+
+        try:
+            yield await process_pool.arun(
+                'parse.brainyquote', self._parse_quotes_from_pages, (first_page, ))
+
+            for page in asyncio.as_completed(rest_pages):
+                yield await process_pool.arun(
+                    'parse.brainyquote', self._parse_quotes_from_pages, (await page, ))
+        finally:
+            for page in rest_pages:
+                page.cancel()
+
+    async def _aget_page(self, url: str) -> str:
+        async with self._get_pages_semaphore():
+            return await self.async_transport.get_text(url)
+
+    def _get_pages_semaphore(self) -> asyncio.Semaphore:
+        """
+        Asynchronous counterpart of `pages_executor` cap, a semaphore is bound to its event loop
+        """
+        loop = asyncio.get_running_loop()
 
-    def _get_paginated_pages(self, url: str) -> Tuple[Response, ...]:
-        first_page = requests.get(url)
-        # Find all pages links on the first page pagination and exclude `Next` link
-        pagination_tag = BeautifulSoup(first_page.text, 'html.parser') \
-            .find('ul', {'class': 'pagination'})
+        if loop not in self._pages_semaphores:
+            self._pages_semaphores[loop] = asyncio.Semaphore(BRAINYQUOTE_PAGES_CONCURRENCY)
+
+        return self._pages_semaphores[loop]
+
+    def _get_pages_paths(self, first_page: str) -> List[str]:
+        # Find all pages links on the first page pagination and exclude `Next` link.
+        # Only the pagination is built into a tree, so it's cheap enough for the request thread
+        with metrics.span('parse.brainyquote'):
+            pagination_tag = BeautifulSoup(
+                first_page, 'html.parser', parse_only=SoupStrainer('ul', {'class': 'pagination'}),
+            ).find('ul', {'class': 'pagination'})
 
         pages_paths = [
             a['href'] for a in pagination_tag.find_all('a', href=True)
         ] if pagination_tag is not None else []
 
-        rest_pages = (
-            requests.get(self.api_url + path)
-            for path in pages_paths[:-1]  # Without `Next` link
-        )
-
-        return first_page, *rest_pages
+        return pages_paths[:-1][:self.max_pages - 1]  # Without `Next` link
 
     @staticmethod
-    def _parse_quotes_from_pages(pages: Tuple[Response]) -> Tuple[Quote, ...]:
-        raw_quotes_list = [
-            BeautifulSoup(page.text, 'html.parser').find_all('div', {'class': 'clearfix'})
+    def _parse_quotes_from_pages(pages: Iterable[str]) -> Tuple[Quote, ...]:
+        raw_quotes_list = (
+            BeautifulSoup(page, 'html.parser').find_all('div', {'class': 'clearfix'})
             for page in pages
-        ]
+        )
+
+        with metrics.span('parse.brainyquote'):
+            return tuple(
+                Quote(
+                    quote=raw_quote.find('a', {'title': 'view quote'}).text,
+                    author=raw_quote.find('a', {'title': 'view author'}).text)
+                for raw_quotes in raw_quotes_list for raw_quote in raw_quotes)
+
 
-        return tuple(
-            Quote(
-                quote=raw_quote.find('a', {'title': 'view quote'}).text,
-                author=raw_quote.find('a', {'title': 'view author'}).text)
-            for raw_quotes in raw_quotes_list for raw_quote in raw_quotes)
+async def _merge(
+        *iterators: AsyncIterator[Tuple[Quote, ...]]) -> AsyncIterator[Tuple[Quote, ...]]:
+    """
+    Yields items of all the iterators in order of arrival, the first error is raised
+    """
+    queue = asyncio.Queue()
+
+    async def drain(iterator: AsyncIterator[Tuple[Quote, ...]]):
+        try:
+            async for item in iterator:
+                queue.put_nowait(item)
+        except Exception as error:
+            queue.put_nowait(error)
+        else:
+            queue.put_nowait(None)
+
+    tasks = [asyncio.ensure_future(drain(iterator)) for iterator in iterators]
+    try:
+        for _ in tasks:
+            item = await queue.get()
+            while item is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                item = await queue.get()
+    finally:
+        for task in tasks:
+            task.cancel()
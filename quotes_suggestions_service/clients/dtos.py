@@ -1,22 +1,137 @@
+import zlib
 from dataclasses import dataclass
-from typing import Optional
+from struct import Struct
+from typing import Iterable, Optional, Tuple
 
 from quotes_suggestions_service.utils.helpers import return_only_lower_letters
 
 
-@dataclass(frozen=True)
+# Binary format: version byte, flags byte and the payload, optionally zlib-compressed.
+# The payload is (quote length, author length, description length) header of every quote
+# followed by UTF-8 text of all fields. Lengths are in characters,
+# missing description has NO_DESCRIPTION length
+QUOTE_FORMAT_VERSION = 1
+COMPRESSED_FLAG = 0x01
+COMPRESSION_THRESHOLD = 256  # in bytes, smaller payloads are never compressed
+NO_DESCRIPTION = 0xFFFFFFFF
+
+_HEADER = Struct('>BB')
+_QUOTE_HEADER = Struct('>IHI')
+_QUOTES_COUNT = Struct('>I')
+
+
+@dataclass(frozen=True, init=False, eq=False)
 class Quote:
+    """
+    Quotes are identified by the lower letters of the quote and the author,
+    the key is computed once, so sets and dicts of quotes don't normalize the text again
+    """
+
+    __slots__ = ('quote', 'author', 'description', 'key')
 
     quote: str
     author: str
-    description: Optional[str] = None
+    description: Optional[str]
+
+    def __init__(self, quote: str, author: str, description: Optional[str] = None):
+        # The dataclass is frozen, so the fields are set the way its own `__init__` does
+        object.__setattr__(self, 'quote', quote)
+        object.__setattr__(self, 'author', author)
+        object.__setattr__(self, 'description', description)
+        object.__setattr__(self, 'key', return_only_lower_letters((quote + author).lower()))
 
     def __hash__(self):
-        return hash(return_only_lower_letters(self.quote.lower() + self.author.lower()))
+        return hash(self.key)
 
     def __eq__(self, other):
         if isinstance(other, Quote):
-            return self.__hash__() == other.__hash__()
+            return self.key == other.key
+
+        return NotImplemented
+
+    def __reduce__(self):
+        return Quote, (self.quote, self.author, self.description)
+
+    def to_bytes(self, compress: bool = True) -> bytes:
+        return _dump(_pack((self, )), compress)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Quote':
+        return _unpack(_load(data), 1)[0]
+
+
+def quotes_to_bytes(quotes: Iterable[Quote], compress: bool = True) -> bytes:
+    quotes = tuple(quotes)
+
+    return _dump(_QUOTES_COUNT.pack(len(quotes)) + _pack(quotes), compress)
+
+
+def quotes_from_bytes(data: bytes) -> Tuple[Quote, ...]:
+    payload = _load(data)
+    count, = _QUOTES_COUNT.unpack_from(payload, 0)
+
+    return _unpack(payload[_QUOTES_COUNT.size:], count)
+
+
+def _pack(quotes: Tuple[Quote, ...]) -> bytes:
+    """
+    Fields headers go first and the text of all fields follows them,
+    so the whole text is decoded with one call
+    """
+    headers = b''.join(
+        _QUOTE_HEADER.pack(
+            len(quote.quote),
+            len(quote.author),
+            len(quote.description) if quote.description is not None else NO_DESCRIPTION)
+        for quote in quotes)
+    text = ''.join(
+        quote.quote + quote.author + (quote.description or '')
+        for quote in quotes)
+
+    return headers + text.encode()
+
+
+def _unpack(payload: bytes, count: int) -> Tuple[Quote, ...]:
+    headers_size = _QUOTE_HEADER.size * count
+    text = payload[headers_size:].decode()
+
+    quotes = []
+    offset = 0
+    for quote_length, author_length, description_length \
+            in _QUOTE_HEADER.iter_unpack(payload[:headers_size]):
+        quote = text[offset:offset + quote_length]
+        offset += quote_length
+        author = text[offset:offset + author_length]
+        offset += author_length
+
+        description = None
+        if description_length != NO_DESCRIPTION:
+            description = text[offset:offset + description_length]
+            offset += description_length
+
+        quotes.append(Quote(quote=quote, author=author, description=description))
+
+    return tuple(quotes)
+
+
+def _dump(payload: bytes, compress: bool) -> bytes:
+    flags = 0
+
+    if compress and len(payload) >= COMPRESSION_THRESHOLD:
+        compressed_payload = zlib.compress(payload)
+        if len(compressed_payload) < len(payload):
+            payload = compressed_payload
+            flags |= COMPRESSED_FLAG
+
+    return _HEADER.pack(QUOTE_FORMAT_VERSION, flags) + payload
+
+
+def _load(data: bytes) -> bytes:
+    version, flags = _HEADER.unpack_from(data, 0)
+
+    if version != QUOTE_FORMAT_VERSION:
+        raise ValueError(f'Unsupported quote format version {version}')
+
+    payload = data[_HEADER.size:]
 
-    def to_bytes(self):
-        pass
+    return zlib.decompress(payload) if flags & COMPRESSED_FLAG else payload
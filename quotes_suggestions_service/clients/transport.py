@@ -0,0 +1,265 @@
+import asyncio
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+from time import monotonic, perf_counter, sleep
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, TraceConfig
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from quotes_suggestions_service.utils.metrics import metrics
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# `time.monotonic` moment after which the current fetch task mustn't start new HTTP calls
+fetch_deadline: ContextVar[Optional[float]] = ContextVar('fetch_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class TransportStats:
+    """
+    Per-host counters of the connection pools.
+    `requests` counts connection checkouts (including retries),
+    `connections` counts real TCP(+TLS) handshakes, the rest are pool hits
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._requests = defaultdict(int)
+        self._connections = defaultdict(int)
+        self._connect_time = defaultdict(float)  # in seconds
+
+    def record_request(self, host: str):
+        with self._lock:
+            self._requests[host] += 1
+
+    def record_connect(self, host: str, duration: float):
+        with self._lock:
+            self._connections[host] += 1
+            self._connect_time[host] += duration
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                host: {
+                    'requests': requests_count,
+                    'connections': self._connections[host],
+                    'pool_hits': requests_count - self._connections[host],
+                    'connect_time': self._connect_time[host],
+                }
+                for host, requests_count in self._requests.items()
+            }
+
+
+class HostRateLimiter:
+    """
+    Spaces requests to every host at least `1 / rate` seconds apart, callers wait for their turn
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate  # in seconds
+
+        self._lock = Lock()
+        self._next_slots: Dict[str, float] = {}  # `time.monotonic` moments
+
+    def wait(self, host: str):
+        with self._lock:
+            now = monotonic()
+            slot = max(self._next_slots.get(host, now), now)
+            self._next_slots[host] = slot + self.interval
+
+        if slot > now:
+            sleep(slot - now)
+
+
+def _instrumented_pool_classes(stats: TransportStats) -> Dict[str, type]:
+    connection_classes = {
+        'http': HTTPConnection,
+        'https': HTTPSConnection,
+    }
+    pool_classes = {
+        'http': HTTPConnectionPool,
+        'https': HTTPSConnectionPool,
+    }
+    instrumented_pool_classes = {}
+
+    for scheme, pool_class in pool_classes.items():
+        class TimedConnection(connection_classes[scheme]):
+
+            def connect(self):
+                started = perf_counter()
+                super().connect()
+                stats.record_connect(self.host, perf_counter() - started)
+
+        class InstrumentedPool(pool_class):
+
+            ConnectionCls = TimedConnection
+
+            def _get_conn(self, timeout=None):
+                stats.record_request(self.host)
+                return super()._get_conn(timeout)
+
+        instrumented_pool_classes[scheme] = InstrumentedPool
+
+    return instrumented_pool_classes
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+
+    def __init__(self, stats: TransportStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _instrumented_pool_classes(self.stats)
+
+
+class HttpTransport:
+    """
+    Shared HTTP layer for api clients: keep-alive connection pool per host,
+    timeouts and retries with exponential backoff.
+    Requests are rate limited per host, if `rate_limiter` is set, e.g. by bulk jobs
+    """
+
+    rate_limiter: Optional[HostRateLimiter] = None
+
+    def __init__(
+            self,
+            connect_timeout: float,
+            read_timeout: float,
+            retries: int,
+            backoff_factor: float,
+            pool_maxsize: int):
+        self.timeout = (connect_timeout, read_timeout)  # in seconds
+        self.stats = TransportStats()
+        self.session = Session()
+
+        adapter = InstrumentedHTTPAdapter(
+            self.stats,
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url: str, **kwargs) -> Response:
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(urlsplit(url).hostname)
+        kwargs.setdefault('timeout', self._get_timeout())
+
+        with metrics.span('http'):
+            return self.session.get(url, **kwargs)
+
+    def _get_timeout(self) -> Tuple[float, float]:
+        """
+        Transport timeouts shortened to the rest of the current fetch deadline, if it's set
+        """
+        deadline = fetch_deadline.get()
+        if deadline is None:
+            return self.timeout
+
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded('Fetch deadline is exceeded')
+
+        return tuple(min(timeout, remaining) for timeout in self.timeout)
+
+
+class AsyncHttpTransport:
+    """
+    Asynchronous counterpart of `HttpTransport` on top of aiohttp.
+    The session is bound to an event loop, so it's created lazily inside the running one
+    """
+
+    def __init__(
+            self,
+            connect_timeout: float,
+            read_timeout: float,
+            retries: int,
+            backoff_factor: float,
+            pool_maxsize: int):
+        self.timeout = ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self.stats = TransportStats()
+
+        self._session: Optional[ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def get_text(self, url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        return await self._get(url, params, json=False)
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return await self._get(url, params, json=True)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get(self, url: str, params: Optional[Dict[str, Any]], json: bool) -> Any:
+        with metrics.span('http'):
+            return await self._get_with_retries(url, params, json)
+
+    async def _get_with_retries(
+            self, url: str, params: Optional[Dict[str, Any]], json: bool) -> Any:
+        for attempt in range(self.retries + 1):
+            is_last_attempt = attempt == self.retries
+            try:
+                async with self._get_session().get(url, params=params) as response:
+                    if response.status not in RETRY_STATUSES or is_last_attempt:
+                        return await response.json(content_type=None) if json \
+                            else await response.text()
+            except (ClientError, asyncio.TimeoutError):
+                if is_last_attempt:
+                    raise
+
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    def _get_session(self) -> ClientSession:
+        loop = asyncio.get_running_loop()
+
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._session = ClientSession(
+                connector=TCPConnector(limit_per_host=self.pool_maxsize),
+                timeout=self.timeout,
+                trace_configs=[self._get_stats_trace_config()])
+
+        return self._session
+
+    def _get_stats_trace_config(self) -> TraceConfig:
+        """
+        Feeds `stats` the same way the instrumented urllib3 pools of `HttpTransport` do
+        """
+        async def on_request_start(session, context, params):
+            context.host = params.url.host
+            self.stats.record_request(context.host)
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_started = perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            self.stats.record_connect(context.host, perf_counter() - context.connect_started)
+
+        trace_config = TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+
+        return trace_config
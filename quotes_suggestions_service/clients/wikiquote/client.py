@@ -1,18 +1,29 @@
-import re
-from typing import Iterable, Tuple, List, Set, Union
-from urllib.parse import unquote
+import asyncio
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple, Set, Union
 
-import requests
-from bs4 import BeautifulSoup, Tag, NavigableString
+from requests import RequestException
+
+from quotes_suggestions_service.setting import WIKIQUOTE_PARSER
 
 from quotes_suggestions_service.utils import NAME_VALIDATORS_MAPPING
 from quotes_suggestions_service.utils.enums import Localization
+from quotes_suggestions_service.utils.metrics import metrics
+from quotes_suggestions_service.utils.process_pool import process_pool
 
-from .constants import EN_EXTRA_BLOCKS_NAMES, EN_QUOTES_BLOCK_NAME
 from .enums import WikiAction, WikiResponseFormat
 from .dtos import WikiUrlParametersDTO
+from .parsers import LxmlQuotesParser, SoupQuotesParser
 from ..dtos import Quote
-from ..base import QuotesApiClient
+from ..base import QuotesApiClient, SubQuery
+
+
+logger = logging.getLogger(__name__)
+
+TITLES_BATCH_SIZE = 50  # titles limit of `action=query` for ordinary clients
+TITLES_CACHE_SIZE = 10000
 
 
 class WikiQuoteClient(QuotesApiClient):
@@ -22,23 +33,139 @@ class WikiQuoteClient(QuotesApiClient):
 
     LOCALIZATION: Localization = None
     api_url: str = None
+    # BeautifulSoup parser is kept as a fallback, lxml one gives the same quotes faster
+    parser = SoupQuotesParser() if WIKIQUOTE_PARSER == 'soup' else LxmlQuotesParser()
 
     def __init__(self, localization: Localization):
         self.LOCALIZATION = localization
+        self.name = f'wikiquote_{localization.value}'
         self.api_url = f'https://{localization.value}.wikiquote.org/w/api.php'
 
         self.validator = NAME_VALIDATORS_MAPPING[localization]
 
+        self._titles: 'OrderedDict[str, Optional[str]]' = OrderedDict()
+        self._titles_lock = Lock()
+
+    def __reduce__(self):
+        # Pages are parsed by a client of the worker process, see `_parse_responses`
+        return type(self), (self.LOCALIZATION, )
+
     def get_quotes(self, authors: Iterable[str], keywords: Iterable[str]) -> Tuple[Quote, ...]:
         # Wiki client can to search only by name at the moment
-        raw_responses = (
-            self._get_data(
-                WikiUrlParametersDTO(
-                    action=WikiAction.PARSE,
-                    page=author,
-                    format=WikiResponseFormat.JSON))
-            for author in authors)
+        raw_responses = tuple(
+            self._get_data(self._get_url_parameters(title))
+            for title in self._resolve_titles(authors))
+
+        return process_pool.run('parse.wikiquote', self._parse_responses, raw_responses)
 
+    async def aget_quotes(
+            self, authors: Iterable[str], keywords: Iterable[str]) -> Tuple[Quote, ...]:
+        loop = asyncio.get_running_loop()
+
+        titles = await loop.run_in_executor(None, self._resolve_titles, tuple(authors))
+        raw_responses = await asyncio.gather(
+            *(self._aget_data(self._get_url_parameters(title)) for title in titles))
+
+        # HTML parsing and NER are CPU-bound, so they are kept off the event loop
+        return await process_pool.arun('parse.wikiquote', self._parse_responses, raw_responses)
+
+    def prepare_query(self, authors: Tuple[str], keywords: Tuple[str]):
+        # Titles of all authors are resolved in batches, sub-queries take them from the memo.
+        # Sub-queries of the authors, which aren't resolved, request them as they are
+        self._resolve_titles(authors)
+
+    def split_query(self, authors: Tuple[str], keywords: Tuple[str]) -> Tuple[SubQuery, ...]:
+        # Keywords are ignored, see `get_quotes`
+        return tuple(((author, ), ()) for author in authors)
+
+    @staticmethod
+    def _get_url_parameters(title: str) -> WikiUrlParametersDTO:
+        # Only the rendered text is requested, without the parts quotes are never taken from
+        return WikiUrlParametersDTO(
+            action=WikiAction.PARSE,
+            page=title,
+            format=WikiResponseFormat.JSON,
+            prop='text',
+            redirects=1,
+            disablelimitreport=1,
+            disableeditsection=1,
+            disabletoc=1)
+
+    def _resolve_titles(self, authors: Iterable[str]) -> Tuple[str, ...]:
+        """
+        Resolves authors to titles of existing pages, following redirects on the server.
+        Unknown authors are resolved with one `action=query` call per `TITLES_BATCH_SIZE` of them,
+        authors without a page are left out. A single unknown author is left as it is:
+        `action=parse` follows redirects itself, the query would only add a round trip.
+        So are the authors of a failed query
+        """
+        authors = tuple(authors)
+
+        with self._titles_lock:
+            missing_authors = tuple(
+                author for author in dict.fromkeys(authors) if author not in self._titles)
+        if len(missing_authors) == 1:
+            missing_authors = ()
+
+        for start in range(0, len(missing_authors), TITLES_BATCH_SIZE):
+            batch = missing_authors[start:start + TITLES_BATCH_SIZE]
+            try:
+                decoded_response = self.transport.get(
+                    self.api_url, params=self._get_titles_url_parameters(batch).mapping()).json()
+            except (RequestException, ValueError):
+                logger.warning('Titles of %d authors are not resolved', len(batch), exc_info=True)
+                continue
+            titles = self._get_resolved_titles(batch, decoded_response)
+
+            with self._titles_lock:
+                self._titles.update(titles)
+                while len(self._titles) > TITLES_CACHE_SIZE:
+                    self._titles.popitem(last=False)
+
+        with self._titles_lock:
+            # Authors evicted in the meantime are requested as they are
+            titles = tuple(self._titles.get(author, author) for author in authors)
+
+        return tuple(title for title in titles if title is not None)
+
+    @staticmethod
+    def _get_titles_url_parameters(authors: Tuple[str, ...]) -> WikiUrlParametersDTO:
+        return WikiUrlParametersDTO(
+            action=WikiAction.QUERY,
+            titles='|'.join(authors),
+            format=WikiResponseFormat.JSON,
+            redirects=1)
+
+    def _get_resolved_titles(
+            self, authors: Tuple[str, ...], response) -> Dict[str, Optional[str]]:
+        """
+        :return: {author: title of the page or None if there is no page}
+        """
+        if self._is_error(response):
+            # Titles are left unresolved, `action=parse` reports missing pages itself
+            return {author: author for author in authors}
+
+        query = response.get('query', {})
+        normalized = {item['from']: item['to'] for item in query.get('normalized', ())}
+        redirects = {item['from']: item['to'] for item in query.get('redirects', ())}
+        existing_titles = {
+            page['title']
+            for page in query.get('pages', {}).values()
+            if 'missing' not in page and 'invalid' not in page
+        }
+
+        titles = {}
+        for author in authors:
+            title = normalized.get(author, author)
+            title = redirects.get(title, title)
+            titles[author] = title if title in existing_titles else None
+
+        return titles
+
+    def _parse_responses(
+            self,
+            raw_responses: Iterable[Tuple[Union[str, None], Union[str, None]]]) \
+            -> Tuple[Quote, ...]:
         quotes = tuple(
             quote
             for title, page in raw_responses
@@ -55,29 +182,28 @@ class WikiQuoteClient(QuotesApiClient):
         """
         :return: (page title, raw page data)
         """
-        decoded_response = requests.get(
+        decoded_response = self.transport.get(
             self.api_url, params=url_parameters.mapping()).json()
 
         if self._is_error(decoded_response):
             return None, None
 
-        if self._is_redirect(decoded_response):
-            redirect_page_name = BeautifulSoup(
-                decoded_response['parse']['text']['*'], features="html.parser") \
-                .find('a') \
-                .get('href') \
-                .split('/')[-1]
+        return decoded_response['parse']['title'], decoded_response['parse']['text']['*']
 
-            url_parameters.page = unquote(redirect_page_name)
-            decoded_response = requests.get(
-                self.api_url, params=url_parameters.mapping()).json()
+    async def _aget_data(
+            self,
+            url_parameters: WikiUrlParametersDTO) \
+            -> Tuple[Union[str, None], Union[str, None]]:
+        """
+        Asynchronous variant of `_get_data`
+        """
+        decoded_response = await self.async_transport.get_json(
+            self.api_url, params=url_parameters.mapping())
 
-        return decoded_response['parse']['title'], decoded_response['parse']['text']['*']
+        if self._is_error(decoded_response):
+            return None, None
 
-    @staticmethod
-    def _is_redirect(response) -> bool:
-        if isinstance(response, dict):
-            return "redirectMsg" in response['parse']['text']['*']
+        return decoded_response['parse']['title'], decoded_response['parse']['text']['*']
 
     @staticmethod
     def _is_error(response) -> bool:
@@ -88,129 +214,5 @@ class WikiQuoteClient(QuotesApiClient):
         if not self.validator.is_person(title):
             return set()
 
-        soup = BeautifulSoup(raw_response, 'html.parser') \
-            .find('div', {'class': 'mw-parser-output'})
-
-        # Remove links
-        for a in soup.find_all('a', href=True):
-            if bool(re.match(r'\[\d*]', str(a.string))):
-                a.extract()
-            elif a.string is not None:
-                a.insert_after(a.string)
-            a.extract()
-        [sup.extract() for sup in soup.find_all('sup')]
-
-        # Some quotes are marked as <div class="poem">, it's make sense to unpack them here
-        poem_class_quotes = self._parse_page_with_poem_class_tags(title, soup)
-        li_tags_quotes = self._parse_page_with_li_tags(title, soup)
-
-        quotes = {*li_tags_quotes, *poem_class_quotes}
-
-        return quotes
-
-    def _parse_page_with_li_tags(self, page_title: str, soup: BeautifulSoup) -> List[Quote]:
-        # Remove extra highlighted blocks like Disputed, Misattributed..
-        for block_name in EN_EXTRA_BLOCKS_NAMES:
-            excess_block = soup.find(text=block_name)
-            if excess_block is not None:
-                excess_block.find_parent('div').extract()
-
-        # Search only necessary blocks
-        raw_quotes = []
-        h2 = soup.find('span', text=re.compile(EN_QUOTES_BLOCK_NAME)).parent
-        tags = h2.find_next_siblings()
-        for tag in tags:
-            if tag.name == 'h2':
-                break
-            # Exclude h3, h4, dl, p tags
-            if tag.name not in ('h3', 'h4', 'dl', 'p', 'div'):
-                raw_quotes.append(tag)
-
-        quotes = []
-        for num, tag in enumerate(raw_quotes):
-            quote = None
-            description = None
-            # Replace <br> tags to \n symbols
-            for tag_ in tag.find_all('br'):
-                tag_.insert_after('\n')
-                tag_.extract()
-
-            if tag.name == 'ul':
-                if len(tag.li.contents) < 3:
-                    quote = tag.li.contents[0]
-                    if isinstance(quote, Tag):
-                        quote = quote.text
-
-                    description = tag.li.contents[1] if len(tag.li.contents) > 1 else None
-                    if isinstance(description, Tag):
-                        description = description.text
-                else:
-                    if len(tag.find_all('li')) == 1:
-                        quote = tag.text
-                        description = None
-                    else:
-                        try:
-                            description = tag.li.contents[-1].extract().text
-                            quote = tag.text
-                        except AttributeError:
-                            # TEMPORARY: Ignore all `unparsable` quotes
-                            continue
-
-            elif tag.name == 'li':
-                quote = tag.li.text
-
-            if quote is not None:
-                if isinstance(quote, NavigableString):
-                    quote = str(quote)
-                if isinstance(description, NavigableString):
-                    description = str(description)
-
-                quote = Quote(
-                    quote=self._prettify_string(quote),
-                    author=page_title,
-                    description=self._prettify_string(description)
-                    if description is not None else None)
-
-                quotes.append(quote)
-
-        return quotes
-
-    def _parse_page_with_poem_class_tags(
-            self, page_title: str, soup: BeautifulSoup) -> List[Quote]:
-        quotes = []
-
-        tables = soup.find_all('div', {'class': 'poem'})
-
-        for table in tables:
-            description = table.find('span')
-
-            if description is not None:
-                description.extract()
-                description = description.string
-
-            quote = table.getText()
-
-            quotes.append(
-                Quote(
-                    quote=self._prettify_string(quote),
-                    author=page_title,
-                    description=self._prettify_string(description)))
-
-        return quotes
-
-    @staticmethod
-    def _prettify_string(string: str) -> Union[str, None]:
-        while string.startswith('\n'):
-            string = string[1:]
-            if string is None:
-                break
-
-        while string.endswith('\n') or string.endswith('—') or string.endswith(' '):
-            string = string[:-1]
-            if string is None:
-                break
-
-        if string == '':
-            return None
-
-        return string
+        with metrics.span('parse.wikiquote'):
+            return self.parser.parse(title, raw_response)
@@ -12,8 +12,14 @@ class WikiUrlParametersDTO:
     action: WikiAction
     format: WikiResponseFormat = WikiResponseFormat.JSON
     page: Optional[str] = None
+    titles: Optional[str] = None  # separated by "|"
     search: Optional[str] = None
     limit: Optional[int] = None
+    prop: Optional[str] = None
+    redirects: Optional[int] = None  # 1 to follow redirects on the server
+    disablelimitreport: Optional[int] = None
+    disableeditsection: Optional[int] = None
+    disabletoc: Optional[int] = None
 
     def __post_init__(self):
         if self.action is WikiAction.OPENSEARCH:
@@ -24,6 +30,11 @@ class WikiUrlParametersDTO:
             assert self.page is not None, self.parameter_not_passed_error('page', self.action)
             assert self.search is None, self.parameter_passed_error('search', self.action)
             assert self.limit is None, self.parameter_passed_error('limit', self.action)
+            assert self.titles is None, self.parameter_passed_error('titles', self.action)
+
+        if self.action is WikiAction.QUERY:
+            assert self.titles is not None, self.parameter_not_passed_error('titles', self.action)
+            assert self.page is None, self.parameter_passed_error('page', self.action)
 
     def mapping(self):
         return {
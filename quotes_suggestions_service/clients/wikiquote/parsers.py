@@ -0,0 +1,399 @@
+import re
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from bs4 import BeautifulSoup, Tag, NavigableString
+from lxml import html
+
+from .constants import EN_EXTRA_BLOCKS_NAMES, EN_QUOTES_BLOCK_NAME
+from ..dtos import Quote
+
+
+REFERENCE_LINK = re.compile(r'\[\d*]')
+QUOTES_BLOCK = re.compile(EN_QUOTES_BLOCK_NAME)
+SKIPPED_TAGS = ('h3', 'h4', 'dl', 'p', 'div')
+
+
+class SoupQuotesParser:
+    """
+    BeautifulSoup parser, it walks the page several times and mutates the tree on the way.
+    Kept as the reference behaviour of `LxmlQuotesParser`
+    """
+
+    def parse(self, title: str, raw_response: str) -> Set[Quote]:
+        soup = BeautifulSoup(raw_response, 'html.parser') \
+            .find('div', {'class': 'mw-parser-output'})
+
+        # Remove links
+        for a in soup.find_all('a', href=True):
+            if bool(re.match(r'\[\d*]', str(a.string))):
+                a.extract()
+            elif a.string is not None:
+                a.insert_after(a.string)
+            a.extract()
+        [sup.extract() for sup in soup.find_all('sup')]
+
+        # Some quotes are marked as <div class="poem">, it's make sense to unpack them here
+        poem_class_quotes = self._parse_page_with_poem_class_tags(title, soup)
+        li_tags_quotes = self._parse_page_with_li_tags(title, soup)
+
+        quotes = {*li_tags_quotes, *poem_class_quotes}
+
+        return quotes
+
+    def _parse_page_with_li_tags(self, page_title: str, soup: BeautifulSoup) -> List[Quote]:
+        # Remove extra highlighted blocks like Disputed, Misattributed..
+        for block_name in EN_EXTRA_BLOCKS_NAMES:
+            excess_block = soup.find(text=block_name)
+            if excess_block is not None:
+                excess_block.find_parent('div').extract()
+
+        # Search only necessary blocks
+        raw_quotes = []
+        h2 = soup.find('span', text=re.compile(EN_QUOTES_BLOCK_NAME)).parent
+        tags = h2.find_next_siblings()
+        for tag in tags:
+            if tag.name == 'h2':
+                break
+            # Exclude h3, h4, dl, p tags
+            if tag.name not in ('h3', 'h4', 'dl', 'p', 'div'):
+                raw_quotes.append(tag)
+
+        quotes = []
+        for num, tag in enumerate(raw_quotes):
+            quote = None
+            description = None
+            # Replace <br> tags to \n symbols
+            for tag_ in tag.find_all('br'):
+                tag_.insert_after('\n')
+                tag_.extract()
+
+            if tag.name == 'ul':
+                if len(tag.li.contents) < 3:
+                    quote = tag.li.contents[0]
+                    if isinstance(quote, Tag):
+                        quote = quote.text
+
+                    description = tag.li.contents[1] if len(tag.li.contents) > 1 else None
+                    if isinstance(description, Tag):
+                        description = description.text
+                else:
+                    if len(tag.find_all('li')) == 1:
+                        quote = tag.text
+                        description = None
+                    else:
+                        try:
+                            description = tag.li.contents[-1].extract().text
+                            quote = tag.text
+                        except AttributeError:
+                            # TEMPORARY: Ignore all `unparsable` quotes
+                            continue
+
+            elif tag.name == 'li':
+                quote = tag.li.text
+
+            if quote is not None:
+                if isinstance(quote, NavigableString):
+                    quote = str(quote)
+                if isinstance(description, NavigableString):
+                    description = str(description)
+
+                quote = Quote(
+                    quote=prettify_string(quote),
+                    author=page_title,
+                    description=prettify_string(description)
+                    if description is not None else None)
+
+                quotes.append(quote)
+
+        return quotes
+
+    @staticmethod
+    def _parse_page_with_poem_class_tags(page_title: str, soup: BeautifulSoup) -> List[Quote]:
+        quotes = []
+
+        tables = soup.find_all('div', {'class': 'poem'})
+
+        for table in tables:
+            description = table.find('span')
+
+            if description is not None:
+                description.extract()
+                description = description.string
+
+            quote = table.getText()
+
+            quotes.append(
+                Quote(
+                    quote=prettify_string(quote),
+                    author=page_title,
+                    description=prettify_string(description)))
+
+        return quotes
+
+
+class LxmlQuotesParser:
+    """
+    Extracts the same quotes as `SoupQuotesParser` from a tree built by lxml.
+    The tree isn't mutated: unwrapped links, removed `sup` tags and `br` newlines
+    are applied while the contents of a tag are read, the way BeautifulSoup would see them.
+    The page is walked once to find poems, the quotes block and the extra blocks,
+    then only the tags of the quotes block are read
+    """
+
+    def parse(self, title: str, raw_response: str) -> Set[Quote]:
+        page = _Page(html.document_fromstring(raw_response))
+        if page.root is None:
+            return set()
+
+        poem_class_quotes = self._parse_poems(title, page)
+        li_tags_quotes = self._parse_quotes_block(title, page)
+
+        return {*li_tags_quotes, *poem_class_quotes}
+
+    @staticmethod
+    def _parse_poems(page_title: str, page: '_Page') -> List[Quote]:
+        quotes = []
+
+        for poem in page.poems:
+            span = page.find(poem, 'span')
+            description = None
+
+            if span is not None:
+                description = page.get_string(span)
+                page.removed.add(span)
+
+            # Poems without a description fail in `SoupQuotesParser`, here it's left empty
+            quotes.append(
+                Quote(
+                    quote=prettify_string(page.get_text(poem, newlines=False)),
+                    author=page_title,
+                    description=prettify_string(description)
+                    if description is not None else None))
+
+        return quotes
+
+    @staticmethod
+    def _parse_quotes_block(page_title: str, page: '_Page') -> List[Quote]:
+        page.removed.update(block for block in page.extra_blocks if block is not page.root)
+
+        header = next(
+            (span for span in page.quotes_headers if not page.is_removed(span)), None)
+        if header is None:
+            return []
+
+        parent = header.getparent()
+        siblings = [
+            item for item in page.get_contents(parent.getparent(), newlines=False)
+            if not isinstance(item, str)]
+        raw_quotes = []
+        for tag in siblings[siblings.index(parent) + 1:]:
+            if tag.tag == 'h2':
+                break
+            if tag.tag not in SKIPPED_TAGS:
+                raw_quotes.append(tag)
+
+        quotes = []
+        for tag in raw_quotes:
+            quote = None
+            description = None
+
+            if tag.tag == 'ul':
+                li = page.find(tag, 'li')
+                contents = page.get_contents(li, newlines=True) if li is not None else []
+
+                if len(contents) == 0:
+                    continue
+                elif len(contents) < 3:
+                    quote = page.get_item_text(contents[0])
+                    description = page.get_item_text(contents[1]) if len(contents) > 1 else None
+                elif sum(1 for _ in page.iter_elements(tag, 'li')) == 1:
+                    quote = page.get_text(tag, newlines=True)
+                elif isinstance(contents[-1], str):
+                    # Strings have no text in `SoupQuotesParser`, such quotes are ignored
+                    continue
+                else:
+                    description = page.get_text(contents[-1], newlines=True)
+                    page.removed.add(contents[-1])
+                    quote = page.get_text(tag, newlines=True)
+
+            elif tag.tag == 'li':
+                li = page.find(tag, 'li')
+                if li is not None:
+                    quote = page.get_text(li, newlines=True)
+
+            if quote is not None:
+                quotes.append(
+                    Quote(
+                        quote=prettify_string(quote),
+                        author=page_title,
+                        description=prettify_string(description)
+                        if description is not None else None))
+
+        return quotes
+
+
+class _Comment(str):
+    """
+    Comment is an item of tag contents without text
+    """
+
+
+Item = Union[str, html.HtmlElement]
+
+
+class _Page:
+
+    def __init__(self, document: html.HtmlElement):
+        self.root = next(
+            (
+                div for div in document.iter('div')
+                if 'mw-parser-output' in div.get('class', '').split()
+            ),
+            None)
+        self.removed: Set[html.HtmlElement] = set()
+
+        self.poems: List[html.HtmlElement] = []
+        self.quotes_headers: List[html.HtmlElement] = []
+        self.extra_blocks: List[html.HtmlElement] = []
+        if self.root is not None:
+            self._walk()
+
+    def get_contents(self, element: html.HtmlElement, newlines: bool) -> List[Item]:
+        """
+        Children of the element after links are unwrapped and `sup` tags are removed,
+        `br` tags are replaced with newlines if `newlines` is set
+        """
+        contents = []
+        if element.text:
+            contents.append(element.text)
+
+        for child in element:
+            if child in self.removed:
+                pass
+            elif not isinstance(child.tag, str):
+                contents.append(_Comment(child.text or ''))
+            elif child.tag == 'sup':
+                pass
+            elif child.tag == 'a' and child.get('href') is not None:
+                string = _get_raw_string(child)
+                if string is not None and not REFERENCE_LINK.match(string):
+                    contents.append(string)
+            elif child.tag == 'br' and newlines:
+                contents.append('\n')
+            else:
+                contents.append(child)
+
+            if child.tail:
+                contents.append(child.tail)
+
+        return contents
+
+    def get_text(self, element: html.HtmlElement, newlines: bool) -> str:
+        return ''.join(
+            self._get_item_text(item, newlines) for item in self.get_contents(element, newlines))
+
+    def get_item_text(self, item: Item) -> str:
+        """
+        Text of a tag, a string or a comment itself, as `SoupQuotesParser` takes a content item
+        """
+        return str(item) if isinstance(item, str) else self.get_text(item, newlines=True)
+
+    def get_string(self, element: html.HtmlElement) -> Optional[str]:
+        """
+        The only string of the element, as `Tag.string` of BeautifulSoup
+        """
+        contents = self.get_contents(element, newlines=False)
+        if len(contents) != 1:
+            return None
+
+        return contents[0] if isinstance(contents[0], str) else self.get_string(contents[0])
+
+    def iter_elements(self, element: html.HtmlElement, tag: str) -> Iterator[html.HtmlElement]:
+        for item in self.get_contents(element, newlines=False):
+            if not isinstance(item, str):
+                if item.tag == tag:
+                    yield item
+                yield from self.iter_elements(item, tag)
+
+    def find(self, element: html.HtmlElement, tag: str) -> Optional[html.HtmlElement]:
+        return next(self.iter_elements(element, tag), None)
+
+    def is_removed(self, element: html.HtmlElement) -> bool:
+        return element in self.removed or any(
+            ancestor in self.removed for ancestor in element.iterancestors())
+
+    def _get_item_text(self, item: Item, newlines: bool) -> str:
+        if isinstance(item, _Comment):
+            return ''
+        elif isinstance(item, str):
+            return item
+
+        return self.get_text(item, newlines)
+
+    def _walk(self):
+        """
+        Single walk over the page collecting poems, headers of the quotes block
+        and the closest `div` of the first string of every extra block
+        """
+        extra_blocks: Dict[str, html.HtmlElement] = {}
+        # Strings are walked along with tags, so the first string of a block is found in order
+        stack: List[Tuple[Item, html.HtmlElement]] = [(self.root, self.root)]
+
+        while stack:
+            item, closest_div = stack.pop()
+
+            if isinstance(item, _Comment):
+                continue
+            elif isinstance(item, str):
+                if item in EN_EXTRA_BLOCKS_NAMES and item not in extra_blocks:
+                    extra_blocks[item] = closest_div
+                continue
+
+            if item.tag == 'div':
+                closest_div = item
+                if item is not self.root and 'poem' in item.get('class', '').split():
+                    self.poems.append(item)
+            elif item.tag == 'span':
+                string = self.get_string(item)
+                if string is not None and QUOTES_BLOCK.search(string):
+                    self.quotes_headers.append(item)
+
+            stack.extend(
+                (child, closest_div)
+                for child in reversed(self.get_contents(item, newlines=False)))
+
+        self.extra_blocks = [
+            extra_blocks[name] for name in EN_EXTRA_BLOCKS_NAMES if name in extra_blocks]
+
+
+def _get_raw_string(element: html.HtmlElement) -> Optional[str]:
+    """
+    `Tag.string` of BeautifulSoup for an unmodified element
+    """
+    children = list(element)
+
+    if element.text:
+        return element.text if len(children) == 0 else None
+    if len(children) != 1 or children[0].tail:
+        return None
+    if not isinstance(children[0].tag, str):
+        return children[0].text
+
+    return _get_raw_string(children[0])
+
+
+def prettify_string(string: str) -> Union[str, None]:
+    while string.startswith('\n'):
+        string = string[1:]
+        if string is None:
+            break
+
+    while string.endswith('\n') or string.endswith('—') or string.endswith(' '):
+        string = string[:-1]
+        if string is None:
+            break
+
+    if string == '':
+        return None
+
+    return string
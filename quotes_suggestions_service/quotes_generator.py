@@ -1,21 +1,103 @@
-from typing import Tuple, Set
+import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from itertools import chain
+from threading import Lock
+from typing import (
+    AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple,
+    Set,
+)
 
 from nltk import word_tokenize
-from nltk.corpus import stopwords
+from nltk.corpus import stopwords, wordnet
+from nltk.stem import WordNetLemmatizer
 
-from quotes_suggestions_service.setting import DEFAULT_CACHE_TTL, REDIS_HOST, REDIS_PORT
+from quotes_suggestions_service.setting import (
+    DEFAULT_CACHE_TTL, REDIS_HOST, REDIS_PORT, CACHE_COMPRESSION, CACHE_SOFT_TTL, FETCH_MAX_WORKERS,
+    FETCH_TIMEOUT, SINGLE_FLIGHT_REDIS_LOCK, SINGLE_FLIGHT_LOCK_TIMEOUT, L1_CACHE_MAX_QUOTES,
+    L1_CACHE_TTL, CORPUS_ENABLED, CORPUS_PATH, RANKING_MAX_QUOTES, LEMMAS_CACHE_SIZE,
+    HOT_QUERIES_REFRESH, HOT_QUERIES_COUNT, HOT_QUERIES_REFRESH_INTERVAL, HOT_QUERIES_REFRESH_AHEAD,
+    HOT_QUERIES_DECAY, HOT_QUERIES_MIN_REQUESTS,
+)
 from quotes_suggestions_service.clients import EN_QUOTES_API_CLIENTS
+from quotes_suggestions_service.clients.base import QuotesApiClient
 from quotes_suggestions_service.clients.dtos import Quote
 from quotes_suggestions_service.utils.cache import TemporaryQuotesStorage
+from quotes_suggestions_service.utils.corpus import QuotesCorpus
+from quotes_suggestions_service.utils.fetcher import ConcurrentFetcher
 from quotes_suggestions_service.utils.helpers import return_only_lower_letters
+from quotes_suggestions_service.utils.hot_queries import HotQueriesScheduler, Query
+from quotes_suggestions_service.utils.local_cache import LocalQuotesCache
+from quotes_suggestions_service.utils.metrics import metrics
+from quotes_suggestions_service.utils.process_pool import process_pool
+from quotes_suggestions_service.utils.ranking import QuotesRanker, RankedQuotes
+from quotes_suggestions_service.utils.single_flight import SingleFlight, AsyncSingleFlight
+
+
+logger = logging.getLogger(__name__)
+# WordNet is read from disk on the first lemmatization
+lemmatizer = WordNetLemmatizer()
+
+SubQueryTask = Tuple[QuotesApiClient, Tuple[str, ...], Tuple[str, ...]]  # (client, authors, keywords)
+BatchQuery = Tuple[Tuple[str, ...], Tuple[str, ...], int, int]  # (authors, keywords, limit, offset)
+
+
+class PendingQuery(NamedTuple):
+    """
+    Query of a batch, which isn't answered by the in-process cache
+    """
+
+    key: str
+    authors: Tuple[str, ...]
+    keywords: Tuple[str, ...]
+    sub_queries: Dict[str, SubQueryTask]
+
+
+class QuotesFetchInProgressError(Exception):
+    """
+    Another process holds the fetch lock of the query for longer than it's allowed to wait
+    """
 
 
 class QuotesGenerator:
 
     _instance = None
-    cache_storage = TemporaryQuotesStorage(REDIS_HOST, REDIS_PORT, DEFAULT_CACHE_TTL)
+    cache_storage = TemporaryQuotesStorage(
+        REDIS_HOST, REDIS_PORT, DEFAULT_CACHE_TTL,
+        compress=CACHE_COMPRESSION, soft_ttl=CACHE_SOFT_TTL)
     quotes_clients = EN_QUOTES_API_CLIENTS
-    stop_words = set(stopwords.words("english"))
+    fetcher = ConcurrentFetcher(FETCH_MAX_WORKERS, FETCH_TIMEOUT)
+    single_flight = SingleFlight()
+    async_single_flight = AsyncSingleFlight()
+    redis_lock_single_flight = SINGLE_FLIGHT_REDIS_LOCK
+    local_cache = LocalQuotesCache(L1_CACHE_MAX_QUOTES, L1_CACHE_TTL)
+    # Fetched quotes are tokenized in a batch, in the worker processes if there are any
+    ranker = QuotesRanker(
+        lambda text: QuotesGenerator()._prepare_words_from_text(text), RANKING_MAX_QUOTES,
+        analyze_many=lambda texts: process_pool.run(
+            'tokenize', QuotesGenerator()._prepare_words_from_texts, texts))
+    # Analyzed like the ranked quotes, so the corpus finds quotes with the lemmas of the keywords
+    corpus = QuotesCorpus(
+        CORPUS_PATH,
+        lambda texts: process_pool.run(
+            'tokenize', QuotesGenerator()._prepare_words_from_texts, texts)) \
+        if CORPUS_ENABLED else None
+    hot_queries = HotQueriesScheduler(
+        cache_storage,
+        lambda queries: QuotesGenerator()._refresh_hot_queries(queries),
+        HOT_QUERIES_COUNT, HOT_QUERIES_REFRESH_INTERVAL, HOT_QUERIES_DECAY,
+        HOT_QUERIES_MIN_REQUESTS, HOT_QUERIES_REFRESH_AHEAD) \
+        if HOT_QUERIES_REFRESH else None
+    # Stale results are re-fetched and the corpus is enriched in the background
+    refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='background-refresh')
+    _refreshing_sub_queries: Set[str] = set()
+    _refreshing_lock = Lock()
+    # Loaded on first use or by `load_stop_words`, so importing the service stays cheap
+    _stop_words = None
+    _stop_words_lock = Lock()
 
     def get_quotes(
             self,
@@ -24,23 +106,296 @@ class QuotesGenerator:
             limit: int = 1,
             offset: int = 0) -> Tuple[Quote, ...]:
 
-        key = self._generate_key_from_string(''.join((*authors, *keywords)))
+        key = self._generate_query_key(authors, keywords)
+        if self.hot_queries is not None:
+            self.hot_queries.record(authors, keywords)
 
-        if self.cache_storage.key_in_cache(key):
-            response = self.cache_storage.get_cache(key, limit, offset)
-        else:
-            quotes_set = {
-                quote
-                for client in self.quotes_clients
-                for quote in client.get_quotes(
-                    authors=authors if len(authors) != 0 else (),
-                    keywords=keywords if len(keywords) != 0 else ())
-            }
-            sorted_quotes = self._sort_quotes_by_matching(keywords, quotes_set)
-            self.cache_storage.set_cache(key, sorted_quotes)
-            response = sorted_quotes[offset:limit+offset]
+        sorted_quotes = self.local_cache.get(key)
+        if sorted_quotes is not None:
+            return sorted_quotes[offset:limit+offset]
+
+        quotes = self._get_ranked_page(key, limit, offset)
+        if quotes is not None:
+            return quotes
+
+        # Concurrent misses of the same query wait for one assembly of its quotes
+        sorted_quotes = self.single_flight.do(
+            key, partial(self._assemble_quotes_once, key, authors, keywords))
+
+        return sorted_quotes[offset:limit+offset]
+
+    async def aget_quotes(
+            self,
+            authors: Tuple[str],
+            keywords: Tuple[str],
+            limit: int = 1,
+            offset: int = 0) -> Tuple[Quote, ...]:
+        """
+        Asynchronous variant of `get_quotes`.
+        Redis calls and ranking are blocking, so they are run in the default executor of the loop
+        """
+        key = self._generate_query_key(authors, keywords)
+        if self.hot_queries is not None:
+            self.hot_queries.record(authors, keywords)
+
+        sorted_quotes = self.local_cache.get(key)
+        if sorted_quotes is not None:
+            return sorted_quotes[offset:limit+offset]
+
+        quotes = await asyncio.get_running_loop().run_in_executor(
+            None, self._get_ranked_page, key, limit, offset)
+        if quotes is not None:
+            return quotes
+
+        sorted_quotes = await self.async_single_flight.do(
+            key, partial(self._aassemble_quotes_once, key, authors, keywords))
+
+        return sorted_quotes[offset:limit+offset]
+
+    def iter_quotes(
+            self,
+            authors: Tuple[str],
+            keywords: Tuple[str],
+            limit: int = 1) -> Iterator[Tuple[Quote, ...]]:
+        """
+        Streaming variant of `get_quotes`, yields at most `limit` quotes in batches.
+        A query without missing upstream results is yielded ranked at once.
+        Otherwise cached results go first and then quotes of every upstream page
+        as soon as it's parsed, each batch is ranked by itself.
+        Missing results keep being fetched into the cache after the stream has ended
+        """
+        if self.hot_queries is not None:
+            self.hot_queries.record(authors, keywords)
+
+        sorted_quotes, missing_sub_queries, cached_quotes = self._begin_fetch(authors, keywords)
+        if sorted_quotes is not None:
+            yield tuple(sorted_quotes[:limit])
+            return
+
+        batches = self.fetcher.iter_batches(
+            partial(self._stream_sub_query, sub_key, *sub_query)
+            for sub_key, sub_query in missing_sub_queries.items())
+
+        streamed_quotes = set()
+        for batch in chain((cached_quotes, ), batches):
+            sorted_batch = self._rank_new_quotes(keywords, batch, streamed_quotes, limit)
+            if len(sorted_batch) != 0:
+                yield sorted_batch
+            if len(streamed_quotes) >= limit:
+                return
+
+    async def aiter_quotes(
+            self,
+            authors: Tuple[str],
+            keywords: Tuple[str],
+            limit: int = 1) -> AsyncIterator[Tuple[Quote, ...]]:
+        """
+        Asynchronous variant of `iter_quotes`
+        """
+        loop = asyncio.get_running_loop()
+        if self.hot_queries is not None:
+            self.hot_queries.record(authors, keywords)
+
+        sorted_quotes, missing_sub_queries, cached_quotes = await loop.run_in_executor(
+            None, self._begin_fetch, authors, keywords)
+        if sorted_quotes is not None:
+            yield tuple(sorted_quotes[:limit])
+            return
+
+        batches = self.fetcher.aiter_batches(
+            partial(self._astream_sub_query, sub_key, *sub_query)
+            for sub_key, sub_query in missing_sub_queries.items())
 
-        return response
+        streamed_quotes = set()
+        sorted_batch = await loop.run_in_executor(
+            None, self._rank_new_quotes, keywords, cached_quotes, streamed_quotes, limit)
+        if len(sorted_batch) != 0:
+            yield sorted_batch
+
+        async for batch in batches:
+            if len(streamed_quotes) >= limit:
+                return
+            sorted_batch = await loop.run_in_executor(
+                None, self._rank_new_quotes, keywords, batch, streamed_quotes, limit)
+            if len(sorted_batch) != 0:
+                yield sorted_batch
+
+    def get_quotes_early(
+            self,
+            authors: Tuple[str],
+            keywords: Tuple[str],
+            limit: int = 1,
+            offset: int = 0) -> Tuple[Quote, ...]:
+        """
+        Variant of `get_quotes` answering as soon as the quotes fetched so far
+        have `offset + limit` good matches: quotes with the keywords or any quotes
+        if there are no keywords. Only these quotes are ranked,
+        missing results keep being fetched into the cache after the answer
+        """
+        if self.hot_queries is not None:
+            self.hot_queries.record(authors, keywords)
+
+        sorted_quotes, missing_sub_queries, cached_quotes = self._begin_fetch(authors, keywords)
+        if sorted_quotes is None:
+            batches = self.fetcher.iter_batches(
+                partial(self._stream_sub_query, sub_key, *sub_query)
+                for sub_key, sub_query in missing_sub_queries.items())
+
+            quotes_set = set()
+            for batch in chain((cached_quotes, ), batches):
+                quotes_set.update(batch)
+                sorted_quotes = self._sort_quotes_by_matching(keywords, quotes_set)
+                if self._has_enough_matches(keywords, sorted_quotes, offset + limit):
+                    break
+
+        return sorted_quotes[offset:limit+offset]
+
+    async def aget_quotes_early(
+            self,
+            authors: Tuple[str],
+            keywords: Tuple[str],
+            limit: int = 1,
+            offset: int = 0) -> Tuple[Quote, ...]:
+        """
+        Asynchronous variant of `get_quotes_early`
+        """
+        loop = asyncio.get_running_loop()
+        if self.hot_queries is not None:
+            self.hot_queries.record(authors, keywords)
+
+        sorted_quotes, missing_sub_queries, cached_quotes = await loop.run_in_executor(
+            None, self._begin_fetch, authors, keywords)
+        if sorted_quotes is None:
+            quotes_set = set(cached_quotes)
+            sorted_quotes = await loop.run_in_executor(
+                None, self._sort_quotes_by_matching, keywords, quotes_set)
+
+            batches = self.fetcher.aiter_batches(
+                partial(self._astream_sub_query, sub_key, *sub_query)
+                for sub_key, sub_query in missing_sub_queries.items())
+
+            async for batch in batches:
+                if self._has_enough_matches(keywords, sorted_quotes, offset + limit):
+                    break
+                quotes_set.update(batch)
+                sorted_quotes = await loop.run_in_executor(
+                    None, self._sort_quotes_by_matching, keywords, quotes_set)
+
+        return sorted_quotes[offset:limit+offset]
+
+    def get_quotes_many(self, queries: Sequence[BatchQuery]) -> List[Tuple[Quote, ...]]:
+        """
+        Batch variant of `get_quotes`: cached results of all the queries are read
+        in one Redis round trip, the missing ones are fetched concurrently, each of them once
+        :return: quotes of every query in the same order
+        """
+        sorted_quotes, pending_queries, cached_quotes, stale_sub_keys = \
+            self._begin_batch(queries)
+
+        missing_sub_queries = self._get_missing_sub_queries(pending_queries, cached_quotes)
+        fetched_quotes = self._fetch_sub_queries(missing_sub_queries)
+
+        self._finish_batch(
+            sorted_quotes, pending_queries, {**cached_quotes, **fetched_quotes}, stale_sub_keys)
+
+        return [
+            quotes[offset:limit+offset]
+            for quotes, (_, _, limit, offset) in zip(sorted_quotes, queries)
+        ]
+
+    async def aget_quotes_many(self, queries: Sequence[BatchQuery]) -> List[Tuple[Quote, ...]]:
+        """
+        Asynchronous variant of `get_quotes_many`
+        """
+        loop = asyncio.get_running_loop()
+        sorted_quotes, pending_queries, cached_quotes, stale_sub_keys = \
+            await loop.run_in_executor(None, self._begin_batch, queries)
+
+        missing_sub_queries = self._get_missing_sub_queries(pending_queries, cached_quotes)
+        fetched_quotes = await self._afetch_sub_queries(missing_sub_queries)
+
+        await loop.run_in_executor(
+            None, self._finish_batch,
+            sorted_quotes, pending_queries, {**cached_quotes, **fetched_quotes}, stale_sub_keys)
+
+        return [
+            quotes[offset:limit+offset]
+            for quotes, (_, _, limit, offset) in zip(sorted_quotes, queries)
+        ]
+
+    def split_query(
+            self, authors: Tuple[str], keywords: Tuple[str]) -> Dict[str, SubQueryTask]:
+        """
+        Splits the query into the cacheable results of every client and author/keyword
+        :return: {sub-query key: sub-query}
+        """
+        return {
+            self._generate_sub_query_key(client, sub_authors, sub_keywords):
+                (client, sub_authors, sub_keywords)
+            for client in self.quotes_clients
+            for sub_authors, sub_keywords in client.split_query(authors, keywords)
+        }
+
+    def prepare_clients(self, sub_queries: Iterable[SubQueryTask]):
+        """
+        Lets every client do the batched work shared by its sub-queries, see `prepare_query`
+        """
+        clients_sub_queries = defaultdict(lambda: (set(), set()))
+        for client, authors, keywords in sub_queries:
+            clients_sub_queries[client][0].update(authors)
+            clients_sub_queries[client][1].update(keywords)
+
+        for client, (authors, keywords) in clients_sub_queries.items():
+            client.prepare_query(tuple(authors), tuple(keywords))
+
+    def fetch_sub_query(
+            self,
+            sub_key: str,
+            client: QuotesApiClient,
+            authors: Tuple[str],
+            keywords: Tuple[str],
+            ttl: Optional[int] = None) -> Tuple[Quote, ...]:
+        """
+        Fetches raw quotes of one client and author/keyword, they are shared by all the queries
+        :param ttl: in seconds until the first read of the stored result, see `set_cache`
+        """
+        with _count_upstream_errors(client):
+            quotes = tuple(client.get_quotes(authors=authors, keywords=keywords))
+        self._store_sub_query(sub_key, quotes, ttl)
+
+        return quotes
+
+    def render_metrics(self) -> str:
+        """
+        Prometheus text exposition of the stage spans and counters
+        along with the statistics of the caches, Redis operations and upstream connections
+        """
+        local_cache_stats = self.local_cache.stats()
+        upstream_stats = defaultdict(lambda: defaultdict(float))
+        for transport in (QuotesApiClient.transport, QuotesApiClient.async_transport):
+            for host, host_stats in transport.stats.snapshot().items():
+                for name, value in host_stats.items():
+                    upstream_stats[name][(('host', host), )] += value
+
+        return metrics.render(
+            histograms={
+                'redis_operation_duration_seconds': ('operation', self.cache_storage.stats),
+            },
+            counters={
+                'cache_requests_total': {
+                    (('cache', 'local'), ('result', 'hit')): local_cache_stats['hits'],
+                    (('cache', 'local'), ('result', 'miss')): local_cache_stats['misses'],
+                },
+                'local_cache_evictions_total': {(): local_cache_stats['evictions']},
+                'local_cache_expirations_total': {(): local_cache_stats['expirations']},
+                'upstream_requests_total': upstream_stats['requests'],
+                'upstream_connections_total': upstream_stats['connections'],
+                'upstream_connect_seconds_total': upstream_stats['connect_time'],
+            },
+            gauges={
+                'local_cache_entries': {(): local_cache_stats['entries']},
+                'local_cache_quotes': {(): local_cache_stats['quotes']},
+            })
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -48,42 +403,566 @@ class QuotesGenerator:
 
         return cls._instance
 
+    @property
+    def stop_words(self) -> Set[str]:
+        if self._stop_words is None:
+            self.load_stop_words()
+
+        return self._stop_words
+
+    @classmethod
+    def load_stop_words(cls):
+        with cls._stop_words_lock:
+            if cls._stop_words is None:
+                cls._stop_words = set(stopwords.words("english"))
+
     def _sort_quotes_by_matching(
-            self, keywords: Tuple[str], quotes_set: Set[Quote]) -> Tuple[Quote, ...]:
-        keywords = {
-            word
-            for keyword in keywords
-            for word in keyword.split()
-        }
-        quotes_with_counter = set()
+            self, keywords: Tuple[str], quotes_set: Set[Quote]) -> RankedQuotes:
+        with metrics.span('ranking'):
+            return self.ranker.rank(keywords, quotes_set)
 
-        for quote in quotes_set:
-            words_count_mapping = [
-                word in keywords
-                for word in self._prepare_words_set_from_quote(quote.quote)
+    def _prepare_words_from_text(self, text: str) -> List[str]:
+        """
+        Tokenize and lemmatize for getting words of quotes and keywords.
+        Word order is kept for bigrams
+        :param text: str
+        :return: List of lemmas
+        """
+        with metrics.span('tokenize'):
+            return [
+                self._lemmatize(word)
+                for word in word_tokenize(text.lower())
+                if word.isalpha() and word not in self.stop_words
             ]
-            quote_rating = sum(words_count_mapping)
-            quotes_with_counter.add((quote_rating, quote))
 
-        sorted_quotes = sorted(
-            quotes_with_counter,
-            key=lambda quote_: (quote_[0], -len(quote_[1].quote)),
-            reverse=True)
+    def _prepare_words_from_texts(self, texts: Tuple[str, ...]) -> List[List[str]]:
+        return [self._prepare_words_from_text(text) for text in texts]
+
+    @staticmethod
+    @lru_cache(maxsize=LEMMAS_CACHE_SIZE)
+    def _lemmatize(word: str) -> str:
+        # WordNet needs a part of speech: verbs are tried first, so "loving" becomes "love"
+        lemma = lemmatizer.lemmatize(word, wordnet.VERB)
+
+        return lemma if lemma != word else lemmatizer.lemmatize(word, wordnet.NOUN)
+
+    def _begin_fetch(
+            self,
+            authors: Tuple[str],
+            keywords: Tuple[str]) \
+            -> Tuple[Optional[RankedQuotes], Dict[str, SubQueryTask], Set[Quote]]:
+        """
+        Starts a query answered before all of its upstream results are fetched.
+        Queries without missing results are assembled as usual
+        :return: (ranked quotes if nothing is missing, missing sub-queries, cached quotes)
+        """
+        key = self._generate_query_key(authors, keywords)
+
+        sorted_quotes = self.local_cache.get(key)
+        if sorted_quotes is not None:
+            return sorted_quotes, {}, set()
+
+        sub_queries = self.split_query(authors, keywords)
+        cached_quotes, stale_sub_keys = self.cache_storage.get_many_with_stale_keys(sub_queries)
 
-        return tuple(quote for quote_rating, quote in sorted_quotes)
+        corpus_quotes = self._search_corpus(sub_queries, cached_quotes)
+        if corpus_quotes is not None:
+            return self._assemble_corpus_quotes(
+                keywords, sub_queries, cached_quotes, stale_sub_keys, corpus_quotes), {}, set()
 
-    def _prepare_words_set_from_quote(self, text: str) -> Set[str]:
+        missing_sub_queries = {
+            sub_key: sub_query
+            for sub_key, sub_query in sub_queries.items()
+            if sub_key not in cached_quotes
+        }
+        if len(missing_sub_queries) == 0:
+            return self._assemble_quotes(
+                key, keywords, sub_queries, cached_quotes, stale_sub_keys), {}, set()
+
+        # Clients aren't prepared: batched work would delay the first quotes by a round trip,
+        # sub-queries do it on their own
+        self._refresh_stale_sub_queries(sub_queries, stale_sub_keys)
+
+        return None, missing_sub_queries, {
+            quote for quotes in cached_quotes.values() for quote in quotes}
+
+    def _rank_new_quotes(
+            self,
+            keywords: Tuple[str],
+            batch: Iterable[Quote],
+            streamed_quotes: Set[Quote],
+            limit: int) -> Tuple[Quote, ...]:
         """
-        Tokenize for getting quote words.
-        :param text: str
-        :return: Set of words
+        Ranks quotes of the batch, which haven't been streamed yet, up to `limit` streamed quotes
         """
+        new_quotes = set(batch) - streamed_quotes
+        sorted_quotes = self._sort_quotes_by_matching(keywords, new_quotes)[
+            :max(limit - len(streamed_quotes), 0)]
+        streamed_quotes.update(sorted_quotes)
+
+        return sorted_quotes
+
+    @staticmethod
+    def _has_enough_matches(keywords: Tuple[str], sorted_quotes: RankedQuotes, count: int) -> bool:
+        matches = sorted_quotes.matches if len(keywords) != 0 else len(sorted_quotes)
+
+        return matches >= count
+
+    def _begin_batch(self, queries: Sequence[BatchQuery]) \
+            -> Tuple[
+                List[Optional[RankedQuotes]], Dict[int, PendingQuery],
+                Dict[str, Tuple[Quote, ...]], Set[str]]:
+        """
+        Answers queries of the batch from the in-process cache and the corpus,
+        reads cached results of the other ones
+        :return: (ranked quotes of every answered query or None, pending queries by positions,
+                  cached results, stale sub-query keys)
+        """
+        sorted_quotes = []
+        pending_queries = {}
+        for position, (authors, keywords, _, _) in enumerate(queries):
+            if self.hot_queries is not None:
+                self.hot_queries.record(authors, keywords)
+
+            key = self._generate_query_key(authors, keywords)
+            sorted_quotes.append(self.local_cache.get(key))
+            if sorted_quotes[-1] is None:
+                pending_queries[position] = PendingQuery(
+                    key, authors, keywords, self.split_query(authors, keywords))
+
+        sub_queries = {
+            sub_key: sub_query
+            for query in pending_queries.values()
+            for sub_key, sub_query in query.sub_queries.items()
+        }
+        cached_quotes, stale_sub_keys = self.cache_storage.get_many_with_stale_keys(sub_queries)
+
+        for position, query in tuple(pending_queries.items()):
+            corpus_quotes = self._search_corpus(query.sub_queries, cached_quotes)
+            if corpus_quotes is not None:
+                sorted_quotes[position] = self._assemble_corpus_quotes(
+                    query.keywords, query.sub_queries, cached_quotes, stale_sub_keys, corpus_quotes)
+                del pending_queries[position]
+
+        self._refresh_stale_sub_queries(sub_queries, stale_sub_keys)
+
+        return sorted_quotes, pending_queries, cached_quotes, stale_sub_keys
+
+    @staticmethod
+    def _get_missing_sub_queries(
+            pending_queries: Dict[int, PendingQuery],
+            cached_quotes: Dict[str, Tuple[Quote, ...]]) -> Dict[str, SubQueryTask]:
         return {
-            word
-            for word in word_tokenize(text)
-            if word not in self.stop_words
+            sub_key: sub_query
+            for query in pending_queries.values()
+            for sub_key, sub_query in query.sub_queries.items()
+            if sub_key not in cached_quotes
+        }
+
+    def _finish_batch(
+            self,
+            sorted_quotes: List[Optional[RankedQuotes]],
+            pending_queries: Dict[int, PendingQuery],
+            results: Dict[str, Tuple[Quote, ...]],
+            stale_sub_keys: Set[str]):
+        """
+        Ranks quotes of the pending queries in place of their `None`s
+        """
+        for position, query in pending_queries.items():
+            quotes_set = {
+                quote
+                for sub_key in query.sub_queries
+                for quote in results.get(sub_key, ())
+            }
+            sorted_quotes[position] = self._sort_quotes_by_matching(query.keywords, quotes_set)
+
+            # Partial and stale results aren't cached, as in `_assemble_quotes`
+            is_complete = all(sub_key in results for sub_key in query.sub_queries)
+            if is_complete and stale_sub_keys.isdisjoint(query.sub_queries):
+                self._cache_ranked_quotes(query.key, sorted_quotes[position])
+
+    def _assemble_quotes_once(
+            self, key: str, authors: Tuple[str], keywords: Tuple[str]) -> Tuple[Quote, ...]:
+        """
+        Merges and ranks cached upstream results of the query, fetching the missing ones.
+        Stale results are served as they are and re-fetched in the background.
+        In the Redis lock mode only one process fetches the missing results of the query
+        """
+        sub_queries = self.split_query(authors, keywords)
+        cached_quotes, stale_sub_keys = self.cache_storage.get_many_with_stale_keys(sub_queries)
+
+        corpus_quotes = self._search_corpus(sub_queries, cached_quotes)
+        if corpus_quotes is not None:
+            return self._assemble_corpus_quotes(
+                keywords, sub_queries, cached_quotes, stale_sub_keys, corpus_quotes)
+
+        if len(cached_quotes) == len(sub_queries) or not self.redis_lock_single_flight:
+            return self._assemble_quotes(
+                key, keywords, sub_queries, cached_quotes, stale_sub_keys)
+
+        with self.cache_storage.lock(key, timeout=SINGLE_FLIGHT_LOCK_TIMEOUT) as is_acquired:
+            # The results could be fetched by another process while the lock was awaited
+            cached_quotes, stale_sub_keys = \
+                self.cache_storage.get_many_with_stale_keys(sub_queries)
+            if len(cached_quotes) != len(sub_queries) and not is_acquired:
+                raise QuotesFetchInProgressError(key)
+
+            return self._assemble_quotes(
+                key, keywords, sub_queries, cached_quotes, stale_sub_keys)
+
+    async def _aassemble_quotes_once(
+            self, key: str, authors: Tuple[str], keywords: Tuple[str]) -> Tuple[Quote, ...]:
+        """
+        Asynchronous variant of `_assemble_quotes_once`
+        """
+        loop = asyncio.get_running_loop()
+        sub_queries = self.split_query(authors, keywords)
+        cached_quotes, stale_sub_keys = await loop.run_in_executor(
+            None, self.cache_storage.get_many_with_stale_keys, sub_queries)
+
+        corpus_quotes = await loop.run_in_executor(
+            None, self._search_corpus, sub_queries, cached_quotes)
+        if corpus_quotes is not None:
+            return await loop.run_in_executor(
+                None, self._assemble_corpus_quotes,
+                keywords, sub_queries, cached_quotes, stale_sub_keys, corpus_quotes)
+
+        if len(cached_quotes) == len(sub_queries) or not self.redis_lock_single_flight:
+            return await self._aassemble_quotes(
+                key, keywords, sub_queries, cached_quotes, stale_sub_keys)
+
+        async with self.cache_storage.alock(
+                key, timeout=SINGLE_FLIGHT_LOCK_TIMEOUT) as is_acquired:
+            cached_quotes, stale_sub_keys = await loop.run_in_executor(
+                None, self.cache_storage.get_many_with_stale_keys, sub_queries)
+            if len(cached_quotes) != len(sub_queries) and not is_acquired:
+                raise QuotesFetchInProgressError(key)
+
+            return await self._aassemble_quotes(
+                key, keywords, sub_queries, cached_quotes, stale_sub_keys)
+
+    def _assemble_quotes(
+            self,
+            key: str,
+            keywords: Tuple[str],
+            sub_queries: Dict[str, SubQueryTask],
+            cached_quotes: Dict[str, Tuple[Quote, ...]],
+            stale_sub_keys: Set[str]) -> Tuple[Quote, ...]:
+        missing_sub_queries = {
+            sub_key: sub_query
+            for sub_key, sub_query in sub_queries.items()
+            if sub_key not in cached_quotes
+        }
+        self._refresh_stale_sub_queries(sub_queries, stale_sub_keys)
+
+        # Every missing client and author/keyword result is fetched concurrently
+        fetched_quotes = self._fetch_sub_queries(missing_sub_queries)
+        is_complete = len(fetched_quotes) == len(missing_sub_queries)
+        quotes_set = {
+            quote for quotes in chain(cached_quotes.values(), fetched_quotes.values())
+            for quote in quotes
         }
 
+        sorted_quotes = self._sort_quotes_by_matching(keywords, quotes_set)
+        # Partial results (deadline exceeded or upstream failed) aren't cached,
+        # neither are stale ones, the next requests take the refreshed results from Redis
+        if is_complete and len(stale_sub_keys) == 0:
+            self._cache_ranked_quotes(key, sorted_quotes)
+
+        return sorted_quotes
+
+    async def _aassemble_quotes(
+            self,
+            key: str,
+            keywords: Tuple[str],
+            sub_queries: Dict[str, SubQueryTask],
+            cached_quotes: Dict[str, Tuple[Quote, ...]],
+            stale_sub_keys: Set[str]) -> Tuple[Quote, ...]:
+        loop = asyncio.get_running_loop()
+        missing_sub_queries = {
+            sub_key: sub_query
+            for sub_key, sub_query in sub_queries.items()
+            if sub_key not in cached_quotes
+        }
+        self._refresh_stale_sub_queries(sub_queries, stale_sub_keys)
+
+        fetched_quotes = await self._afetch_sub_queries(missing_sub_queries)
+        is_complete = len(fetched_quotes) == len(missing_sub_queries)
+        quotes_set = {
+            quote for quotes in chain(cached_quotes.values(), fetched_quotes.values())
+            for quote in quotes
+        }
+
+        sorted_quotes = await loop.run_in_executor(
+            None, self._sort_quotes_by_matching, keywords, quotes_set)
+        if is_complete and len(stale_sub_keys) == 0:
+            await loop.run_in_executor(None, self._cache_ranked_quotes, key, sorted_quotes)
+
+        return sorted_quotes
+
+    def _assemble_corpus_quotes(
+            self,
+            keywords: Tuple[str],
+            sub_queries: Dict[str, SubQueryTask],
+            cached_quotes: Dict[str, Tuple[Quote, ...]],
+            stale_sub_keys: Set[str],
+            corpus_quotes: Set[Quote]) -> Tuple[Quote, ...]:
+        """
+        Ranks cached results along with the quotes found in the corpus in place of the missing
+        ones. Missing results are fetched in the background, so the partial answer isn't cached
+        """
+        missing_sub_queries = {
+            sub_key: sub_query
+            for sub_key, sub_query in sub_queries.items()
+            if sub_key not in cached_quotes
+        }
+        self._refresh_stale_sub_queries(sub_queries, stale_sub_keys)
+        self._refresh_in_background(missing_sub_queries)
+
+        quotes_set = set(corpus_quotes)
+        quotes_set.update(quote for quotes in cached_quotes.values() for quote in quotes)
+
+        return self._sort_quotes_by_matching(keywords, quotes_set)
+
+    def _get_ranked_page(self, key: str, limit: int, offset: int) -> Optional[Tuple[Quote, ...]]:
+        """
+        Reads a page of the ranked quotes of the query cached by any process
+        :return: None if they aren't cached or are stale
+        """
+        quotes = self.cache_storage.get_fresh_cache(self._generate_ranked_key(key), limit, offset)
+        metrics.increment(
+            'cache_requests_total', cache='ranked', result='miss' if quotes is None else 'hit')
+
+        return quotes
+
+    def _cache_ranked_quotes(self, key: str, sorted_quotes: RankedQuotes):
+        """
+        Ranked quotes are kept in the process and as a Redis list, which other processes
+        read a page of. It's assembled of fresh results, so it lives until they are stale
+        """
+        self.local_cache.set(key, sorted_quotes)
+        self.cache_storage.set_cache(
+            self._generate_ranked_key(key), sorted_quotes[:], ttl=self.cache_storage.soft_ttl)
+
+    def _search_corpus(
+            self,
+            sub_queries: Dict[str, SubQueryTask],
+            cached_quotes: Dict[str, Tuple[Quote, ...]]) -> Optional[Set[Quote]]:
+        """
+        Looks up keywords of the results missing in Redis in the corpus
+        :return: None if nothing is missing or some missing keyword has no quotes in the corpus
+        """
+        missing_sub_queries = [
+            sub_query
+            for sub_key, sub_query in sub_queries.items()
+            if sub_key not in cached_quotes
+        ]
+        # Authors are fetched from their own pages, the corpus stands in only for keyword results
+        if self.corpus is None or len(missing_sub_queries) == 0 \
+                or any(len(authors) != 0 for _, authors, _ in missing_sub_queries):
+            return None
+
+        keywords = {keyword for _, _, keywords in missing_sub_queries for keyword in keywords}
+        with metrics.span('corpus'):
+            return self.corpus.search(sorted(keywords))
+
+    def _refresh_hot_queries(self, queries: Iterable[Query]):
+        """
+        Re-fetches results of the queries, which are missing or become stale soon
+        """
+        sub_queries = {}
+        for authors, keywords in queries:
+            sub_queries.update(self.split_query(authors, keywords))
+
+        fresh_ttls = self.cache_storage.get_fresh_ttls(sub_queries)
+        self._refresh_in_background({
+            sub_key: sub_query
+            for sub_key, sub_query in sub_queries.items()
+            if fresh_ttls[sub_key] < self.hot_queries.refresh_ahead
+        })
+
+    def _refresh_stale_sub_queries(
+            self, sub_queries: Dict[str, SubQueryTask], stale_sub_keys: Set[str]):
+        if len(stale_sub_keys) != 0:
+            self._refresh_in_background(
+                {sub_key: sub_queries[sub_key] for sub_key in stale_sub_keys})
+
+    def _refresh_in_background(self, sub_queries: Dict[str, SubQueryTask]):
+        # Sub-queries already waiting for the refresh aren't fetched twice
+        with self._refreshing_lock:
+            sub_queries = {
+                sub_key: sub_query
+                for sub_key, sub_query in sub_queries.items()
+                if sub_key not in self._refreshing_sub_queries
+            }
+            self._refreshing_sub_queries.update(sub_queries)
+
+        if len(sub_queries) != 0:
+            self.refresh_executor.submit(self._refresh_sub_queries, sub_queries)
+
+    def _refresh_sub_queries(self, sub_queries: Dict[str, SubQueryTask]):
+        try:
+            self.prepare_clients(sub_queries.values())
+            self.fetcher.fetch(
+                partial(self.fetch_sub_query, sub_key, *sub_query)
+                for sub_key, sub_query in sub_queries.items())
+        except Exception:
+            logger.exception('Background refresh has failed')
+        finally:
+            with self._refreshing_lock:
+                self._refreshing_sub_queries.difference_update(sub_queries)
+
+    def _fetch_sub_queries(
+            self, sub_queries: Dict[str, SubQueryTask]) -> Dict[str, Tuple[Quote, ...]]:
+        """
+        Fetches all the sub-queries concurrently, failed and late ones are left out.
+        Clients are prepared by the first task, so it's bounded by the deadline too
+        """
+        fetched_quotes = {}
+        # Late tasks add their results after the deadline, they are copied under the lock
+        fetched_lock = Lock()
+        prepare = self._prepare_clients_once(sub_queries.values())
+
+        def fetch(sub_key: str, sub_query: SubQueryTask) -> Tuple[Quote, ...]:
+            prepare()
+            quotes = self.fetch_sub_query(sub_key, *sub_query)
+            with fetched_lock:
+                fetched_quotes[sub_key] = quotes
+
+            return quotes
+
+        with metrics.span('fetch'):
+            self.fetcher.fetch(
+                partial(fetch, sub_key, sub_query) for sub_key, sub_query in sub_queries.items())
+
+        with fetched_lock:
+            return dict(fetched_quotes)
+
+    async def _afetch_sub_queries(
+            self, sub_queries: Dict[str, SubQueryTask]) -> Dict[str, Tuple[Quote, ...]]:
+        fetched_quotes = {}
+        loop = asyncio.get_running_loop()
+        # Awaited by every task, the first one starts it
+        preparation = []
+
+        async def fetch(sub_key: str, sub_query: SubQueryTask) -> Tuple[Quote, ...]:
+            if len(preparation) == 0:
+                preparation.append(loop.run_in_executor(
+                    None, self._prepare_clients_once(sub_queries.values())))
+            # Cancellation of a late task mustn't cancel the preparation for the others
+            await asyncio.shield(preparation[0])
+            fetched_quotes[sub_key] = await self._afetch_sub_query(sub_key, *sub_query)
+            return fetched_quotes[sub_key]
+
+        with metrics.span('fetch'):
+            await self.fetcher.afetch(
+                partial(fetch, sub_key, sub_query) for sub_key, sub_query in sub_queries.items())
+
+        return fetched_quotes
+
+    async def _afetch_sub_query(
+            self,
+            sub_key: str,
+            client: QuotesApiClient,
+            authors: Tuple[str],
+            keywords: Tuple[str]) -> Tuple[Quote, ...]:
+        loop = asyncio.get_running_loop()
+
+        with _count_upstream_errors(client):
+            quotes = tuple(await client.aget_quotes(authors=authors, keywords=keywords))
+        await loop.run_in_executor(None, self._store_sub_query, sub_key, quotes)
+
+        return quotes
+
+    def _stream_sub_query(
+            self,
+            sub_key: str,
+            client: QuotesApiClient,
+            authors: Tuple[str],
+            keywords: Tuple[str]) -> Iterator[Tuple[Quote, ...]]:
+        """
+        Streaming variant of `fetch_sub_query`, the result is stored once all of it is fetched
+        """
+        quotes = []
+        with _count_upstream_errors(client):
+            for batch in client.iter_quotes(authors=authors, keywords=keywords):
+                quotes.extend(batch)
+                yield batch
+
+        self._store_sub_query(sub_key, tuple(dict.fromkeys(quotes)))
+
+    async def _astream_sub_query(
+            self,
+            sub_key: str,
+            client: QuotesApiClient,
+            authors: Tuple[str],
+            keywords: Tuple[str]) -> AsyncIterator[Tuple[Quote, ...]]:
+        loop = asyncio.get_running_loop()
+
+        quotes = []
+        with _count_upstream_errors(client):
+            async for batch in client.aiter_quotes(authors=authors, keywords=keywords):
+                quotes.extend(batch)
+                yield batch
+
+        await loop.run_in_executor(
+            None, self._store_sub_query, sub_key, tuple(dict.fromkeys(quotes)))
+
+    def _store_sub_query(
+            self, sub_key: str, quotes: Tuple[Quote, ...], ttl: Optional[int] = None):
+        self.cache_storage.set_cache(sub_key, quotes, ttl)
+        if self.corpus is not None:
+            self.corpus.add(quotes)
+        # Quotes are tokenized for ranking once, while they are fetched
+        self.ranker.index(quotes)
+
+    def _prepare_clients_once(self, sub_queries: Iterable[SubQueryTask]) -> Callable[[], None]:
+        """
+        :return: function preparing the clients on the first call, the concurrent calls wait
+                 for it. Failures are logged, sub-queries do the batched work on their own then
+        """
+        sub_queries = tuple(sub_queries)
+        lock = Lock()
+        is_prepared = False
+
+        def prepare():
+            nonlocal is_prepared
+            with lock:
+                if not is_prepared:
+                    is_prepared = True
+                    try:
+                        self.prepare_clients(sub_queries)
+                    except Exception:
+                        logger.exception('Preparation of the sub-queries has failed')
+
+        return prepare
+
     @staticmethod
-    def _generate_key_from_string(string: str):
-        return return_only_lower_letters(string.lower())
+    def _generate_ranked_key(key: str) -> str:
+        return f'ranked:{key}'
+
+    @classmethod
+    def _generate_sub_query_key(
+            cls, client: QuotesApiClient, authors: Tuple[str], keywords: Tuple[str]) -> str:
+        return f'raw:{client.name}:{cls._generate_query_key(authors, keywords)}'
+
+    @staticmethod
+    def _generate_query_key(authors: Tuple[str], keywords: Tuple[str]) -> str:
+        """
+        The key doesn't depend on the order of authors and keywords and keeps their roles apart.
+        Normalized terms consist of lower letters only, so the separators are unambiguous
+        """
+        def join_terms(terms: Tuple[str]) -> str:
+            return ','.join(sorted({return_only_lower_letters(term.lower()) for term in terms}))
+
+        return f'authors={join_terms(authors)};keywords={join_terms(keywords)}'
+
+
+@contextmanager
+def _count_upstream_errors(client: QuotesApiClient) -> Iterator[None]:
+    try:
+        yield
+    except Exception as error:
+        metrics.increment(
+            'upstream_errors_total', client=client.name, error=type(error).__name__)
+        raise
@@ -4,3 +4,71 @@ from os import environ
 DEFAULT_CACHE_TTL = int(environ.get('DEFAULT_CACHE_TTL', 60))  # in seconds
 REDIS_HOST = environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = int(environ.get('REDIS_PORT', 6379))
+# Connections to Redis are shared by all threads of the process
+REDIS_MAX_CONNECTIONS = int(environ.get('REDIS_MAX_CONNECTIONS', 64))
+REDIS_POOL_TIMEOUT = float(environ.get('REDIS_POOL_TIMEOUT', 5))  # in seconds, for a free one
+CACHE_COMPRESSION = environ.get('CACHE_COMPRESSION', 'true').lower() == 'true'
+# Older entries are still served, but re-fetched in the background
+CACHE_SOFT_TTL = int(environ.get('CACHE_SOFT_TTL', DEFAULT_CACHE_TTL))  # in seconds, since fetch
+
+FETCH_MAX_WORKERS = int(environ.get('FETCH_MAX_WORKERS', 16))
+FETCH_TIMEOUT = float(environ.get('FETCH_TIMEOUT', 30))  # in seconds, per request deadline
+
+BRAINYQUOTE_PAGES_CONCURRENCY = int(environ.get('BRAINYQUOTE_PAGES_CONCURRENCY', 8))
+BRAINYQUOTE_MAX_PAGES = int(environ.get('BRAINYQUOTE_MAX_PAGES', 30))  # including the first one
+
+HTTP_CONNECT_TIMEOUT = float(environ.get('HTTP_CONNECT_TIMEOUT', 3.05))  # in seconds
+HTTP_READ_TIMEOUT = float(environ.get('HTTP_READ_TIMEOUT', 10))  # in seconds
+HTTP_RETRIES = int(environ.get('HTTP_RETRIES', 2))
+HTTP_BACKOFF_FACTOR = float(environ.get('HTTP_BACKOFF_FACTOR', 0.3))
+HTTP_POOL_MAXSIZE = int(environ.get('HTTP_POOL_MAXSIZE', 32))  # keep-alive connections per host
+
+# Coalesce identical cold queries across processes and nodes with a Redis lock
+SINGLE_FLIGHT_REDIS_LOCK = environ.get('SINGLE_FLIGHT_REDIS_LOCK', 'false').lower() == 'true'
+SINGLE_FLIGHT_LOCK_TIMEOUT = float(
+    environ.get('SINGLE_FLIGHT_LOCK_TIMEOUT', 2 * FETCH_TIMEOUT))  # in seconds
+
+# In-process cache in front of Redis, its size is measured in quotes
+L1_CACHE_MAX_QUOTES = int(environ.get('L1_CACHE_MAX_QUOTES', 100000))
+# Can't outlive Redis entries, which live `DEFAULT_CACHE_TTL` seconds since the last read
+L1_CACHE_TTL = min(float(environ.get('L1_CACHE_TTL', DEFAULT_CACHE_TTL)), DEFAULT_CACHE_TTL)
+
+NAME_VALIDATOR_CACHE_SIZE = int(environ.get('NAME_VALIDATOR_CACHE_SIZE', 10000))  # in phrases
+# Share `is_person` verdicts between workers through Redis
+NAME_VALIDATOR_REDIS_CACHE = environ.get('NAME_VALIDATOR_REDIS_CACHE', 'false').lower() == 'true'
+NAME_VALIDATOR_VERDICT_TTL = int(environ.get('NAME_VALIDATOR_VERDICT_TTL', 30 * 24 * 3600))
+
+# Load models on ASGI startup instead of the first request
+PRELOAD_ON_STARTUP = environ.get('PRELOAD_ON_STARTUP', 'true').lower() == 'true'
+
+# Persistent corpus of every fetched quote, keyword results missing in Redis are looked up in it
+CORPUS_ENABLED = environ.get('CORPUS_ENABLED', 'false').lower() == 'true'
+CORPUS_PATH = environ.get('CORPUS_PATH', 'quotes_corpus.sqlite3')
+
+RANKING_MAX_QUOTES = int(environ.get('RANKING_MAX_QUOTES', 100000))  # tokenized quotes kept
+LEMMAS_CACHE_SIZE = int(environ.get('LEMMAS_CACHE_SIZE', 100000))  # in words
+
+WIKIQUOTE_PARSER = environ.get('WIKIQUOTE_PARSER', 'lxml')  # lxml or soup
+# Parsing, NER and tokenization run in that many worker processes, 0 keeps them in the threads
+CPU_WORKER_PROCESSES = int(environ.get('CPU_WORKER_PROCESSES', 0))
+
+# Most requested queries are re-fetched before they become stale
+HOT_QUERIES_REFRESH = environ.get('HOT_QUERIES_REFRESH', 'false').lower() == 'true'
+HOT_QUERIES_COUNT = int(environ.get('HOT_QUERIES_COUNT', 100))
+HOT_QUERIES_REFRESH_INTERVAL = float(environ.get('HOT_QUERIES_REFRESH_INTERVAL', 10))  # in seconds
+# Results fresh for less than that are re-fetched, at most half of `CACHE_SOFT_TTL`
+HOT_QUERIES_REFRESH_AHEAD = float(
+    environ.get('HOT_QUERIES_REFRESH_AHEAD', min(HOT_QUERIES_REFRESH_INTERVAL, CACHE_SOFT_TTL / 2)))
+HOT_QUERIES_DECAY = float(environ.get('HOT_QUERIES_DECAY', 0.9))  # of request counts per round
+# Decayed request count making a query hot, a query requested once isn't
+HOT_QUERIES_MIN_REQUESTS = float(environ.get('HOT_QUERIES_MIN_REQUESTS', 5))
+
+SUGGESTIONS_BATCH_MAX_QUERIES = int(environ.get('SUGGESTIONS_BATCH_MAX_QUERIES', 50))
+
+# Stage latency histograms and counters of the process, served by `/metrics`
+METRICS_ENABLED = environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+# Requests with `X-Server-Timing: 1` header get durations of their stages in `Server-Timing`
+SERVER_TIMING = environ.get('SERVER_TIMING', 'false').lower() == 'true'
+
+# Results stored by the warm-up live that long until the first read, in seconds
+WARMUP_CACHE_TTL = int(environ.get('WARMUP_CACHE_TTL', 24 * 3600))
@@ -0,0 +1,84 @@
+"""
+Loads heavy components of the service ahead of the first request.
+Pre-fork servers call `preload` in the master process, so workers share the model memory
+copy-on-write. `python -m quotes_suggestions_service.startup` prints the startup-time report
+"""
+import logging
+from importlib import import_module
+from time import perf_counter
+from typing import Callable, Dict
+
+
+logger = logging.getLogger(__name__)
+
+
+def preload() -> Dict[str, float]:
+    """
+    Loads every component and returns its load time in seconds, in the order of loading
+    """
+    timings = {
+        'service modules': _measure(
+            lambda: import_module('quotes_suggestions_service.quotes_generator')),
+    }
+    if not _uses_worker_processes():
+        # Otherwise persons are detected by the worker processes, which load the models
+        timings['spaCy models'] = _measure(_load_name_validators)
+    timings.update({
+        'NLTK stop words': _measure(_load_stop_words),
+        'NLTK tokenizer': _measure(_load_tokenizer),
+        'NLTK lemmatizer': _measure(_load_lemmatizer),
+    })
+
+    for component, seconds in timings.items():
+        logger.info('Loaded %s in %.3f s', component, seconds)
+    logger.info('Startup took %.3f s', sum(timings.values()))
+
+    return timings
+
+
+def _uses_worker_processes() -> bool:
+    from quotes_suggestions_service.utils.process_pool import process_pool
+
+    return process_pool.enabled
+
+
+def _load_name_validators():
+    from quotes_suggestions_service.utils import NAME_VALIDATORS_MAPPING
+
+    for validator in NAME_VALIDATORS_MAPPING.values():
+        validator.load()
+
+
+def _load_stop_words():
+    from quotes_suggestions_service.quotes_generator import QuotesGenerator
+
+    QuotesGenerator.load_stop_words()
+
+
+def _load_tokenizer():
+    from nltk import word_tokenize
+
+    # The punkt model is read from disk on the first call
+    word_tokenize('Warm up.')
+
+
+def _load_lemmatizer():
+    from quotes_suggestions_service.quotes_generator import QuotesGenerator
+
+    # WordNet is read from disk on the first call
+    QuotesGenerator._lemmatize('warming')
+
+
+def _measure(load: Callable[[], object]) -> float:
+    started_at = perf_counter()
+    load()
+
+    return perf_counter() - started_at
+
+
+if __name__ == '__main__':
+    report = preload()
+
+    for name, duration in report.items():
+        print(f'{name:20} {duration:8.3f} s')
+    print(f'{"total":20} {sum(report.values()):8.3f} s')
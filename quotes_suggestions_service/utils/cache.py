@@ -1,58 +1,302 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
 from datetime import timedelta
-from dataclasses import asdict
-from json import dumps, loads
-from typing import Tuple, Optional
+from functools import partial
+from time import monotonic
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Set, Tuple, Optional
 
-from redis import Redis
+from redis.exceptions import LockError
+from redis.lock import Lock
 
-from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.clients.dtos import Quote, QUOTE_FORMAT_VERSION
+from quotes_suggestions_service.utils.metrics import OperationsStats, metrics
+from quotes_suggestions_service.utils.redis_client import get_redis
+
+
+LOCK_POLL_INTERVAL = 0.1  # in seconds
+EMPTY_RESULT_MARKER = b''
+REQUESTS_COUNTER_KEY = 'requests'
 
 
 class TemporaryQuotesStorage:
+    """
+    Entries live `cache_ttl` seconds since the last read (the hard TTL)
+    and are fresh for `soft_ttl` seconds since they were written.
+    Freshness is kept in a companion key expiring with the soft TTL.
+    Every operation is one round trip over the connection pool shared by the process,
+    their latencies are collected in `stats`
+    """
 
-    def __init__(self, host: str, port: int, cache_ttl: int):
-        self.storage = Redis(host=host, port=port)
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            cache_ttl: int,
+            compress: bool = True,
+            soft_ttl: Optional[int] = None):
+        self.storage = get_redis(host, port)
+        self.stats = OperationsStats(stage='redis')
         self.cache_ttl = cache_ttl  # in seconds
+        self.soft_ttl = soft_ttl if soft_ttl is not None else cache_ttl  # in seconds
+        self.compress = compress
 
-    def set_cache(self, key: int, values: Tuple[Quote, ...]) -> bool:
+    def set_cache(self, key: int, values: Tuple[Quote, ...], ttl: Optional[int] = None) -> bool:
+        """
+        Quotes are stored as a Redis list, one element per quote,
+        so a page of them can be read without loading the others
+        :param ttl: in seconds until the first read, `cache_ttl` if it isn't passed
+        """
+        storage_key = self._get_storage_key(key)
+        # Redis can't store an empty list, the marker keeps empty results cached too
+        values = [value.to_bytes(self.compress) for value in values] or [EMPTY_RESULT_MARKER]
+        ttl = ttl if ttl is not None else self.cache_ttl
 
-        values = dumps({num: asdict(value) for num, value in enumerate(values)})
+        pipeline = self.storage.pipeline()
+        pipeline.delete(storage_key)
+        pipeline.rpush(storage_key, *values)
+        pipeline.expire(storage_key, timedelta(seconds=ttl))
+        pipeline.set(
+            self._get_freshness_key(key), 1, ex=timedelta(seconds=min(self.soft_ttl, ttl)))
+        with self.stats.time('set_cache'):
+            pipeline.execute()
 
-        return self.storage.setex(
-            name=key,
-            time=timedelta(seconds=self.cache_ttl),
-            value=values)
+        return True
 
     def get_cache(
             self,
             key: int,
             limit: Optional[int] = None,
             offset: Optional[int] = None) -> Tuple[Quote, ...]:
+        """
+        Reads `limit` quotes starting from `offset`, all of them if `limit` isn't passed.
+        Only the requested slice is transferred and decoded
+        """
+        if limit is not None and limit <= 0:
+            return ()
 
-        if self.key_in_cache(key):
-            self.storage.expire(key, time=self.cache_ttl)  # extend key ttl after each call
-            data_from_storage = dict(loads(self.storage.get(key)))
-
-            if limit is not None and offset is not None \
-                    and limit+offset <= len(data_from_storage):
-                data_from_storage = tuple(
-                    data_from_storage[str(index)]  # Redis returns keys as string
-                    for index in range(offset, limit+offset)
-                )
-            else:
-                data_from_storage = data_from_storage.values()
-
-            quotes = tuple(
-                Quote(**raw_quote)
-                for raw_quote in data_from_storage
-            )
-        else:
-            quotes = ()
+        storage_key = self._get_storage_key(key)
+        start = max(offset or 0, 0)
+        end = start + limit - 1 if limit is not None else -1
+
+        pipeline = self.storage.pipeline(transaction=False)
+        pipeline.lrange(storage_key, start, end)
+        pipeline.expire(storage_key, time=self.cache_ttl)  # extend key ttl after each call
+        with self.stats.time('get_cache'):
+            raw_quotes, _ = pipeline.execute()
+
+        quotes = tuple(
+            Quote.from_bytes(raw_quote)
+            for raw_quote in raw_quotes
+            if raw_quote != EMPTY_RESULT_MARKER
+        )
 
         return quotes
 
+    def get_fresh_cache(
+            self,
+            key: int,
+            limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Optional[Tuple[Quote, ...]]:
+        """
+        Variant of `get_cache` for entries which mustn't be served past the soft TTL,
+        e.g. ranked quotes of a query. Reads don't extend the entry
+        :return: None if the entry is missing or stale
+        """
+        if limit is not None and limit <= 0:
+            return ()
+
+        start = max(offset or 0, 0)
+        end = start + limit - 1 if limit is not None else -1
+
+        pipeline = self.storage.pipeline(transaction=False)
+        pipeline.exists(self._get_freshness_key(key))
+        pipeline.lrange(self._get_storage_key(key), start, end)
+        with self.stats.time('get_fresh_cache'):
+            is_fresh, raw_quotes = pipeline.execute()
+
+        if not is_fresh:
+            return None
+
+        return tuple(
+            Quote.from_bytes(raw_quote)
+            for raw_quote in raw_quotes
+            if raw_quote != EMPTY_RESULT_MARKER
+        )
+
+    def get_many(self, keys: Iterable[int]) -> Dict[int, Tuple[Quote, ...]]:
+        """
+        Reads all quotes of every cached key in one round trip, missing keys are left out
+        """
+        quotes, _ = self.get_many_with_stale_keys(keys)
+
+        return quotes
+
+    def get_many_with_stale_keys(
+            self, keys: Iterable[int]) -> Tuple[Dict[int, Tuple[Quote, ...]], Set[int]]:
+        """
+        Variant of `get_many` telling which of the cached keys are past the soft TTL
+        :return: (quotes of cached keys, stale keys)
+        """
+        keys = tuple(keys)
+        if len(keys) == 0:
+            return {}, set()
+
+        pipeline = self.storage.pipeline(transaction=False)
+        for key in keys:
+            pipeline.lrange(self._get_storage_key(key), 0, -1)
+            pipeline.expire(self._get_storage_key(key), time=self.cache_ttl)
+            pipeline.exists(self._get_freshness_key(key))
+        with self.stats.time('get_many'):
+            results = pipeline.execute()
+
+        # A cached key always has at least one element, the empty result has the marker
+        quotes = {
+            key: tuple(
+                Quote.from_bytes(raw_quote)
+                for raw_quote in raw_quotes
+                if raw_quote != EMPTY_RESULT_MARKER)
+            for key, raw_quotes in zip(keys, results[::3])
+            if len(raw_quotes) != 0
+        }
+        stale_keys = {
+            key for key, is_fresh in zip(keys, results[2::3]) if key in quotes and not is_fresh}
+
+        for result, count in (
+                ('hit', len(quotes) - len(stale_keys)),
+                ('stale', len(stale_keys)),
+                ('miss', len(keys) - len(quotes))):
+            metrics.increment('cache_requests_total', count, cache='redis', result=result)
+
+        return quotes, stale_keys
+
+    def get_fresh_ttls(self, keys: Iterable[int]) -> Dict[int, float]:
+        """
+        Seconds left until every key becomes stale, 0 for stale and missing keys
+        """
+        keys = tuple(keys)
+        pipeline = self.storage.pipeline(transaction=False)
+        for key in keys:
+            pipeline.pttl(self._get_freshness_key(key))
+        with self.stats.time('get_fresh_ttls'):
+            ttls = pipeline.execute()
+
+        return {key: max(ttl, 0) / 1000 for key, ttl in zip(keys, ttls)}
+
+    def get_ttls(self, keys: Iterable[int]) -> Dict[int, float]:
+        """
+        Seconds left until every key expires, 0 for missing keys
+        """
+        keys = tuple(keys)
+        pipeline = self.storage.pipeline(transaction=False)
+        for key in keys:
+            pipeline.pttl(self._get_storage_key(key))
+        with self.stats.time('get_ttls'):
+            ttls = pipeline.execute()
+
+        return {key: max(ttl, 0) / 1000 for key, ttl in zip(keys, ttls)}
+
+    def count_requests(self, counts: Dict[str, int]):
+        """
+        Adds request counts of queries to the counter shared by all processes
+        """
+        if len(counts) == 0:
+            return
+
+        pipeline = self.storage.pipeline(transaction=False)
+        for member, count in counts.items():
+            pipeline.zincrby(self._get_storage_key(REQUESTS_COUNTER_KEY), count, member)
+        with self.stats.time('count_requests'):
+            pipeline.execute()
+
+    def get_most_requested(
+            self,
+            count: int,
+            decay: float = 1,
+            min_score: float = 0,
+            min_requests: float = 0) -> List[str]:
+        """
+        Returns the `count` most requested queries with counts of at least `min_requests`,
+        then multiplies all the counts by `decay` and forgets queries whose counts
+        have fallen below `min_score`
+        """
+        counter_key = self._get_storage_key(REQUESTS_COUNTER_KEY)
+
+        pipeline = self.storage.pipeline()
+        pipeline.zrevrangebyscore(counter_key, '+inf', min_requests, start=0, num=count)
+        pipeline.zunionstore(counter_key, {counter_key: decay})
+        pipeline.zremrangebyscore(counter_key, '-inf', f'({min_score}')
+        with self.stats.time('get_most_requested'):
+            members = pipeline.execute()[0]
+
+        return [member.decode() for member in members]
+
+    def try_lock(self, key: str, timeout: float) -> bool:
+        """
+        Takes the lock without waiting, it isn't released and expires after `timeout` seconds,
+        so one process takes it once per `timeout`
+        """
+        return self._get_lock(key, timeout).acquire(blocking=False)
+
     def key_in_cache(self, key: int) -> bool:
-        return bool(self.storage.exists(key))
+        with self.stats.time('key_in_cache'):
+            return bool(self.storage.exists(self._get_storage_key(key)))
+
+    @contextmanager
+    def lock(self, key: int, timeout: float) -> Iterator[bool]:
+        """
+        Distributed lock of the key, shared by all processes using the storage.
+        Waits for the lock at most `timeout` seconds and yields whether it has been acquired,
+        the acquired lock expires after `timeout` seconds if the holder has died
+        """
+        lock = self._get_lock(key, timeout)
+        is_acquired = lock.acquire(blocking_timeout=timeout)
+
+        try:
+            yield is_acquired
+        finally:
+            if is_acquired:
+                self._release_lock(lock)
+
+    @asynccontextmanager
+    async def alock(self, key: int, timeout: float) -> AsyncIterator[bool]:
+        """
+        Asynchronous variant of `lock`.
+        The lock is polled, so waiting for it doesn't hold a thread of the executor
+        """
+        loop = asyncio.get_running_loop()
+        lock = self._get_lock(key, timeout)
+        give_up_at = monotonic() + timeout
+
+        is_acquired = await loop.run_in_executor(None, partial(lock.acquire, blocking=False))
+        while not is_acquired and monotonic() < give_up_at:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            is_acquired = await loop.run_in_executor(None, partial(lock.acquire, blocking=False))
+
+        try:
+            yield is_acquired
+        finally:
+            if is_acquired:
+                await loop.run_in_executor(None, self._release_lock, lock)
 
     def reset_cache(self):
         self.storage.flushdb()
+
+    @staticmethod
+    def _get_storage_key(key: int) -> str:
+        # Namespaced by the format version, so entries of other layouts are never decoded
+        return f'quotes:v{QUOTE_FORMAT_VERSION}:{key}'
+
+    @classmethod
+    def _get_freshness_key(cls, key: int) -> str:
+        return f'{cls._get_storage_key(key)}:fresh'
+
+    def _get_lock(self, key: int, timeout: float) -> Lock:
+        # Not thread-local: the async lock is acquired and released in different threads
+        return self.storage.lock(f'lock:{key}', timeout=timeout, thread_local=False)
+
+    @staticmethod
+    def _release_lock(lock: Lock):
+        try:
+            lock.release()
+        except LockError:
+            pass  # The lock has expired and may be held by another process
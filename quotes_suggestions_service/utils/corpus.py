@@ -0,0 +1,116 @@
+import sqlite3
+from threading import local
+from typing import Callable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from quotes_suggestions_service.clients.dtos import Quote
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS quotes ('
+    ' id INTEGER PRIMARY KEY,'
+    ' identity TEXT NOT NULL UNIQUE,'
+    ' quote TEXT NOT NULL,'
+    ' author TEXT NOT NULL,'
+    ' description TEXT)',
+    'CREATE TABLE IF NOT EXISTS postings ('
+    ' token TEXT NOT NULL,'
+    ' quote_id INTEGER NOT NULL,'
+    ' PRIMARY KEY (token, quote_id)) WITHOUT ROWID',
+)
+BUSY_TIMEOUT = 5  # in seconds, how long a writer waits for another process
+
+
+class QuotesCorpus:
+    """
+    File-backed store of every fetched quote with an inverted index of the words of their texts.
+    Words are produced by `analyze_many`, e.g. the lemmatizing analyzer of the ranker,
+    so keywords match the quotes the way they are ranked. Authors aren't indexed.
+    Quotes are deduplicated the way `Quote.__eq__` compares them.
+    Every thread has its own connection, the WAL journal lets processes read while one writes
+    """
+
+    def __init__(self, path: str, analyze_many: Callable[[Tuple[str, ...]], List[Sequence[str]]]):
+        self.path = path
+        self.analyze_many = analyze_many
+        self._local = local()
+
+    def add(self, quotes: Iterable[Quote]) -> int:
+        """
+        Stores and indexes quotes which aren't in the corpus yet
+        :return: number of new quotes
+        """
+        connection = self._get_connection()
+        # Only new quotes are analyzed, before the write transaction is started
+        new_quotes = [
+            quote
+            for quote in dict.fromkeys(quotes)
+            if connection.execute(
+                'SELECT 1 FROM quotes WHERE identity = ?', (quote.key, )).fetchone() is None
+        ]
+        if len(new_quotes) == 0:
+            return 0
+
+        words = self.analyze_many(tuple(quote.quote for quote in new_quotes))
+        added = 0
+
+        with connection:
+            for quote, quote_words in zip(new_quotes, words):
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO quotes (identity, quote, author, description) '
+                    'VALUES (?, ?, ?, ?)',
+                    (quote.key, quote.quote, quote.author, quote.description))
+
+                if cursor.rowcount == 1:
+                    added += 1
+                    connection.executemany(
+                        'INSERT OR IGNORE INTO postings (token, quote_id) VALUES (?, ?)',
+                        ((token, cursor.lastrowid) for token in set(quote_words)))
+
+        return added
+
+    def search(self, keywords: Iterable[str]) -> Optional[Set[Quote]]:
+        """
+        Finds quotes containing all words of any of the keywords
+        :return: None if some keyword has no quotes in the corpus
+        """
+        keywords = tuple(keywords)
+        if len(keywords) == 0:
+            return None
+
+        connection = self._get_connection()
+        quotes = set()
+
+        for keyword_words in self.analyze_many(keywords):
+            tokens = tuple(set(keyword_words))
+            if len(tokens) == 0:
+                return None
+
+            rows = connection.execute(
+                'SELECT quote, author, description FROM quotes WHERE id IN ('
+                ' SELECT quote_id FROM postings WHERE token IN ({})'
+                ' GROUP BY quote_id HAVING COUNT(*) = ?)'.format(', '.join('?' * len(tokens))),
+                (*tokens, len(tokens))).fetchall()
+            if len(rows) == 0:
+                return None
+
+            quotes.update(Quote(*row) for row in rows)
+
+        return quotes
+
+    def count(self) -> int:
+        return self._get_connection().execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the service doesn't touch the file
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            self._local.connection = connection
+
+        return connection
@@ -5,3 +5,11 @@ class Localization(StringEnum):
 
     ENGLISH = 'en'
     RUSSIAN = 'ru'
+
+
+class ResponseMode(StringEnum):
+
+    FULL = 'full'  # all the quotes are fetched and ranked
+    EARLY = 'early'  # answered once there are enough matches
+    NDJSON = 'ndjson'  # streamed as newline-delimited JSON
+    SSE = 'sse'  # streamed as server-sent events
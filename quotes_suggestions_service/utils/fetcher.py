@@ -0,0 +1,284 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextvars import copy_context
+from functools import partial
+from queue import Empty, Queue
+from time import monotonic
+from typing import (
+    AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Set, Tuple,
+)
+
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.clients.transport import fetch_deadline
+from quotes_suggestions_service.utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+FetchTask = Callable[[], Iterable[Quote]]
+AsyncFetchTask = Callable[[], Awaitable[Iterable[Quote]]]
+# Streaming tasks produce quotes in batches, e.g. one batch per upstream page
+StreamTask = Callable[[], Iterable[Iterable[Quote]]]
+AsyncStreamTask = Callable[[], AsyncIterable[Iterable[Quote]]]
+
+
+class ConcurrentFetcher:
+    """
+    Runs upstream fetch tasks on a bounded pool of threads
+    and merges their results as soon as they arrive.
+    Tasks of one call share the deadline `timeout` seconds after they are submitted,
+    so tasks still waiting for a free worker by then are dropped as the running ones
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='quotes-fetcher')
+        self.timeout = timeout  # in seconds
+        # Streaming tasks outlive their iterators, references keep them from being collected
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    def fetch(self, tasks: Iterable[FetchTask]) -> Tuple[Set[Quote], bool]:
+        """
+        :return: (merged quotes, whether all tasks have finished before the deadline)
+        """
+        quotes = set()
+        results = self.iter_results(tasks)
+
+        for batch in results:
+            quotes.update(batch)
+
+        return quotes, results.is_complete
+
+    async def afetch(self, tasks: Iterable[AsyncFetchTask]) -> Tuple[Set[Quote], bool]:
+        """
+        Asynchronous variant of `fetch`, the pool is bounded by a semaphore instead of threads
+        :return: (merged quotes, whether all tasks have finished before the deadline)
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def run(task: AsyncFetchTask) -> Iterable[Quote]:
+            async with semaphore:
+                return await task()
+
+        # The time spent waiting for the semaphore counts against the deadline too
+        results = await asyncio.gather(
+            *(asyncio.wait_for(run(task), timeout=self.timeout) for task in tasks),
+            return_exceptions=True)
+
+        quotes = set()
+        is_complete = True
+        for result in results:
+            if isinstance(result, asyncio.TimeoutError):
+                is_complete = False
+                metrics.increment('fetch_deadlines_exceeded_total')
+                logger.warning('Fetch deadline of %s seconds is exceeded', self.timeout)
+            elif isinstance(result, Exception):
+                is_complete = False
+                logger.error('Upstream fetch task has failed', exc_info=result)
+            else:
+                quotes.update(result)
+
+        return quotes, is_complete
+
+    def iter_results(self, tasks: Iterable[FetchTask]) -> 'FetchResultsIterator':
+        deadline = monotonic() + self.timeout
+        runs = [DeadlineBoundTask(task, deadline) for task in tasks]
+
+        return FetchResultsIterator(
+            {self.executor.submit(copy_context().run, run): run for run in runs})
+
+    def iter_batches(self, tasks: Iterable[StreamTask]) -> 'FetchBatchesIterator':
+        """
+        Streaming variant of `iter_results`: yields every batch of quotes as soon as
+        a task produces it. Tasks aren't cancelled, when the iterator is closed,
+        so they keep fetching, e.g. into the cache, after the caller has got enough quotes
+        """
+        batches = Queue()
+        runs = {}
+        deadline = monotonic() + self.timeout
+        for task in tasks:
+            run = DeadlineBoundTask(partial(_put_batches, task, batches), deadline)
+            runs[task] = run
+            self.executor.submit(copy_context().run, run)
+
+        return FetchBatchesIterator(runs, batches)
+
+    def aiter_batches(self, tasks: Iterable[AsyncStreamTask]) -> AsyncIterator[Tuple[Quote, ...]]:
+        """
+        Asynchronous variant of `iter_batches`, the tasks are started before the iteration.
+        Yields batches until all the tasks have finished, failed or missed the deadline
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+        batches = asyncio.Queue()
+
+        async def put_batches(task: AsyncStreamTask):
+            async for batch in task():
+                batches.put_nowait(tuple(batch))
+
+        async def put_bounded_batches(task: AsyncStreamTask):
+            async with semaphore:
+                await put_batches(task)
+
+        async def run(task: AsyncStreamTask):
+            try:
+                await asyncio.wait_for(put_bounded_batches(task), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                metrics.increment('fetch_deadlines_exceeded_total')
+                logger.warning('Fetch deadline of %s seconds is exceeded', self.timeout)
+            except Exception:
+                logger.exception('Upstream fetch task has failed')
+            finally:
+                batches.put_nowait(None)
+
+        runs = [asyncio.ensure_future(run(task)) for task in tasks]
+        self._background_tasks.update(runs)
+        for future in runs:
+            future.add_done_callback(self._background_tasks.discard)
+
+        return _aiter_batches(batches, len(runs))
+
+
+class DeadlineBoundTask:
+    """
+    Task with the deadline of its request, `time.monotonic` moment set when it's submitted.
+    HTTP calls of the task are bounded by the deadline through `fetch_deadline`,
+    so a task which has missed it releases its worker after at most one in-flight call
+    and a task which has waited in the queue until the deadline doesn't make any
+    """
+
+    def __init__(self, task: FetchTask, deadline: float):
+        self.task = task
+        self.deadline = deadline
+
+    def __call__(self) -> Iterable[Quote]:
+        fetch_deadline.set(self.deadline)  # The task runs in its own copy of the context
+
+        return self.task()
+
+    def is_expired(self, now: float) -> bool:
+        return self.deadline <= now
+
+
+class FetchResultsIterator:
+    """
+    Yields results of the submitted tasks in order of completion until their deadlines.
+    Failed tasks are logged and skipped, so one broken upstream doesn't fail the whole request
+    """
+
+    def __init__(self, runs_by_future):
+        self.is_complete = True
+        self._iterator = self._iterate(runs_by_future)
+
+    def __iter__(self) -> Iterator[Tuple[Quote, ...]]:
+        return self._iterator
+
+    def __next__(self) -> Tuple[Quote, ...]:
+        return next(self._iterator)
+
+    def _iterate(self, runs_by_future) -> Iterator[Tuple[Quote, ...]]:
+        pending = set(runs_by_future)
+
+        try:
+            while len(pending) != 0:
+                done, pending = wait(
+                    pending, timeout=self._get_wait_timeout(pending, runs_by_future),
+                    return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    try:
+                        yield tuple(future.result())
+                    except Exception:
+                        self.is_complete = False
+                        logger.exception('Upstream fetch task has failed')
+
+                now = monotonic()
+                expired = {future for future in pending if runs_by_future[future].is_expired(now)}
+                if len(expired) != 0:
+                    self.is_complete = False
+                    pending -= expired
+                    metrics.increment('fetch_deadlines_exceeded_total', len(expired))
+                    logger.warning('Fetch deadline is exceeded, %d tasks are dropped', len(expired))
+        finally:
+            for future in runs_by_future:
+                future.cancel()
+
+    @staticmethod
+    def _get_wait_timeout(pending, runs_by_future) -> float:
+        return _get_wait_timeout([runs_by_future[future] for future in pending])
+
+
+class FetchBatchesIterator:
+    """
+    Yields batches of quotes put by the streaming tasks in order of arrival until their deadlines.
+    A task puts its batches and then a `None` or the error it has failed with
+    """
+
+    def __init__(self, runs: Dict[StreamTask, DeadlineBoundTask], batches: Queue):
+        self.is_complete = True
+        self._iterator = self._iterate(runs, batches)
+
+    def __iter__(self) -> Iterator[Tuple[Quote, ...]]:
+        return self._iterator
+
+    def __next__(self) -> Tuple[Quote, ...]:
+        return next(self._iterator)
+
+    def _iterate(
+            self,
+            runs: Dict[StreamTask, DeadlineBoundTask],
+            batches: Queue) -> Iterator[Tuple[Quote, ...]]:
+        pending = set(runs)
+
+        while len(pending) != 0:
+            try:
+                task, batch = batches.get(
+                    timeout=_get_wait_timeout([runs[task] for task in pending]))
+            except Empty:
+                task, batch = None, None
+
+            if task not in pending:
+                pass  # The task has already missed the deadline
+            elif isinstance(batch, Exception):
+                self.is_complete = False
+                pending.discard(task)
+                logger.error('Upstream fetch task has failed', exc_info=batch)
+            elif batch is None:
+                pending.discard(task)
+            else:
+                yield batch
+
+            now = monotonic()
+            expired = {task for task in pending if runs[task].is_expired(now)}
+            if len(expired) != 0:
+                self.is_complete = False
+                pending -= expired
+                metrics.increment('fetch_deadlines_exceeded_total', len(expired))
+                logger.warning('Fetch deadline is exceeded, %d tasks are dropped', len(expired))
+
+
+def _put_batches(task: StreamTask, batches: Queue):
+    try:
+        for batch in task():
+            batches.put((task, tuple(batch)))
+    except Exception as error:
+        batches.put((task, error))
+    else:
+        batches.put((task, None))
+
+
+def _get_wait_timeout(runs: Iterable[DeadlineBoundTask]) -> float:
+    return max(min(run.deadline for run in runs) - monotonic(), 0)
+
+
+async def _aiter_batches(batches: asyncio.Queue, count: int) -> AsyncIterator[Tuple[Quote, ...]]:
+    """
+    Yields batches put by `count` tasks, every task puts a `None` when it's done
+    """
+    while count != 0:
+        batch = await batches.get()
+        if batch is None:
+            count -= 1
+        else:
+            yield batch
@@ -1,5 +1,116 @@
 import re
+from json import dumps
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+
+from quotes_suggestions_service.setting import SERVER_TIMING
+from quotes_suggestions_service.utils.enums import ResponseMode
+
+
+STREAM_CONTENT_TYPES = {
+    ResponseMode.NDJSON: 'application/x-ndjson',
+    ResponseMode.SSE: 'text/event-stream',
+}
+
+SERVER_TIMING_REQUEST_HEADER = 'X-Server-Timing'
+
+NOT_LOWER_LETTERS = re.compile('[^a-z]')
 
 
 def return_only_lower_letters(string: str):
-    return re.sub('[^a-z]', '', string)
+    return NOT_LOWER_LETTERS.sub('', string)
+
+
+def parse_suggestions_arguments(
+        arguments: Mapping[str, str]) -> Tuple[Tuple[str, ...], Tuple[str, ...], int, int]:
+    """
+    Parses `/suggestions` URI-parameters
+    :return: (authors, keywords, limit, offset)
+    """
+    keywords = arguments.get('keywords')
+    authors = arguments.get('authors')
+    limit = int(arguments.get('limit', 5))
+    offset = int(arguments.get('offset', 0))
+
+    keywords = tuple(keyword.strip() for keyword in keywords.split(',')) \
+        if keywords is not None else ()
+    authors = tuple(keyword.strip() for keyword in authors.split(',')) \
+        if authors is not None else ()
+
+    if len(authors) == 0 and len(keywords) == 0:
+        raise ValueError('"authors" or "keywords" URI-parameters should be passed')
+
+    return authors, keywords, limit, offset
+
+
+def parse_batch_suggestions_arguments(
+        body: Any,
+        max_queries: int) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], int, int]]:
+    """
+    Parses `/suggestions/batch` JSON body: {"queries": [{"id": ..., "authors": ..., ...}, ...]}.
+    Queries have the same parameters as `/suggestions`, lists are accepted too.
+    Ids of queries are their positions by default
+    :return: [(id, authors, keywords, limit, offset), ...]
+    """
+    queries = body.get('queries') if isinstance(body, dict) else None
+    if not isinstance(queries, list) or len(queries) == 0:
+        raise ValueError('"queries" list should be passed')
+    if len(queries) > max_queries:
+        raise ValueError(f'At most {max_queries} queries can be passed')
+
+    parsed_queries = []
+    for position, query in enumerate(queries):
+        if not isinstance(query, dict):
+            raise ValueError('Every query should be an object')
+
+        arguments = {
+            name: ','.join(map(str, value)) if isinstance(value, list) else str(value)
+            for name, value in query.items()
+        }
+        parsed_queries.append(
+            (arguments.get('id', str(position)), *parse_suggestions_arguments(arguments)))
+
+    if len({query[0] for query in parsed_queries}) != len(parsed_queries):
+        raise ValueError('Ids of queries should be unique')
+
+    return parsed_queries
+
+
+def parse_response_mode(arguments: Mapping[str, str]) -> ResponseMode:
+    """
+    Parses `mode` URI-parameter of `/suggestions`
+    """
+    modes = tuple(mode.value for mode in ResponseMode)
+    mode = arguments.get('mode', ResponseMode.FULL.value)
+    if mode not in modes:
+        raise ValueError(f'"mode" URI-parameter should be one of: {", ".join(modes)}')
+
+    mode = ResponseMode(mode)
+    # Streamed quotes are ranked batch by batch, so there is no order to take an offset in
+    if mode in STREAM_CONTENT_TYPES and int(arguments.get('offset', 0)) != 0:
+        raise ValueError('"offset" URI-parameter isn\'t supported by streaming modes')
+
+    return mode
+
+
+def encode_stream_items(mode: ResponseMode, items: Iterable[Any]) -> bytes:
+    """
+    Encodes JSON-serializable items as NDJSON lines or `quote` server-sent events.
+    Keys are sorted as Flask `jsonify` does, so all the responses have the same payload
+    """
+    if mode is ResponseMode.SSE:
+        return ''.join(
+            f'event: quote\ndata: {dumps(item, sort_keys=True)}\n\n' for item in items).encode()
+
+    return ''.join(f'{dumps(item, sort_keys=True)}\n' for item in items).encode()
+
+
+def encode_stream_end(mode: ResponseMode) -> bytes:
+    # Event sources reconnect to ended streams, the `end` event tells them not to
+    return b'event: end\ndata: {}\n\n' if mode is ResponseMode.SSE else b''
+
+
+def is_server_timing_requested(header: Optional[str]) -> bool:
+    """
+    :param header: value of `SERVER_TIMING_REQUEST_HEADER` of the request
+    """
+    return SERVER_TIMING and header is not None and header.strip().lower() in ('1', 'true')
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+from collections import Counter
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional, Tuple
+
+from quotes_suggestions_service.utils.cache import TemporaryQuotesStorage
+
+
+logger = logging.getLogger(__name__)
+
+Query = Tuple[Tuple[str, ...], Tuple[str, ...]]  # (authors, keywords)
+
+SCHEDULER_LOCK_KEY = 'hot-queries-refresh'
+FORGOTTEN_SCORE = 0.5  # decayed counts below it are dropped from the counter
+# Results are refreshed at most this share of the soft TTL before they become stale,
+# otherwise every refresh of a hot query is followed by the next one too soon
+MAX_REFRESH_AHEAD_SHARE = 0.5
+
+
+class HotQueriesScheduler:
+    """
+    Counts requests of queries and periodically passes the most requested ones to `refresh`,
+    which renews their results before they become stale.
+    Counts are accumulated in the process and added to the counter in Redis once per round,
+    the counter decays every round, so it follows recent popularity.
+    Every process runs the scheduler, but only one of them refreshes in each round.
+    Queries are hot with at least `min_requests` decayed requests, results of them
+    which become stale in less than `refresh_ahead` seconds are refreshed
+    """
+
+    def __init__(
+            self,
+            storage: TemporaryQuotesStorage,
+            refresh: Callable[[List[Query]], None],
+            count: int,
+            interval: float,
+            decay: float,
+            min_requests: float,
+            refresh_ahead: float):
+        if refresh_ahead > storage.soft_ttl * MAX_REFRESH_AHEAD_SHARE:
+            raise ValueError(
+                f'Refresh ahead of {refresh_ahead} seconds is longer than '
+                f'{MAX_REFRESH_AHEAD_SHARE:.0%} of the soft TTL of {storage.soft_ttl} seconds')
+
+        self.storage = storage
+        self.refresh = refresh
+        self.count = count
+        self.interval = interval  # in seconds
+        self.decay = decay
+        self.min_requests = min_requests
+        self.refresh_ahead = refresh_ahead  # in seconds
+
+        self._lock = Lock()
+        self._counts = Counter()
+        self._pid: Optional[int] = None
+        self._stopped = Event()
+
+    def record(self, authors: Tuple[str, ...], keywords: Tuple[str, ...]):
+        """
+        Counts a request of the query, the scheduler is started with the first one
+        """
+        member = json.dumps([sorted(set(authors)), sorted(set(keywords))])
+
+        with self._lock:
+            self._counts[member] += 1
+            # Threads don't survive fork, so every worker starts its own
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopped.clear()
+                Thread(target=self._run, name='hot-queries-refresh', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run_round(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+
+        self.storage.count_requests(counts)
+
+        if not self.storage.try_lock(SCHEDULER_LOCK_KEY, timeout=self.interval):
+            return
+
+        members = self.storage.get_most_requested(
+            self.count, self.decay, FORGOTTEN_SCORE, self.min_requests)
+        queries = [
+            (tuple(authors), tuple(keywords))
+            for authors, keywords in map(json.loads, members)
+        ]
+        if len(queries) != 0:
+            self.refresh(queries)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_round()
+            except Exception:
+                logger.exception('Refresh of hot queries has failed')
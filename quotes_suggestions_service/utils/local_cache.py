@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Dict, Hashable, Optional, Tuple
+
+from quotes_suggestions_service.clients.dtos import Quote
+
+
+class LocalQuotesCache:
+    """
+    In-process LRU cache of materialized quotes with TTL.
+    Size is measured in quotes, least recently used entries are evicted when it's exceeded
+    """
+
+    def __init__(self, max_quotes: int, ttl: float):
+        self.max_quotes = max_quotes
+        self.ttl = ttl  # in seconds
+
+        self._lock = Lock()
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Tuple[Quote, ...]]]' = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Quote, ...]]:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] <= monotonic():
+                self._remove(key)
+                self._expirations += 1
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+            return entry[1]
+
+    def set(self, key: Hashable, quotes: Tuple[Quote, ...]):
+        # Entries larger than the whole cache would only flush it
+        if self.max_quotes <= 0 or len(quotes) > self.max_quotes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (monotonic() + self.ttl, quotes)
+            self._size += len(quotes)
+
+            while self._size > self.max_quotes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'entries': len(self._entries),
+                'quotes': self._size,
+            }
+
+    def _remove(self, key: Hashable):
+        _, quotes = self._entries.pop(key)
+        self._size -= len(quotes)
@@ -0,0 +1,265 @@
+"""
+Timing spans of the request stages (upstream HTTP, parsing, NER, tokenization, ranking, Redis),
+counters and their Prometheus text exposition.
+Spans are recorded into the histograms of the process when metrics are enabled and into
+the timings of the current request when it has asked for the `Server-Timing` header.
+When both are off a span is a shared no-op context manager
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Any, ContextManager, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from quotes_suggestions_service.setting import METRICS_ENABLED
+
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+METRICS_PREFIX = 'quotes_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]  # sorted (name, value) pairs
+
+_NO_SPAN = nullcontext()
+
+
+class LatencyHistogram:
+    """
+    Cumulative histogram of durations with fixed buckets, as Prometheus histograms are
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # the last one is for durations above all bounds
+        self._sum = 0.0
+
+    def record(self, duration: float):
+        self._counts[bisect_left(self.buckets, duration)] += 1
+        self._sum += duration
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative_counts: List[int] = []
+        for count in self._counts:
+            cumulative_counts.append(count + (cumulative_counts[-1] if cumulative_counts else 0))
+
+        return {
+            'count': cumulative_counts[-1],
+            'sum': self._sum,
+            'buckets': {
+                **dict(zip(self.buckets, cumulative_counts)),
+                float('inf'): cumulative_counts[-1],
+            },
+        }
+
+
+class OperationsStats:
+    """
+    Latency histograms of operations, e.g. of storage round trips.
+    Operations are spans of the `stage` too, if it's passed
+    """
+
+    def __init__(self, stage: Optional[str] = None):
+        self.stage = stage
+
+        self._lock = Lock()
+        self._histograms: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+
+    @contextmanager
+    def time(self, operation: str) -> Iterator[None]:
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            duration = perf_counter() - started
+            self.record(operation, duration)
+            if self.stage is not None:
+                metrics.record(self.stage, duration)
+
+    def record(self, operation: str, duration: float):
+        with self._lock:
+            self._histograms[operation].record(duration)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                operation: histogram.snapshot()
+                for operation, histogram in self._histograms.items()
+            }
+
+
+class RequestTimings:
+    """
+    Durations of the stages of one request, spans of a stage are summed up,
+    so concurrent spans, e.g. of upstream calls, can add up to more than the request took.
+    Spans are added while the timings are active in the context of the request
+    and in the contexts copied from it, e.g. by fetch tasks
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+
+        self._lock = Lock()
+        self._durations: Dict[str, float] = {}  # in seconds, in order of the first spans
+        self._token = None
+
+    def activate(self) -> 'RequestTimings':
+        self._token = _request_timings.set(self)
+
+        return self
+
+    def deactivate(self):
+        _request_timings.reset(self._token)
+
+    def __enter__(self) -> 'RequestTimings':
+        return self.activate()
+
+    def __exit__(self, *exc_info):
+        self.deactivate()
+
+    def add(self, stage: str, duration: float):
+        with self._lock:
+            self._durations[stage] = self._durations.get(stage, 0) + duration
+
+    def get_header(self) -> str:
+        """
+        Value of the `Server-Timing` header, with the total time of the request so far
+        """
+        with self._lock:
+            durations = {**self._durations, 'total': perf_counter() - self.started}
+
+        return ', '.join(
+            f'{stage};dur={duration * 1000:.1f}' for stage, duration in durations.items())
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    'request_timings', default=None)
+
+
+class Metrics:
+    """
+    Stage histograms and counters of the process
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.stages = OperationsStats()
+
+        self._lock = Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+
+    def span(self, stage: str) -> ContextManager[None]:
+        timings = _request_timings.get()
+        if not self.enabled and timings is None:
+            return _NO_SPAN
+
+        return _Span(self, stage, timings)
+
+    def record(self, stage: str, duration: float, timings: Optional[RequestTimings] = None):
+        if self.enabled:
+            self.stages.record(stage, duration)
+
+        timings = timings or _request_timings.get()
+        if timings is not None:
+            timings.add(stage, duration)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._counters[name][tuple(sorted(labels.items()))] += value
+
+    def get_counters(self) -> Dict[str, Dict[Labels, float]]:
+        with self._lock:
+            return {name: dict(values) for name, values in self._counters.items()}
+
+    def render(
+            self,
+            histograms: Optional[Mapping[str, Tuple[str, OperationsStats]]] = None,
+            counters: Optional[Mapping[str, Mapping[Labels, float]]] = None,
+            gauges: Optional[Mapping[str, Mapping[Labels, float]]] = None) -> str:
+        """
+        Prometheus text exposition of the stage histograms and the counters,
+        along with the passed values collected elsewhere, e.g. statistics of caches
+        :param histograms: {name: (label of operations, stats)}
+        :param counters: {name: {labels: value}}, merged with the counters of the same name
+        :param gauges: {name: {labels: value}}
+        """
+        lines = []
+
+        for name, (label, stats) in {
+                'stage_duration_seconds': ('stage', self.stages), **(histograms or {})}.items():
+            lines.extend(_render_histogram(METRICS_PREFIX + name, label, stats.snapshot()))
+
+        merged_counters = self.get_counters()
+        for name, values in (counters or {}).items():
+            merged_counters[name] = {**merged_counters.get(name, {}), **values}
+        for name, values in merged_counters.items():
+            lines.extend(_render_values(METRICS_PREFIX + name, 'counter', values))
+
+        for name, values in (gauges or {}).items():
+            lines.extend(_render_values(METRICS_PREFIX + name, 'gauge', values))
+
+        return ''.join(f'{line}\n' for line in lines)
+
+
+class _Span:
+
+    __slots__ = ('metrics', 'stage', 'timings', 'started')
+
+    def __init__(self, metrics: Metrics, stage: str, timings: Optional[RequestTimings]):
+        self.metrics = metrics
+        self.stage = stage
+        self.timings = timings
+
+    def __enter__(self):
+        self.started = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.stage, perf_counter() - self.started, self.timings)
+
+
+def _render_histogram(name: str, label: str, snapshot: Dict[str, Dict[str, Any]]) -> List[str]:
+    lines = [f'# TYPE {name} histogram']
+
+    for operation, histogram in sorted(snapshot.items()):
+        labels = ((label, operation), )
+        lines.extend(
+            f'{name}_bucket{_format_labels((*labels, ("le", _format_bound(bound))))} {count}'
+            for bound, count in histogram['buckets'].items())
+        lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]!r}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+
+    return lines
+
+
+def _render_values(name: str, metric_type: str, values: Mapping[Labels, float]) -> List[str]:
+    return [f'# TYPE {name} {metric_type}'] + [
+        f'{name}{_format_labels(labels)} {_format_value(value)}'
+        for labels, value in sorted(values.items())]
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = tuple(labels)
+    if len(labels) == 0:
+        return ''
+
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics(METRICS_ENABLED)
@@ -0,0 +1,128 @@
+"""
+Optional pool of worker processes for the CPU-bound work: HTML parsing, NER and tokenization.
+Request threads ship raw pages and texts to the workers and get quotes and verdicts back,
+so a large page parsed under the GIL doesn't stall the other requests of the process.
+Workers load the models on start, when the pool is disabled calls are made in place
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Callable, Optional, TypeVar
+
+from quotes_suggestions_service.setting import CPU_WORKER_PROCESSES
+from quotes_suggestions_service.utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ProcessPool:
+    """
+    Runs picklable calls in `processes` worker processes, in place if there are none.
+    Workers are spawned rather than forked: a fork would inherit locks held by request threads
+    """
+
+    def __init__(self, processes: int, initializer: Optional[Callable[[], None]] = None):
+        self.processes = processes
+        self.initializer = initializer
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def start(self):
+        """
+        Spawns the workers and waits until they are ready, e.g. before a worker of the server
+        takes requests. Otherwise they are spawned on the first call
+        """
+        if not self.enabled:
+            return
+
+        executor = self._get_executor()
+        for future in [executor.submit(_ping) for _ in range(self.processes)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown()
+
+    def run(self, stage: str, call: Callable[..., T], *args) -> T:
+        """
+        :param stage: span of the call in the calling process, it includes the transfer
+        """
+        if not self.enabled:
+            return call(*args)
+
+        executor = self._get_executor()
+        try:
+            with metrics.span(stage):
+                return executor.submit(call, *args).result()
+        except BrokenProcessPool:
+            self._reset(executor)
+
+            return call(*args)
+
+    async def arun(self, stage: str, call: Callable[..., T], *args) -> T:
+        """
+        Asynchronous variant of `run`, without workers the call is made in the default executor
+        """
+        loop = asyncio.get_running_loop()
+
+        if not self.enabled:
+            return await loop.run_in_executor(None, call, *args)
+
+        executor = self._get_executor()
+        try:
+            with metrics.span(stage):
+                return await loop.run_in_executor(executor, call, *args)
+        except BrokenProcessPool:
+            self._reset(executor)
+
+            return await loop.run_in_executor(None, call, *args)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer)
+
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor):
+        # A worker has died, the call is made in place and the next one spawns a new pool
+        logger.warning('Worker process has died, the pool is restarted')
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+        executor.shutdown(wait=False)
+
+
+def _initialize_worker():
+    # Workers make the calls in place and their metrics are never served
+    process_pool.processes = 0
+    metrics.enabled = False
+
+    from quotes_suggestions_service.startup import preload
+
+    preload()
+
+
+def _ping():
+    pass
+
+
+process_pool = ProcessPool(CPU_WORKER_PROCESSES, _initialize_worker)
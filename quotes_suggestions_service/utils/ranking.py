@@ -0,0 +1,203 @@
+from collections import Counter, OrderedDict
+from threading import Lock
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union,
+)
+
+import numpy as np
+
+from quotes_suggestions_service.clients.dtos import Quote
+
+
+TERM_DTYPE = np.uint32
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class QuotesRanker:
+    """
+    Ranks quotes by BM25 relevance of their lemmatized unigrams and bigrams to the keywords,
+    shorter quotes first among equally relevant ones. Term statistics are computed
+    over the ranked quotes. Every quote is analyzed once into arrays of term ids and counts,
+    which are kept in a bounded LRU memo, so ranking itself is a couple of NumPy passes.
+    Quotes missing in the memo are analyzed with one `analyze_many` call, if it's passed
+    """
+
+    def __init__(
+            self,
+            analyze: Callable[[str], Sequence[str]],
+            max_quotes: int,
+            k1: float = BM25_K1,
+            b: float = BM25_B,
+            analyze_many: Optional[Callable[[Tuple[str, ...]], List[Sequence[str]]]] = None):
+        self.analyze = analyze
+        self.analyze_many = analyze_many
+        self.max_quotes = max_quotes
+        self.k1 = k1
+        self.b = b
+
+        self._lock = Lock()
+        self._vocabulary: Dict[str, int] = {}
+        self._terms: 'OrderedDict[Quote, QuoteTerms]' = OrderedDict()
+
+    def index(self, quotes: Iterable[Quote]):
+        """
+        Analyzes quotes ahead of ranking, e.g. when they are fetched
+        """
+        self._get_terms(quotes)
+
+    def rank(self, keywords: Iterable[str], quotes: Iterable[Quote]) -> 'RankedQuotes':
+        quotes = tuple(quotes)
+        terms = self._get_terms(quotes)
+        keyword_ids = self._get_keyword_ids(keywords)
+
+        return RankedQuotes(quotes, self._score(keyword_ids, terms))
+
+    def _score(self, keyword_ids: np.ndarray, terms: Tuple['QuoteTerms', ...]) -> np.ndarray:
+        if len(terms) == 0 or len(keyword_ids) == 0:
+            return np.zeros(len(terms))
+
+        term_ids = np.concatenate([quote_terms.ids for quote_terms in terms])
+        counts = np.concatenate([quote_terms.counts for quote_terms in terms])
+        owners = np.repeat(
+            np.arange(len(terms)),
+            np.fromiter((len(quote_terms.ids) for quote_terms in terms), np.int64, len(terms)))
+        lengths = np.fromiter((quote_terms.length for quote_terms in terms), np.float64, len(terms))
+
+        is_keyword = np.isin(term_ids, keyword_ids)
+        term_ids, counts, owners = term_ids[is_keyword], counts[is_keyword], owners[is_keyword]
+
+        # Ids of quote terms are unique, so the number of their entries is the document frequency
+        keyword_positions = np.searchsorted(keyword_ids, term_ids)
+        frequencies = np.bincount(keyword_positions, minlength=len(keyword_ids))
+        idf = np.log1p((len(terms) - frequencies + 0.5) / (frequencies + 0.5))
+
+        normalized_lengths = lengths[owners] / max(lengths.mean(), 1)
+        weights = idf[keyword_positions] * counts * (self.k1 + 1) / (
+            counts + self.k1 * (1 - self.b + self.b * normalized_lengths))
+
+        return np.bincount(owners, weights=weights, minlength=len(terms))
+
+    def _get_keyword_ids(self, keywords: Iterable[str]) -> np.ndarray:
+        words = {term for keyword in keywords for term in _get_terms(self.analyze(keyword))}
+
+        with self._lock:
+            keyword_ids = [self._vocabulary[word] for word in words if word in self._vocabulary]
+
+        return np.unique(np.array(keyword_ids, TERM_DTYPE))
+
+    def _get_terms(self, quotes: Iterable[Quote]) -> Tuple['QuoteTerms', ...]:
+        terms = []
+        missing_quotes = []
+
+        with self._lock:
+            for quote in quotes:
+                quote_terms = self._terms.get(quote)
+                if quote_terms is not None:
+                    self._terms.move_to_end(quote)
+                else:
+                    missing_quotes.append((len(terms), quote))
+                terms.append(quote_terms)
+
+        # Analysis is the expensive part, it's done outside of the lock
+        analyzed = [
+            (position, quote, words)
+            for (position, quote), words in zip(missing_quotes, self._analyze_many(
+                tuple(quote.quote for _, quote in missing_quotes)))]
+
+        with self._lock:
+            for position, quote, words in analyzed:
+                term_counts = Counter(_get_terms(words))
+                terms[position] = QuoteTerms(
+                    ids=np.fromiter(
+                        (self._vocabulary.setdefault(term, len(self._vocabulary))
+                         for term in term_counts),
+                        TERM_DTYPE, len(term_counts)),
+                    counts=np.fromiter(term_counts.values(), np.float64, len(term_counts)),
+                    length=len(words))
+                self._terms[quote] = terms[position]
+
+            while len(self._terms) > self.max_quotes:
+                self._terms.popitem(last=False)
+
+        return tuple(terms)
+
+    def _analyze_many(self, texts: Tuple[str, ...]) -> List[Sequence[str]]:
+        if self.analyze_many is None or len(texts) == 0:
+            return [self.analyze(text) for text in texts]
+
+        return self.analyze_many(texts)
+
+
+class QuoteTerms(NamedTuple):
+
+    ids: np.ndarray  # unique term ids
+    counts: np.ndarray  # occurrences of every term
+    length: int  # in words
+
+
+def _get_terms(words: Sequence[str]) -> Iterator[str]:
+    """
+    Unigrams and bigrams of the analyzed words
+    """
+    yield from words
+    yield from (f'{first} {second}' for first, second in zip(words, words[1:]))
+
+
+class RankedQuotes:
+    """
+    Read-only sequence of quotes in the ranking order.
+    Only the requested prefix is ordered: it's selected with a partial sort
+    and grown geometrically, when further pages are read
+    """
+
+    def __init__(self, quotes: Tuple[Quote, ...], scores: np.ndarray):
+        self._quotes = quotes
+        self.matches = int(np.count_nonzero(scores > 0))  # quotes with any of the keywords
+        # Scores are replaced by their dense ranks, so the whole order fits one integer key.
+        # Unique keys make the order total, so prefixes of different sizes agree with each other
+        unique_scores, score_ranks = np.unique(-scores, return_inverse=True)
+        max_length = max((len(quote.quote) for quote in quotes), default=0) + 1
+        lengths = np.fromiter((len(quote.quote) for quote in quotes), np.int64, len(quotes))
+        self._keys = ((score_ranks.astype(np.int64) * max_length + lengths) * len(quotes)
+                      + np.arange(len(quotes)))
+
+        self._lock = Lock()
+        self._order = np.empty(0, np.int64)
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, item: Union[int, slice]):
+        if isinstance(item, int):
+            return self[:][item] if item < 0 else self[item:item + 1][0]
+
+        start, stop, step = item.indices(len(self))
+        order = self._get_order(stop)
+
+        return tuple(self._quotes[position] for position in order[start:stop:step])
+
+    def __eq__(self, other):
+        if isinstance(other, (RankedQuotes, tuple)):
+            return tuple(self) == tuple(other)
+
+        return NotImplemented
+
+    def __repr__(self):
+        return f'RankedQuotes({len(self)} quotes)'
+
+    def _get_order(self, size: int) -> np.ndarray:
+        with self._lock:
+            if size > len(self._order):
+                size = min(max(size, 2 * len(self._order)), len(self._quotes))
+
+                if size < len(self._quotes):
+                    top = np.argpartition(self._keys, size - 1)[:size]
+                else:
+                    top = np.arange(len(self._quotes))
+                self._order = top[np.argsort(self._keys[top])]
+
+            return self._order
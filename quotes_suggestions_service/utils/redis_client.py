@@ -0,0 +1,19 @@
+from functools import lru_cache
+
+from redis import BlockingConnectionPool, Redis
+
+from quotes_suggestions_service.setting import REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT
+
+
+def get_redis(host: str, port: int) -> Redis:
+    """
+    Client of the connection pool shared by all the storages of the host in the process
+    """
+    return Redis(connection_pool=_get_connection_pool(host, port))
+
+
+@lru_cache(maxsize=None)
+def _get_connection_pool(host: str, port: int) -> BlockingConnectionPool:
+    # Threads wait for a free connection up to `REDIS_POOL_TIMEOUT` instead of opening new ones
+    return BlockingConnectionPool(
+        host=host, port=port, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT)
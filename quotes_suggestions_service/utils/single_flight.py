@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key:
+    the first caller runs the function, the others wait for its result
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = Future()
+
+        if not is_leader:
+            return call.result()
+
+        try:
+            result = function()
+        except BaseException as error:
+            call.set_exception(error)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+        return result
+
+
+class AsyncSingleFlight:
+    """
+    Asynchronous variant of `SingleFlight`, must be used within one event loop
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, function: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+
+        if call is None:
+            call = self._calls[key] = asyncio.ensure_future(function())
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+
+        # Cancellation of one waiter mustn't cancel the call for the others
+        return await asyncio.shield(call)
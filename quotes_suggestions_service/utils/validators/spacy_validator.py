@@ -1,8 +1,21 @@
-import en_core_web_sm
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, Tuple
 
+from quotes_suggestions_service.setting import (
+    REDIS_HOST, REDIS_PORT, NAME_VALIDATOR_CACHE_SIZE, NAME_VALIDATOR_REDIS_CACHE,
+    NAME_VALIDATOR_VERDICT_TTL,
+)
 from quotes_suggestions_service.utils.enums import Localization
+from quotes_suggestions_service.utils.metrics import metrics
+from quotes_suggestions_service.utils.process_pool import process_pool
 
 from .enums import SpacyTags
+from .verdicts_storage import PersonVerdictsStorage
+
+
+# Person detection needs the named entities recognizer only
+DISABLED_PIPES = ('tagger', 'parser')
 
 
 class NameValidator:
@@ -28,11 +41,81 @@ class NameValidator:
             return
 
         self.localization = localization
-        self.nlp = self._get_localized_nlp()
+        # The model takes seconds and hundreds of MB to load, so it's loaded on first use
+        self._nlp = None
+        self._nlp_lock = Lock()
+
+        self.cache_size = NAME_VALIDATOR_CACHE_SIZE
+        self._verdicts: 'OrderedDict[str, bool]' = OrderedDict()
+        self._verdicts_lock = Lock()
+        self.verdicts_storage = PersonVerdictsStorage(
+            REDIS_HOST, REDIS_PORT, localization.value, NAME_VALIDATOR_VERDICT_TTL) \
+            if NAME_VALIDATOR_REDIS_CACHE else None
+
+        self._initialized = True
+
+    def __reduce__(self):
+        # There is one validator of the localization per process, workers use their own
+        return NameValidator, (self.localization, )
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self.load()
+
+        return self._nlp
+
+    def load(self):
+        """
+        Loads the model ahead of the first call, e.g. in the master process of a pre-fork server
+        """
+        with self._nlp_lock:
+            if self._nlp is None:
+                self._nlp = self._get_localized_nlp()
+
+    def is_person(self, phrase: str) -> bool:
+        return self.is_person_many((phrase, ))[0]
+
+    def is_person_many(self, phrases: Iterable[str]) -> Tuple[bool, ...]:
+        """
+        Verdicts are looked up in the in-process memo, then in the shared Redis cache,
+        the remaining phrases are tagged with one batched NER pass
+        """
+        phrases = tuple(phrases)
+        verdicts = self._get_memoized_verdicts(phrases)
+        metrics.increment('name_validator_verdicts_total', len(verdicts), source='memo')
 
-    def is_person(self, phrase: str):
-        tagged_result = self.nlp(phrase)
+        missing_phrases = tuple(phrase for phrase in dict.fromkeys(phrases) if phrase not in verdicts)
+        if len(missing_phrases) != 0 and self.verdicts_storage is not None:
+            shared_verdicts = self.verdicts_storage.get_many(missing_phrases)
+            self._memoize_verdicts(shared_verdicts)
+            verdicts.update(shared_verdicts)
+            metrics.increment('name_validator_verdicts_total', len(shared_verdicts), source='redis')
 
+            missing_phrases = tuple(
+                phrase for phrase in missing_phrases if phrase not in shared_verdicts)
+
+        if len(missing_phrases) != 0:
+            detected_verdicts = process_pool.run('ner', self._detect_persons, missing_phrases)
+            metrics.increment('name_validator_verdicts_total', len(detected_verdicts), source='ner')
+            self._memoize_verdicts(detected_verdicts)
+            if self.verdicts_storage is not None:
+                self.verdicts_storage.set_many(detected_verdicts)
+            verdicts.update(detected_verdicts)
+
+        return tuple(verdicts[phrase] for phrase in phrases)
+
+    def _detect_persons(self, phrases: Tuple[str, ...]) -> Dict[str, bool]:
+        # The model is loaded on first use, the load isn't a part of the span
+        nlp = self.nlp
+        with metrics.span('ner'):
+            return {
+                phrase: self._is_person_doc(doc)
+                for phrase, doc in zip(phrases, nlp.pipe(phrases))
+            }
+
+    @staticmethod
+    def _is_person_doc(tagged_result) -> bool:
         try:
             is_person = next(
                 SpacyTags(tag.label_) == SpacyTags.PERSON
@@ -44,6 +127,24 @@ class NameValidator:
 
         return is_person
 
+    def _get_memoized_verdicts(self, phrases: Tuple[str, ...]) -> Dict[str, bool]:
+        verdicts = {}
+
+        with self._verdicts_lock:
+            for phrase in phrases:
+                if phrase in self._verdicts:
+                    self._verdicts.move_to_end(phrase)
+                    verdicts[phrase] = self._verdicts[phrase]
+
+        return verdicts
+
+    def _memoize_verdicts(self, verdicts: Dict[str, bool]):
+        with self._verdicts_lock:
+            self._verdicts.update(verdicts)
+
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+
     @classmethod
     def _get_localized_instance(cls, localization: Localization):
         return next(
@@ -53,6 +154,8 @@ class NameValidator:
 
     def _get_localized_nlp(self):
         if self.localization == Localization.ENGLISH:
-            return en_core_web_sm.load()
+            import en_core_web_sm
+
+            return en_core_web_sm.load(disable=DISABLED_PIPES)
         else:
             raise NotImplemented(f'Localization {self.localization.value} is not supported')
@@ -0,0 +1,42 @@
+from typing import Dict, Iterable
+
+from quotes_suggestions_service.utils.metrics import OperationsStats
+from quotes_suggestions_service.utils.redis_client import get_redis
+
+
+class PersonVerdictsStorage:
+    """
+    Redis cache of `NameValidator` verdicts shared by all workers
+    """
+
+    def __init__(self, host: str, port: int, namespace: str, ttl: int):
+        self.storage = get_redis(host, port)
+        self.stats = OperationsStats(stage='redis')
+        self.namespace = namespace
+        self.ttl = ttl  # in seconds
+
+    def get_many(self, phrases: Iterable[str]) -> Dict[str, bool]:
+        phrases = tuple(phrases)
+        if len(phrases) == 0:
+            return {}
+
+        with self.stats.time('get_many'):
+            verdicts = self.storage.mget([self._get_storage_key(phrase) for phrase in phrases])
+
+        return {
+            phrase: verdict == b'1'
+            for phrase, verdict in zip(phrases, verdicts)
+            if verdict is not None
+        }
+
+    def set_many(self, verdicts: Dict[str, bool]):
+        pipeline = self.storage.pipeline(transaction=False)
+
+        for phrase, verdict in verdicts.items():
+            pipeline.setex(self._get_storage_key(phrase), self.ttl, b'1' if verdict else b'0')
+
+        with self.stats.time('set_many'):
+            pipeline.execute()
+
+    def _get_storage_key(self, phrase: str) -> str:
+        return f'person:{self.namespace}:{phrase}'
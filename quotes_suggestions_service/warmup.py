@@ -0,0 +1,234 @@
+"""
+Warms up the cache ahead of traffic, e.g. after a deploy or a Redis flush:
+    python -m quotes_suggestions_service.warmup access.log --authors "Mark Twain" --keywords love
+Queries are read one per line: access log lines of `/suggestions` requests or bare query strings
+(`authors=...&keywords=...`). Every upstream result (of a client and an author or keyword)
+is fetched once, the most requested first, and stored as requests store it: into Redis
+and the corpus, if it's enabled. Stored results live `--ttl` seconds until the first read.
+Results fresh in Redis are skipped, so are the ones still cached since they were fetched
+by the run recorded in the `--state` file, so an interrupted run is resumed
+"""
+import logging
+import re
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, time
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+from quotes_suggestions_service.clients.base import QuotesApiClient
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.clients.transport import HostRateLimiter
+from quotes_suggestions_service.quotes_generator import QuotesGenerator, SubQueryTask
+from quotes_suggestions_service.setting import WARMUP_CACHE_TTL
+from quotes_suggestions_service.utils.helpers import parse_suggestions_arguments
+from quotes_suggestions_service.utils.hot_queries import Query
+from quotes_suggestions_service.utils.process_pool import process_pool
+
+
+logger = logging.getLogger(__name__)
+
+SUGGESTIONS_REQUEST = re.compile(r'/suggestions\?([^\s"]+)')
+RUN_HEADER = 'started='
+
+
+class WarmUpState:
+    """
+    Keys of the results fetched by the run, every one is appended to the file as soon as
+    it's stored. The file starts with the time the run has started, so it's resumed
+    only within `max_age` seconds, results of an older run could have expired since
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_age: float = WARMUP_CACHE_TTL):
+        self.path = path
+        self.started = time()
+        self.done: Set[str] = set()
+
+        self._lock = Lock()
+
+        lines = path.read_text().split() if path is not None and path.exists() else []
+        if len(lines) != 0 and lines[0].startswith(RUN_HEADER) \
+                and float(lines[0][len(RUN_HEADER):]) > self.started - max_age:
+            self.started = float(lines[0][len(RUN_HEADER):])
+            self.done.update(lines[1:])
+        elif path is not None:
+            path.write_text(f'{RUN_HEADER}{self.started}\n')
+
+    def add(self, sub_key: str):
+        with self._lock:
+            self.done.add(sub_key)
+            if self.path is not None:
+                with self.path.open('a') as file:
+                    file.write(f'{sub_key}\n')
+
+
+def parse_query(line: str) -> Optional[Query]:
+    """
+    :return: (authors, keywords) of the access log line or the query string, None if it has none
+    """
+    match = SUGGESTIONS_REQUEST.search(line)
+    query_string = match.group(1) if match is not None else line.strip()
+    arguments = {name: values[0] for name, values in parse_qs(query_string).items()}
+
+    try:
+        authors, keywords, _, _ = parse_suggestions_arguments(arguments)
+    except ValueError:
+        return None
+
+    return authors, keywords
+
+
+def read_queries(lines: Iterable[str]) -> Iterator[Query]:
+    for line in lines:
+        query = parse_query(line)
+        if query is not None:
+            yield query
+
+
+def get_sub_queries(
+        generator: QuotesGenerator, queries: Iterable[Query]) -> Dict[str, SubQueryTask]:
+    """
+    :return: unique sub-queries of the queries, the most requested first
+    """
+    counts = Counter()
+    sub_queries = {}
+    for authors, keywords in queries:
+        for sub_key, sub_query in generator.split_query(authors, keywords).items():
+            counts[sub_key] += 1
+            sub_queries.setdefault(sub_key, sub_query)
+
+    return {sub_key: sub_queries[sub_key] for sub_key, _ in counts.most_common()}
+
+
+def get_pending_sub_queries(
+        generator: QuotesGenerator,
+        sub_queries: Dict[str, SubQueryTask],
+        state: WarmUpState,
+        force: bool = False) -> Dict[str, SubQueryTask]:
+    """
+    Leaves out the sub-queries fetched by the run, which are still cached,
+    and, unless `force` is set, the fresh ones
+    """
+    ttls = generator.cache_storage.get_ttls(state.done.intersection(sub_queries))
+    sub_queries = {
+        sub_key: sub_query
+        for sub_key, sub_query in sub_queries.items()
+        if ttls.get(sub_key, 0) == 0
+    }
+    if force:
+        return sub_queries
+
+    fresh_ttls = generator.cache_storage.get_fresh_ttls(sub_queries)
+
+    return {
+        sub_key: sub_query
+        for sub_key, sub_query in sub_queries.items()
+        if fresh_ttls[sub_key] == 0
+    }
+
+
+def warm_up(
+        generator: QuotesGenerator,
+        sub_queries: Dict[str, SubQueryTask],
+        state: WarmUpState,
+        concurrency: int,
+        report: Callable[[str, Optional[Tuple[Quote, ...]], Optional[Exception]], None],
+        ttl: int = WARMUP_CACHE_TTL):
+    """
+    Fetches and stores the sub-queries, at most `concurrency` of them at once.
+    `report` is called with (key, quotes, None) or (key, None, error) as every one is done
+    :param ttl: in seconds until the first read of the stored results
+    """
+    try:
+        # Titles of authors are resolved and keywords are checked for persons in batches
+        generator.prepare_clients(sub_queries.values())
+    except Exception:
+        logger.exception('Preparation of the sub-queries has failed, they are fetched one by one')
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='warm-up') as executor:
+        futures = {
+            executor.submit(generator.fetch_sub_query, sub_key, *sub_query, ttl): sub_key
+            for sub_key, sub_query in sub_queries.items()
+        }
+
+        try:
+            for future in as_completed(futures):
+                sub_key = futures[future]
+                try:
+                    quotes = future.result()
+                except Exception as error:
+                    report(sub_key, None, error)
+                else:
+                    state.add(sub_key)
+                    report(sub_key, quotes, None)
+        finally:
+            # Interrupted runs don't wait for the sub-queries which haven't started
+            for future in futures:
+                future.cancel()
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        'sources', nargs='*', type=Path,
+        help='files with a query per line, e.g. access logs, "-" is the standard input')
+    parser.add_argument('--authors', nargs='+', default=(), help='every author is a query')
+    parser.add_argument('--keywords', nargs='+', default=(), help='every keyword is a query')
+    parser.add_argument('--concurrency', type=int, default=4, help='sub-queries fetched at once')
+    parser.add_argument(
+        '--rate', type=float, default=2,
+        help='requests per second to every upstream host, 0 to not limit them')
+    parser.add_argument(
+        '--ttl', type=int, default=WARMUP_CACHE_TTL,
+        help='seconds the stored results live until the first read')
+    parser.add_argument('--state', type=Path, help='file of the fetched sub-queries, to resume')
+    parser.add_argument('--force', action='store_true', help='re-fetch fresh results too')
+    arguments = parser.parse_args()
+
+    queries = [((author, ), ()) for author in arguments.authors]
+    queries.extend(((), (keyword, )) for keyword in arguments.keywords)
+    for source in arguments.sources:
+        lines = sys.stdin if str(source) == '-' else source.read_text().splitlines()
+        queries.extend(read_queries(lines))
+
+    generator = QuotesGenerator()
+    state = WarmUpState(arguments.state, arguments.ttl)
+    sub_queries = get_sub_queries(generator, queries)
+    pending_sub_queries = get_pending_sub_queries(generator, sub_queries, state, arguments.force)
+    print(f'{len(queries)} queries, {len(sub_queries)} sub-queries, '
+          f'{len(sub_queries) - len(pending_sub_queries)} of them are fresh or fetched')
+
+    if arguments.rate > 0:
+        QuotesApiClient.transport.rate_limiter = HostRateLimiter(arguments.rate)
+
+    started = perf_counter()
+    done = Counter()
+
+    def report(sub_key: str, quotes: Optional[Tuple[Quote, ...]], error: Optional[Exception]):
+        done['failed' if error is not None else 'fetched'] += 1
+        done['quotes'] += len(quotes or ())
+        result = f'failed: {error!r}' if error is not None else f'{len(quotes)} quotes'
+        print(f'[{done["fetched"] + done["failed"]}/{len(pending_sub_queries)}] '
+              f'{sub_key}: {result}', flush=True)
+
+    try:
+        warm_up(
+            generator, pending_sub_queries, state, arguments.concurrency, report, arguments.ttl)
+    except KeyboardInterrupt:
+        print('Interrupted, run it with the same --state to resume')
+        return 130
+    finally:
+        process_pool.shutdown()
+
+    print(f'Fetched {done["fetched"]} sub-queries ({done["quotes"]} quotes), '
+          f'{done["failed"]} failed, in {perf_counter() - started:.1f} s')
+
+    return 1 if done['failed'] != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
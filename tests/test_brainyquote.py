@@ -0,0 +1,77 @@
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('bs4')
+
+from quotes_suggestions_service.clients.brainyquote import BrainyQuoteClient  # noqa: E402
+
+
+def _page(number, pagination=''):
+    return (
+        f'<div class="clearfix"><a title="view quote">Quote {number}</a>'
+        f'<a title="view author">Author</a></div>{pagination}')
+
+
+FIRST_PAGE = _page(1, (
+    '<ul class="pagination">'
+    '<li><a href="/topics/love-quotes_2">2</a></li>'
+    '<li><a href="/topics/love-quotes_3">3</a></li>'
+    '<li><a href="/topics/love-quotes_2">Next</a></li>'
+    '</ul>'))
+
+
+class _Response:
+
+    def __init__(self, text):
+        self.text = text
+
+
+class _Transport:
+    """
+    Serves the pages by their urls and records the requests in `events`
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def get(self, url):
+        self.events.append(('get', url.rsplit('/', 1)[-1]))
+
+        return _Response(FIRST_PAGE if url.endswith('love') else _page(url[-1]))
+
+
+class _ImmediateExecutor:
+    """
+    Runs the submitted calls at once, so the order of events is deterministic
+    """
+
+    def submit(self, call, *args):
+        future = Future()
+        future.set_result(call(*args))
+
+        return future
+
+
+def test_rest_pages_are_requested_before_first_page_is_parsed(monkeypatch):
+    events = []
+    client = BrainyQuoteClient()
+    monkeypatch.setattr(client, 'transport', _Transport(events))
+    monkeypatch.setattr(client, 'pages_executor', _ImmediateExecutor())
+    parse_quotes_from_pages = BrainyQuoteClient._parse_quotes_from_pages
+
+    def parse(pages):
+        quotes = parse_quotes_from_pages(pages)
+        events.append(('parse', quotes[0].quote))
+
+        return quotes
+
+    monkeypatch.setattr(client, '_parse_quotes_from_pages', parse)
+
+    pages = list(client._iter_url_quotes(f'{client.topics_url}/love'))
+
+    assert events[:4] == [
+        ('get', 'love'), ('get', 'love-quotes_2'), ('get', 'love-quotes_3'),
+        ('parse', 'Quote 1')]
+    assert sorted(quote.quote for page in pages for quote in page) == [
+        'Quote 1', 'Quote 2', 'Quote 3']
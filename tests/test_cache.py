@@ -0,0 +1,136 @@
+import pytest
+from redis import BlockingConnectionPool
+
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.setting import REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT
+from quotes_suggestions_service.utils.cache import TemporaryQuotesStorage
+from quotes_suggestions_service.utils.metrics import LatencyHistogram
+
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def storage():
+    storage = TemporaryQuotesStorage('localhost', 6379, cache_ttl=60)
+    storage.storage = fakeredis.FakeRedis()
+
+    return storage
+
+
+def _quotes(count: int):
+    return tuple(
+        Quote(quote=f'quote {"x" * number}', author='author', description=None)
+        for number in range(count))
+
+
+def test_get_cache_reads_requested_page(storage):
+    quotes = _quotes(10)
+    storage.set_cache('key', quotes)
+
+    assert storage.get_cache('key') == quotes
+    assert storage.get_cache('key', limit=3, offset=2) == quotes[2:5]
+    assert storage.get_cache('key', limit=5, offset=8) == quotes[8:]
+
+
+def test_out_of_range_offset_returns_nothing(storage):
+    storage.set_cache('key', _quotes(3))
+
+    assert storage.get_cache('key', limit=5, offset=3) == ()
+    assert storage.get_cache('key', limit=0, offset=0) == ()
+
+
+def test_empty_result_is_cached(storage):
+    storage.set_cache('key', ())
+
+    assert storage.key_in_cache('key')
+    assert storage.get_cache('key', limit=5, offset=0) == ()
+
+
+def test_set_cache_replaces_previous_quotes(storage):
+    storage.set_cache('key', _quotes(5))
+    storage.set_cache('key', _quotes(2))
+
+    assert storage.get_cache('key') == _quotes(2)
+
+
+def test_fresh_cache_is_read_until_soft_ttl(storage):
+    quotes = _quotes(5)
+    storage.set_cache('key', quotes, ttl=30)
+
+    assert storage.get_fresh_cache('key', limit=2, offset=1) == quotes[1:3]
+    assert storage.get_fresh_cache('key', limit=2, offset=5) == ()
+    assert 0 < storage.storage.ttl(storage._get_storage_key('key')) <= 30
+    assert storage.get_fresh_cache('missing') is None
+
+    storage.storage.delete(storage._get_freshness_key('key'))  # as if the soft TTL had passed
+    assert storage.get_fresh_cache('key') is None
+
+
+def test_get_many_skips_missing_keys(storage):
+    quotes = _quotes(3)
+    storage.set_cache('first', quotes)
+    storage.set_cache('empty', ())
+
+    assert storage.get_many(('first', 'missing', 'empty')) == {'first': quotes, 'empty': ()}
+    assert storage.get_many(()) == {}
+
+
+def test_entries_past_soft_ttl_are_stale(storage):
+    storage.set_cache('fresh', _quotes(1))
+    storage.set_cache('stale', _quotes(2))
+    storage.storage.delete(storage._get_freshness_key('stale'))  # as if the soft TTL had passed
+
+    quotes, stale_keys = storage.get_many_with_stale_keys(('fresh', 'stale', 'missing'))
+
+    assert quotes == {'fresh': _quotes(1), 'stale': _quotes(2)}
+    assert stale_keys == {'stale'}
+    assert storage.get_fresh_ttls(('fresh', 'stale', 'missing')) == \
+        {'fresh': pytest.approx(60, abs=1), 'stale': 0, 'missing': 0}
+
+
+def test_request_counts_decay(storage):
+    storage.count_requests({'first': 1, 'second': 3})
+    storage.count_requests({'first': 1, 'third': 1})
+
+    assert storage.get_most_requested(2, decay=0.5, min_score=0.6) == ['second', 'first']
+    # "third" has decayed below the minimal score and is forgotten
+    assert storage.get_most_requested(5) == ['second', 'first']
+    assert storage.get_most_requested(5, min_requests=1.2) == ['second']
+
+
+def test_every_read_is_one_timed_round_trip(storage):
+    storage.set_cache('key', _quotes(3))
+    storage.get_cache('key', limit=2)
+    storage.get_cache('missing')
+    storage.get_many(('key', 'missing'))
+
+    stats = storage.stats.snapshot()
+
+    assert {operation: stats[operation]['count'] for operation in stats} == \
+        {'set_cache': 1, 'get_cache': 2, 'get_many': 1}
+    assert stats['get_cache']['buckets'][float('inf')] == 2
+
+
+def test_latency_histogram_is_cumulative():
+    histogram = LatencyHistogram(buckets=(0.01, 0.1))
+    for duration in (0.005, 0.05, 0.07, 1):
+        histogram.record(duration)
+
+    assert histogram.snapshot() == {
+        'count': 4,
+        'sum': pytest.approx(1.125),
+        'buckets': {0.01: 1, 0.1: 3, float('inf'): 4},
+    }
+
+
+def test_storages_of_a_host_share_the_connection_pool():
+    storage = TemporaryQuotesStorage('localhost', 6379, cache_ttl=60)
+    other_storage = TemporaryQuotesStorage('localhost', 6379, cache_ttl=120)
+    pool = storage.storage.connection_pool
+
+    assert isinstance(pool, BlockingConnectionPool)
+    assert other_storage.storage.connection_pool is pool
+    assert (pool.max_connections, pool.timeout) == (REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT)
+    assert TemporaryQuotesStorage('localhost', 6380, cache_ttl=60).storage.connection_pool \
+        is not pool
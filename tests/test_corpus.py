@@ -0,0 +1,60 @@
+import re
+
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.utils.corpus import QuotesCorpus
+
+
+def _analyze_many(texts):
+    # Plural endings stand in for the lemmatization
+    return [
+        [word[:-1] if word.endswith('s') else word for word in re.findall('[a-z]+', text.lower())]
+        for text in texts
+    ]
+
+
+def _corpus(tmp_path):
+    corpus = QuotesCorpus(str(tmp_path / 'corpus.sqlite3'), _analyze_many)
+    corpus.add((
+        Quote(quote='All you need is love.', author='John Lennon'),
+        Quote(quote='Peace begins with a smile.', author='Mother Teresa'),
+        Quote(quote='Love and peace, eternally.', author='John Lennon', description='Song'),
+    ))
+
+    return corpus
+
+
+def test_quotes_are_deduplicated_as_quote_equality(tmp_path):
+    corpus = _corpus(tmp_path)
+
+    assert corpus.add((Quote(quote='all you need is LOVE', author='john lennon'), )) == 0
+    assert corpus.count() == 3
+
+
+def test_search_matches_all_words_of_any_keyword(tmp_path):
+    corpus = _corpus(tmp_path)
+
+    assert {quote.quote for quote in corpus.search(('love', ))} == {
+        'All you need is love.', 'Love and peace, eternally.'}
+    assert {quote.quote for quote in corpus.search(('love peace', 'smile'))} == {
+        'Love and peace, eternally.', 'Peace begins with a smile.'}
+    assert {quote.quote for quote in corpus.search(('smiles', ))} == {
+        'Peace begins with a smile.'}
+
+
+def test_authors_are_not_indexed(tmp_path):
+    corpus = _corpus(tmp_path)
+
+    assert corpus.search(('lennon', )) is None
+
+
+def test_search_fails_when_some_keyword_is_unknown(tmp_path):
+    corpus = _corpus(tmp_path)
+
+    assert corpus.search(('love', 'war')) is None
+    assert corpus.search(('!!!', )) is None
+
+
+def test_corpus_survives_reopening(tmp_path):
+    _corpus(tmp_path)
+
+    assert QuotesCorpus(str(tmp_path / 'corpus.sqlite3'), _analyze_many).count() == 3
@@ -0,0 +1,65 @@
+import pickle
+from dataclasses import asdict
+
+import pytest
+
+from quotes_suggestions_service.clients.dtos import Quote, quotes_from_bytes, quotes_to_bytes
+
+
+QUOTES = (
+    Quote(quote='All you need is love.', author='John Lennon', description='Song, 1967'),
+    Quote(quote='Imagine all the people', author='John Lennon'),
+    Quote(quote='Ça va, «naïve» 😊', author='Юрий', description=''),
+)
+
+
+@pytest.mark.parametrize('quote', QUOTES)
+def test_quote_bytes_round_trip(quote):
+    restored = Quote.from_bytes(quote.to_bytes())
+
+    assert (restored.quote, restored.author, restored.description) \
+        == (quote.quote, quote.author, quote.description)
+
+
+def test_long_quote_is_compressed():
+    quote = Quote(quote='love ' * 1000, author='John Lennon')
+
+    data = quote.to_bytes()
+
+    assert len(data) < len(quote.to_bytes(compress=False))
+    assert Quote.from_bytes(data).quote == quote.quote
+
+
+def test_quotes_bytes_round_trip():
+    for compress in (True, False):
+        restored = quotes_from_bytes(quotes_to_bytes(QUOTES * 50, compress=compress))
+
+        assert [(quote.quote, quote.author, quote.description) for quote in restored] \
+            == [(quote.quote, quote.author, quote.description) for quote in QUOTES * 50]
+
+    assert quotes_from_bytes(quotes_to_bytes(())) == ()
+
+
+def test_unknown_format_version_is_rejected():
+    with pytest.raises(ValueError):
+        Quote.from_bytes(b'{"quote": "json"}')
+
+
+def test_quotes_are_identified_by_lower_letters_of_quote_and_author():
+    quote = Quote(quote='All you need is love.', author='John Lennon', description='Song')
+
+    assert quote == Quote(quote='all you need is LOVE', author='john lennon')
+    assert hash(quote) == hash(Quote(quote='all you need is LOVE', author='john lennon'))
+    assert quote != Quote(quote='All you need is love.', author='Paul McCartney')
+    assert len({quote, Quote(quote='All you need is love!', author='John Lennon')}) == 1
+
+
+def test_quote_is_slotted_and_picklable():
+    quote = Quote(quote='All you need is love.', author='John Lennon', description='Song')
+
+    restored = pickle.loads(pickle.dumps(quote))
+
+    assert not hasattr(quote, '__dict__')
+    assert (restored.quote, restored.author, restored.description, restored.key) \
+        == (quote.quote, quote.author, quote.description, quote.key)
+    assert asdict(quote) == {'quote': quote.quote, 'author': quote.author, 'description': 'Song'}
@@ -0,0 +1,165 @@
+import asyncio
+from contextvars import copy_context
+from time import monotonic, sleep
+
+import pytest
+
+from quotes_suggestions_service.clients.transport import (
+    DeadlineExceeded, HttpTransport, fetch_deadline,
+)
+from quotes_suggestions_service.utils.fetcher import ConcurrentFetcher
+
+
+def test_fetch_merges_results_of_all_tasks():
+    fetcher = ConcurrentFetcher(max_workers=2, timeout=1)
+
+    quotes, is_complete = fetcher.fetch([lambda: ('a', 'b'), lambda: ('b', 'c')])
+
+    assert quotes == {'a', 'b', 'c'}
+    assert is_complete
+
+
+def test_fetch_drops_tasks_after_deadline():
+    fetcher = ConcurrentFetcher(max_workers=2, timeout=0.2)
+
+    started = monotonic()
+    quotes, is_complete = fetcher.fetch([lambda: ('fast', ), lambda: sleep(1) or ('slow', )])
+
+    assert monotonic() - started < 0.5
+    assert quotes == {'fast'}
+    assert not is_complete
+
+
+def test_fetch_skips_failed_task():
+    def fail():
+        raise RuntimeError('upstream is down')
+
+    fetcher = ConcurrentFetcher(max_workers=2, timeout=1)
+
+    quotes, is_complete = fetcher.fetch([lambda: ('a', ), fail])
+
+    assert quotes == {'a'}
+    assert not is_complete
+
+
+def test_queue_time_counts_against_deadline():
+    fetcher = ConcurrentFetcher(max_workers=2, timeout=0.3)
+    # Orphaned tasks keep both workers busy after their request has given up on them
+    fetcher.fetch([lambda: sleep(2) or (), lambda: sleep(2) or ()])
+
+    started = monotonic()
+    quotes, is_complete = fetcher.fetch([lambda: ('a', )])
+
+    assert monotonic() - started < 0.5
+    assert quotes == set()
+    assert not is_complete
+
+
+def test_task_deadline_bounds_transport_calls():
+    fetcher = ConcurrentFetcher(max_workers=1, timeout=0.1)
+    transport = HttpTransport(
+        connect_timeout=5, read_timeout=5, retries=0, backoff_factor=0, pool_maxsize=1)
+    deadlines = []
+
+    def task():
+        deadlines.append(fetch_deadline.get())
+        sleep(0.2)
+        transport.get('http://localhost')  # Must fail without touching the network
+
+    fetcher.fetch([task])
+    assert deadlines[0] is not None
+    assert fetch_deadline.get() is None  # Doesn't leak out of the task
+
+    def expired_call():
+        fetch_deadline.set(monotonic() - 1)
+        transport.get('http://localhost')
+
+    with pytest.raises(DeadlineExceeded):
+        copy_context().run(expired_call)
+
+
+def test_afetch_drops_tasks_after_deadline():
+    async def fast():
+        return 'fast',
+
+    async def slow():
+        await asyncio.sleep(1)
+        return 'slow',
+
+    async def fail():
+        raise RuntimeError('upstream is down')
+
+    fetcher = ConcurrentFetcher(max_workers=2, timeout=0.2)
+
+    assert asyncio.run(fetcher.afetch([fast, slow])) == ({'fast'}, False)
+    assert asyncio.run(fetcher.afetch([fast, fail])) == ({'fast'}, False)
+    assert asyncio.run(fetcher.afetch([fast])) == ({'fast'}, True)
+
+
+def test_afetch_queue_time_counts_against_deadline():
+    async def slow():
+        await asyncio.sleep(0.15)
+        return 'slow',
+
+    fetcher = ConcurrentFetcher(max_workers=1, timeout=0.2)
+
+    # The second task waits for the first one and has no time left for itself
+    assert asyncio.run(fetcher.afetch([slow, slow])) == ({'slow'}, False)
+
+
+def test_iter_batches_yields_batches_as_they_arrive():
+    def pages():
+        yield 'first',
+        sleep(0.3)
+        yield 'second',
+
+    def slow():
+        sleep(1)
+        yield 'slow',
+
+    fetcher = ConcurrentFetcher(max_workers=3, timeout=0.5)
+
+    started = monotonic()
+    batches = fetcher.iter_batches([pages, slow])
+
+    assert next(batches) == ('first', )
+    assert monotonic() - started < 0.2
+    assert list(batches) == [('second', )]
+    assert not batches.is_complete
+
+
+def test_iter_batches_tasks_outlive_the_iterator():
+    finished = []
+
+    def pages():
+        yield 'first',
+        sleep(0.1)
+        finished.append(True)
+        yield 'second',
+
+    fetcher = ConcurrentFetcher(max_workers=1, timeout=1)
+
+    batches = fetcher.iter_batches([pages])
+    assert next(batches) == ('first', )
+    batches._iterator.close()
+
+    sleep(0.3)
+    assert finished == [True]
+
+
+def test_aiter_batches_yields_batches_as_they_arrive():
+    async def pages():
+        yield 'first',
+        await asyncio.sleep(0.1)
+        yield 'second',
+
+    async def fail():
+        raise RuntimeError('upstream is down')
+        yield
+
+    async def collect():
+        fetcher = ConcurrentFetcher(max_workers=2, timeout=1)
+
+        return [batch async for batch in fetcher.aiter_batches([pages, fail])]
+
+    assert asyncio.run(collect()) == [('first', ), ('second', )]
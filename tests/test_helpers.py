@@ -0,0 +1,41 @@
+import pytest
+
+from quotes_suggestions_service.utils.enums import ResponseMode
+from quotes_suggestions_service.utils.helpers import (
+    parse_batch_suggestions_arguments, parse_response_mode,
+)
+
+
+def test_batch_queries_are_parsed_as_suggestions_arguments():
+    body = {'queries': [
+        {'id': 'widget', 'authors': ['John Lennon', 'Princess Diana'], 'limit': 3},
+        {'keywords': 'love, peace', 'offset': 2},
+    ]}
+
+    assert parse_batch_suggestions_arguments(body, max_queries=2) == [
+        ('widget', ('John Lennon', 'Princess Diana'), (), 3, 0),
+        ('1', (), ('love', 'peace'), 5, 2),
+    ]
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    {'queries': []},
+    {'queries': [{'authors': 'a'}] * 3},
+    {'queries': ['a']},
+    {'queries': [{}]},
+    {'queries': [{'id': 'a', 'authors': 'a'}, {'id': 'a', 'authors': 'b'}]},
+])
+def test_invalid_batch_is_rejected(body):
+    with pytest.raises(ValueError):
+        parse_batch_suggestions_arguments(body, max_queries=2)
+
+
+def test_streaming_modes_reject_offset():
+    assert parse_response_mode({}) is ResponseMode.FULL
+    assert parse_response_mode({'mode': 'early', 'offset': '5'}) is ResponseMode.EARLY
+
+    with pytest.raises(ValueError):
+        parse_response_mode({'mode': 'ndjson', 'offset': '5'})
+    with pytest.raises(ValueError):
+        parse_response_mode({'mode': 'unknown'})
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from quotes_suggestions_service.utils.cache import TemporaryQuotesStorage
+from quotes_suggestions_service.utils.hot_queries import HotQueriesScheduler
+
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def storage():
+    storage = TemporaryQuotesStorage('localhost', 6379, cache_ttl=60)
+    storage.storage = fakeredis.FakeRedis()
+
+    return storage
+
+
+def _scheduler(storage, refreshed, min_requests=1):
+    scheduler = HotQueriesScheduler(
+        storage, refreshed.append, count=2, interval=60, decay=0.9,
+        min_requests=min_requests, refresh_ahead=10)
+    scheduler._pid = os.getpid()  # rounds are run by the tests, the thread isn't started
+
+    return scheduler
+
+
+def test_most_requested_queries_are_refreshed(storage):
+    refreshed = []
+    scheduler = _scheduler(storage, refreshed)
+
+    for _ in range(3):
+        scheduler.record(('Mark Twain', 'John Lennon'), ())
+    scheduler.record(('John Lennon', 'Mark Twain'), ())
+    scheduler.record((), ('love', ))
+    scheduler.record((), ('peace', ))
+    scheduler.record((), ('love', 'love'))
+    scheduler.run_round()
+
+    assert refreshed == [[(('John Lennon', 'Mark Twain'), ()), ((), ('love', ))]]
+
+
+def test_one_process_refreshes_per_interval(storage):
+    refreshed = []
+    first, second = _scheduler(storage, refreshed), _scheduler(storage, refreshed)
+
+    first.record((), ('love', ))
+    first.run_round()
+    second.run_round()
+
+    assert len(refreshed) == 1
+
+
+def test_queries_requested_a_few_times_are_not_hot(storage):
+    refreshed = []
+    scheduler = _scheduler(storage, refreshed, min_requests=2)
+
+    scheduler.record((), ('love', ))
+    scheduler.record((), ('peace', ))
+    scheduler.record((), ('peace', ))
+    scheduler.run_round()
+
+    assert refreshed == [[((), ('peace', ))]]
+
+
+def test_refresh_ahead_is_limited_by_soft_ttl(storage):
+    with pytest.raises(ValueError):
+        HotQueriesScheduler(
+            storage, print, count=2, interval=10, decay=0.9, min_requests=1, refresh_ahead=40)
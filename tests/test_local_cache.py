@@ -0,0 +1,56 @@
+from time import sleep
+
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.utils.local_cache import LocalQuotesCache
+
+
+def _quotes(count: int):
+    return tuple(Quote(quote=f'quote {"x" * number}', author='author') for number in range(count))
+
+
+def test_get_returns_stored_quotes():
+    cache = LocalQuotesCache(max_quotes=10, ttl=60)
+    quotes = _quotes(3)
+
+    cache.set('key', quotes)
+
+    assert cache.get('key') is quotes
+    assert cache.get('other') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_least_recently_used_entries_are_evicted_by_size():
+    cache = LocalQuotesCache(max_quotes=5, ttl=60)
+    cache.set('first', _quotes(2))
+    cache.set('second', _quotes(2))
+    cache.get('first')
+
+    cache.set('third', _quotes(2))
+
+    assert cache.get('second') is None
+    assert cache.get('first') is not None
+    assert cache.get('third') is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['quotes'] == 4
+
+
+def test_entry_larger_than_cache_is_not_stored():
+    cache = LocalQuotesCache(max_quotes=2, ttl=60)
+    cache.set('small', _quotes(1))
+
+    cache.set('large', _quotes(3))
+
+    assert cache.get('large') is None
+    assert cache.get('small') is not None
+
+
+def test_entries_expire_after_ttl():
+    cache = LocalQuotesCache(max_quotes=10, ttl=0.05)
+    cache.set('key', _quotes(1))
+
+    sleep(0.1)
+
+    assert cache.get('key') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['quotes'] == 0
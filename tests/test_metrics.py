@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from quotes_suggestions_service.utils.metrics import Metrics, OperationsStats, RequestTimings
+
+
+def test_span_is_recorded_when_enabled():
+    metrics = Metrics(enabled=True)
+
+    with metrics.span('ranking'):
+        pass
+
+    assert metrics.stages.snapshot()['ranking']['count'] == 1
+
+
+def test_span_is_no_op_when_disabled():
+    metrics = Metrics(enabled=False)
+
+    with metrics.span('ranking'):
+        pass
+    metrics.increment('cache_requests_total', result='hit')
+
+    assert metrics.stages.snapshot() == {}
+    assert metrics.get_counters() == {}
+
+
+def test_request_timings_collect_spans_of_copied_contexts():
+    metrics = Metrics(enabled=False)
+
+    def parse():
+        with metrics.span('parse'):
+            pass
+
+    with RequestTimings() as timings:
+        with metrics.span('fetch'):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                for future in [executor.submit(copy_context().run, parse) for _ in range(2)]:
+                    future.result()
+    # Spans after the request are left out
+    with metrics.span('fetch'):
+        pass
+
+    header = timings.get_header()
+    assert [metric.split(';')[0] for metric in header.split(', ')] == ['parse', 'fetch', 'total']
+    assert all(';dur=' in metric for metric in header.split(', '))
+
+
+def test_render_prometheus_exposition():
+    metrics = Metrics(enabled=True)
+    metrics.record('ranking', 0.003)
+    metrics.increment('cache_requests_total', 2, cache='redis', result='hit')
+    storage_stats = OperationsStats()
+    storage_stats.record('get_many', 0.2)
+
+    text = metrics.render(
+        histograms={'redis_operation_duration_seconds': ('operation', storage_stats)},
+        counters={'cache_requests_total': {(('cache', 'local'), ('result', 'hit')): 3}},
+        gauges={'local_cache_entries': {(): 4}})
+
+    assert '# TYPE quotes_stage_duration_seconds histogram' in text
+    assert 'quotes_stage_duration_seconds_bucket{stage="ranking",le="0.0025"} 0' in text
+    assert 'quotes_stage_duration_seconds_bucket{stage="ranking",le="0.005"} 1' in text
+    assert 'quotes_stage_duration_seconds_bucket{stage="ranking",le="+Inf"} 1' in text
+    assert 'quotes_stage_duration_seconds_sum{stage="ranking"} 0.003' in text
+    assert 'quotes_stage_duration_seconds_count{stage="ranking"} 1' in text
+    assert 'quotes_redis_operation_duration_seconds_count{operation="get_many"} 1' in text
+    assert '# TYPE quotes_cache_requests_total counter' in text
+    assert 'quotes_cache_requests_total{cache="local",result="hit"} 3' in text
+    assert 'quotes_cache_requests_total{cache="redis",result="hit"} 2' in text
+    assert 'quotes_local_cache_entries 4' in text
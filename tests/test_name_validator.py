@@ -0,0 +1,76 @@
+import pickle
+
+import pytest
+
+pytest.importorskip('en_core_web_sm')
+
+from quotes_suggestions_service.utils.enums import Localization  # noqa: E402
+from quotes_suggestions_service.utils.validators.spacy_validator import NameValidator  # noqa: E402
+
+
+class _Entity:
+
+    def __init__(self, label: str):
+        self.label_ = label
+
+
+class _Doc:
+
+    def __init__(self, text: str):
+        self.ents = [_Entity('PERSON')] if text.istitle() else [_Entity('ORG')]
+
+
+class _CountingNlp:
+    """
+    Tags title-cased phrases as persons and records every batch it's given
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def pipe(self, texts):
+        self.batches.append(tuple(texts))
+        return (_Doc(text) for text in self.batches[-1])
+
+
+@pytest.fixture
+def validator(monkeypatch):
+    validator = NameValidator(Localization.ENGLISH)
+    monkeypatch.setattr(validator, '_nlp', _CountingNlp())
+    monkeypatch.setattr(validator, 'verdicts_storage', None)
+    monkeypatch.setattr(validator, 'cache_size', 3)
+    validator._verdicts.clear()
+
+    yield validator
+
+    validator._verdicts.clear()
+
+
+def test_is_person_many_tags_unique_phrases_in_one_batch(validator):
+    verdicts = validator.is_person_many(('Albert Einstein', 'love', 'Albert Einstein'))
+
+    assert verdicts == (True, False, True)
+    assert len(validator.nlp.batches) == 1
+    assert validator.nlp.batches == [('Albert Einstein', 'love')]
+
+
+def test_verdicts_are_memoized(validator):
+    assert validator.is_person('Albert Einstein')
+    assert validator.is_person('Albert Einstein')
+    assert not validator.is_person('love')
+
+    assert validator.nlp.batches == [('Albert Einstein', ), ('love', )]
+
+
+def test_least_recently_used_verdicts_are_evicted(validator):
+    validator.is_person_many(('one', 'two', 'three'))
+    validator.is_person('one')
+    validator.is_person('four')
+
+    assert list(validator._verdicts) == ['three', 'one', 'four']
+    validator.is_person('two')
+    assert validator.nlp.batches[-1] == ('two', )
+
+
+def test_validator_is_sent_as_validator_of_its_localization(validator):
+    assert pickle.loads(pickle.dumps(validator)) is validator
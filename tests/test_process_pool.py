@@ -0,0 +1,58 @@
+import asyncio
+import os
+import pickle
+from pathlib import Path
+from threading import get_ident
+
+import pytest
+
+from quotes_suggestions_service.clients.wikiquote import WikiQuoteClient
+from quotes_suggestions_service.clients.wikiquote.parsers import LxmlQuotesParser
+from quotes_suggestions_service.utils.enums import Localization
+from quotes_suggestions_service.utils.process_pool import ProcessPool
+
+
+PAGE = Path(__file__).parent / 'fixtures' / 'wikiquote' / 'mark_twain.html'
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = ProcessPool(1)
+    pool.start()
+
+    yield pool
+
+    pool.shutdown()
+
+
+def test_calls_are_made_in_place_without_processes():
+    pool = ProcessPool(0)
+
+    assert pool.run('stage', get_ident) == get_ident()
+    # The asynchronous variant keeps the call off the event loop
+    assert asyncio.run(pool.arun('stage', get_ident)) != get_ident()
+
+
+def test_calls_are_made_in_worker_process(pool):
+    assert pool.run('stage', os.getpid) != os.getpid()
+    assert asyncio.run(pool.arun('stage', os.getpid)) != os.getpid()
+
+
+def test_parsed_quotes_are_sent_back(pool):
+    parser = LxmlQuotesParser()
+    raw_response = PAGE.read_text()
+
+    quotes = pool.run('parse.wikiquote', parser.parse, 'Mark Twain', raw_response)
+
+    assert len(quotes) != 0
+    assert sorted((quote.quote, quote.description) for quote in quotes) == sorted(
+        (quote.quote, quote.description) for quote in parser.parse('Mark Twain', raw_response))
+
+
+def test_wikiquote_client_is_sent_as_client_of_its_localization():
+    client = WikiQuoteClient(Localization.ENGLISH)
+    # The memo of titles and its lock stay in the process
+    copy = pickle.loads(pickle.dumps(client))
+
+    assert copy.LOCALIZATION == Localization.ENGLISH
+    assert copy.validator is client.validator
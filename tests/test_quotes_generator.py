@@ -0,0 +1,283 @@
+import asyncio
+import json
+from time import perf_counter, sleep
+
+import pytest
+
+pytest.importorskip('nltk')
+
+from quotes_suggestions_service.clients.base import QuotesApiClient  # noqa: E402
+from quotes_suggestions_service.clients.dtos import Quote  # noqa: E402
+from quotes_suggestions_service.quotes_generator import QuotesGenerator  # noqa: E402
+from quotes_suggestions_service.utils.corpus import QuotesCorpus  # noqa: E402
+from quotes_suggestions_service.utils.fetcher import ConcurrentFetcher  # noqa: E402
+from quotes_suggestions_service.utils.local_cache import LocalQuotesCache  # noqa: E402
+from quotes_suggestions_service.utils.ranking import QuotesRanker  # noqa: E402
+
+
+def test_query_key_ignores_order_and_case():
+    assert QuotesGenerator._generate_query_key(('John Lennon', 'Princess Diana'), ('love', )) == \
+        QuotesGenerator._generate_query_key(('princess diana', 'John Lennon'), ('Love', ))
+
+
+def test_query_key_keeps_terms_and_roles_apart():
+    assert QuotesGenerator._generate_query_key(('ab', 'c'), ()) != \
+        QuotesGenerator._generate_query_key(('a', 'bc'), ())
+    assert QuotesGenerator._generate_query_key(('love', ), ()) != \
+        QuotesGenerator._generate_query_key((), ('love', ))
+
+
+def test_sub_queries_are_keyed_per_client_and_term():
+    sub_queries = QuotesGenerator().split_query(('John Lennon', 'Princess Diana'), ('love', ))
+
+    assert {
+        (client.name, authors, keywords) for client, authors, keywords in sub_queries.values()
+    } == {
+        (client.name, (author, ), ())
+        for client in QuotesGenerator.quotes_clients
+        for author in ('John Lennon', 'Princess Diana')
+    }
+    assert len(set(sub_queries)) == len(QuotesGenerator.quotes_clients) * 2
+
+
+class _StubClient(QuotesApiClient):
+    """
+    Answers every author or keyword with the quotes of `pages`, a page is yielded per `delay`
+    """
+
+    def __init__(self, name, pages=None, delay=0):
+        self.name = name
+        self.pages = pages or {}
+        self.delay = delay
+        self.calls = []
+
+    def get_quotes(self, authors, keywords):
+        return tuple(quote for page in self.iter_quotes(authors, keywords) for quote in page)
+
+    def iter_quotes(self, authors, keywords):
+        term = (authors or keywords)[0]
+        self.calls.append(term)
+        if term == 'broken':
+            raise ConnectionError('upstream is down')
+
+        for page in self.pages.get(term, ((Quote(quote=f'{term} quote', author=self.name), ), )):
+            sleep(self.delay)
+            yield page
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    monkeypatch.setattr(QuotesGenerator, 'quotes_clients', (_StubClient('stub'), ))
+    monkeypatch.setattr(QuotesGenerator, 'corpus', None)
+    monkeypatch.setattr(QuotesGenerator, 'hot_queries', None)
+    monkeypatch.setattr(QuotesGenerator, 'ranker', QuotesRanker(str.split, max_quotes=100))
+    monkeypatch.setattr(QuotesGenerator, 'local_cache', LocalQuotesCache(100, 60))
+    monkeypatch.setattr(QuotesGenerator.cache_storage, 'storage', fakeredis.FakeRedis())
+
+    return QuotesGenerator()
+
+
+def test_corpus_stands_in_for_missing_results_only(generator, monkeypatch, tmp_path):
+    corpus = QuotesCorpus(
+        str(tmp_path / 'corpus.sqlite3'), lambda texts: [text.lower().split() for text in texts])
+    corpus.add((
+        Quote(quote='peace of mind', author='corpus'),
+        Quote(quote='lennon wrote this', author='corpus'),
+        Quote(quote='a quote', author='Lennon'),
+    ))
+    monkeypatch.setattr(QuotesGenerator, 'corpus', corpus)
+    monkeypatch.setattr(generator, '_refresh_in_background', lambda sub_queries: None)
+    generator.cache_storage.set_cache(
+        generator._generate_sub_query_key(generator.quotes_clients[0], (), ('love', )),
+        (Quote(quote='cached love', author='redis'), ))
+
+    quotes = generator.get_quotes((), ('love', 'peace'), limit=10)
+
+    assert {quote.quote for quote in quotes} == {'cached love', 'peace of mind'}
+    assert generator.quotes_clients[0].calls == []
+    # Names of authors aren't keywords
+    assert {quote.quote for quote in generator.get_quotes((), ('lennon', ), limit=10)} == {
+        'lennon wrote this'}
+
+
+def test_ranked_quotes_are_paged_from_redis(generator, monkeypatch):
+    client = generator.quotes_clients[0]
+    love_quotes = tuple(Quote(quote=f'love {number}', author='a') for number in range(5))
+    client.pages = {'love': (love_quotes, )}
+
+    sorted_quotes = generator.get_quotes((), ('love', ), limit=5)
+    # Another process has nothing in its in-process cache and doesn't assemble the quotes
+    monkeypatch.setattr(QuotesGenerator, 'local_cache', LocalQuotesCache(100, 60))
+    monkeypatch.setattr(generator.cache_storage, 'get_many_with_stale_keys', None)
+
+    assert generator.get_quotes((), ('love', ), limit=2, offset=1) == sorted_quotes[1:3]
+    assert generator.get_quotes((), ('love', ), limit=10, offset=4) == sorted_quotes[4:]
+    assert set(sorted_quotes) == set(love_quotes)
+    assert client.calls == ['love']
+
+
+def test_batch_fetches_shared_sub_queries_once(generator):
+    client = generator.quotes_clients[0]
+
+    results = generator.get_quotes_many([
+        (('Mark Twain', 'Oscar Wilde'), (), 5, 0),
+        (('Oscar Wilde', ), (), 5, 0),
+        ((), ('love', ), 5, 0),
+        (('oscar wilde', ), (), 5, 1),
+    ])
+
+    # Terms are compared as the cache keys compare them
+    assert sorted(term.lower() for term in client.calls) == ['love', 'mark twain', 'oscar wilde']
+    assert {quote.quote.lower() for quote in results[0]} == {
+        'mark twain quote', 'oscar wilde quote'}
+    assert [quote.quote.lower() for quote in results[1]] == ['oscar wilde quote']
+    assert [quote.quote for quote in results[2]] == ['love quote']
+    assert results[3] == ()
+
+
+def test_async_batch_fetches_shared_sub_queries_once(generator):
+    client = generator.quotes_clients[0]
+
+    results = asyncio.run(generator.aget_quotes_many([
+        (('Mark Twain', 'broken'), (), 5, 0),
+        (('Mark Twain', ), (), 5, 0),
+    ]))
+
+    assert sorted(client.calls) == ['Mark Twain', 'broken']
+    assert [[quote.quote for quote in quotes] for quotes in results] == [
+        ['Mark Twain quote'], ['Mark Twain quote']]
+
+
+def test_batch_reports_partial_failures_per_query(generator):
+    client = generator.quotes_clients[0]
+
+    results = generator.get_quotes_many([
+        (('Mark Twain', 'broken'), (), 5, 0),
+        (('Oscar Wilde', ), (), 5, 0),
+    ])
+
+    assert [quote.quote for quote in results[0]] == ['Mark Twain quote']
+    assert [quote.quote for quote in results[1]] == ['Oscar Wilde quote']
+    # Only the complete answer is cached, the failed sub-query is fetched again
+    assert generator.local_cache.get(
+        generator._generate_query_key(('Mark Twain', 'broken'), ())) is None
+    assert generator.local_cache.get(
+        generator._generate_query_key(('Oscar Wilde', ), ())) is not None
+
+    generator.get_quotes_many([(('Mark Twain', 'broken'), (), 5, 0)])
+    assert sorted(client.calls) == ['Mark Twain', 'Oscar Wilde', 'broken', 'broken']
+
+
+def test_batch_size_is_limited(generator, monkeypatch):
+    pytest.importorskip('flask')
+    from quotes_suggestions_service import app
+
+    monkeypatch.setattr(
+        'quotes_suggestions_service.SUGGESTIONS_BATCH_MAX_QUERIES', 2)
+    client = app.test_client()
+
+    response = client.post('/suggestions/batch', json={'queries': [
+        {'authors': 'Mark Twain'}, {'keywords': ['love', 'life']}, {'authors': 'Oscar Wilde'}]})
+    assert response.status_code == 400
+    assert generator.quotes_clients[0].calls == []
+
+    response = client.post('/suggestions/batch', json={'queries': [
+        {'id': 'twain', 'authors': 'Mark Twain'}, {'keywords': ['love', 'life'], 'limit': 2}]})
+    assert response.status_code == 200
+    assert {
+        query_id: sorted(quote['quote'] for quote in quotes)
+        for query_id, quotes in response.get_json()['results'].items()
+    } == {'twain': ['Mark Twain quote'], '1': ['life quote', 'love quote']}
+
+
+def test_stream_yields_cached_quotes_then_pages_in_order(generator):
+    client = generator.quotes_clients[0]
+    client.pages = {'life': ((Quote(quote='life one', author='a'), ),
+                             (Quote(quote='life two', author='a'), ))}
+    client.delay = 0.05
+    generator.cache_storage.set_cache(
+        generator._generate_sub_query_key(client, (), ('love', )),
+        (Quote(quote='cached love', author='redis'), ))
+
+    batches = list(generator.iter_quotes((), ('love', 'life'), limit=10))
+
+    assert [[quote.quote for quote in batch] for batch in batches] == [
+        ['cached love'], ['life one'], ['life two']]
+    assert client.calls == ['life']
+
+
+def test_stream_is_cut_at_limit(generator):
+    client = generator.quotes_clients[0]
+    client.pages = {'love': tuple(
+        (Quote(quote=f'love {number}', author='a'), ) for number in ('one', 'two', 'three'))}
+
+    batches = list(generator.iter_quotes((), ('love', ), limit=2))
+
+    assert [[quote.quote for quote in batch] for batch in batches] == [['love one'], ['love two']]
+
+
+def test_stream_cut_by_deadline_is_not_cached(generator, monkeypatch):
+    monkeypatch.setattr(QuotesGenerator, 'fetcher', ConcurrentFetcher(2, 0.45))
+    client = generator.quotes_clients[0]
+    client.pages = {'love': ((Quote(quote='love one', author='a'), ),
+                             (Quote(quote='love two', author='a'), ))}
+    client.delay = 0.3
+    sub_key = generator._generate_sub_query_key(client, (), ('love', ))
+
+    batches = list(generator.iter_quotes((), ('love', ), limit=10))
+
+    assert [[quote.quote for quote in batch] for batch in batches] == [['love one']]
+    assert generator.local_cache.get(generator._generate_query_key((), ('love', ))) is None
+    assert not generator.cache_storage.key_in_cache(sub_key)
+    # The sub-query keeps being fetched and is stored once all of its pages are
+    for _ in range(40):
+        if generator.cache_storage.key_in_cache(sub_key):
+            break
+        sleep(0.05)
+    assert {quote.quote for quote in generator.cache_storage.get_many((sub_key, ))[sub_key]} == {
+        'love one', 'love two'}
+
+
+def test_early_answer_waits_for_enough_matches_only(generator):
+    client = generator.quotes_clients[0]
+    client.pages = {
+        term: ((Quote(quote=f'{term} one', author='a'), Quote(quote='a filler', author='a')),
+               (Quote(quote=f'{term} two', author='a'), ))
+        for term in ('love', 'hope')
+    }
+    client.delay = 0.3
+
+    started = perf_counter()
+    quotes = generator.get_quotes_early((), ('love', ), limit=1)
+    assert perf_counter() - started < 0.55
+    assert [quote.quote for quote in quotes] == ['love one']
+
+    started = perf_counter()
+    quotes = generator.get_quotes_early((), ('hope', ), limit=2)
+    assert perf_counter() - started >= 0.55
+    assert {quote.quote for quote in quotes} == {'hope one', 'hope two'}
+
+
+@pytest.mark.parametrize('mode', ['ndjson', 'sse'])
+def test_stream_endpoint_encodes_quotes(generator, mode):
+    pytest.importorskip('flask')
+    from quotes_suggestions_service import app
+
+    client = generator.quotes_clients[0]
+    client.pages = {'love': ((Quote(quote='love one', author='a'), ),
+                             (Quote(quote='love two', author='a'), ))}
+
+    response = app.test_client().get(f'/suggestions?keywords=love&limit=5&mode={mode}')
+    body = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    if mode == 'sse':
+        assert response.content_type.startswith('text/event-stream')
+        assert body.endswith('event: end\ndata: {}\n\n')
+        events = body.split('\n\n')[:-2]
+        assert all(event.startswith('event: quote\ndata: ') for event in events)
+        items = [json.loads(event.split('data: ', 1)[1]) for event in events]
+    else:
+        items = [json.loads(line) for line in body.splitlines()]
+    assert [item['quote'] for item in items] == ['love one', 'love two']
@@ -0,0 +1,128 @@
+import random
+
+from quotes_suggestions_service.clients.dtos import Quote
+from quotes_suggestions_service.utils.ranking import QuotesRanker
+
+
+WORDS = ('love', 'peace', 'war', 'life', 'time', 'hope', 'dream', 'light')
+
+
+def _analyze(text: str):
+    # Stands for lemmatization in tests: "loving" -> "love"
+    return [word[:-3] + 'e' if word.endswith('ing') else word for word in text.lower().split()]
+
+
+def _quotes(count: int, seed: int = 0):
+    generator = random.Random(seed)
+
+    return tuple(
+        Quote(
+            quote=' '.join(generator.choice(WORDS) for _ in range(generator.randint(1, 12))),
+            author=f'author {number}')
+        for number in range(count))
+
+
+def _rank(keywords, quotes):
+    return QuotesRanker(_analyze, max_quotes=1000).rank(keywords, quotes)[:]
+
+
+def test_lemmas_are_matched():
+    quotes = (Quote(quote='war and war', author='a'), Quote(quote='loving life', author='b'))
+
+    assert _rank(('love', ), quotes)[0].author == 'b'
+
+
+def test_bigrams_rank_above_separate_words():
+    quotes = (
+        Quote(quote='peace after love', author='separate'),
+        Quote(quote='love peace after', author='bigram'),
+    )
+
+    assert _rank(('love peace', ), quotes)[0].author == 'bigram'
+
+
+def test_rare_terms_weigh_more_than_common_ones():
+    quotes = (
+        Quote(quote='life time', author='common'),
+        Quote(quote='dream time', author='rare'),
+        Quote(quote='life hope', author='other'),
+        Quote(quote='life light', author='other'),
+    )
+
+    assert _rank(('life', 'dream'), quotes)[0].author == 'rare'
+
+
+def test_equally_relevant_quotes_are_ordered_by_length():
+    quotes = (
+        Quote(quote='war war war war', author='long'),
+        Quote(quote='war war', author='short'),
+        Quote(quote='peace', author='unrelated'),
+    )
+
+    assert [quote.author for quote in _rank(('hope', ), quotes)] == ['unrelated', 'short', 'long']
+
+
+def test_pages_agree_with_the_whole_ranking():
+    quotes = _quotes(300, seed=1)
+    ranker = QuotesRanker(_analyze, max_quotes=1000)
+
+    ranked = ranker.rank(('war', 'love peace'), quotes)
+    pages = ranked[0:5] + ranked[5:40] + ranked[40:]
+
+    assert pages == ranker.rank(('war', 'love peace'), quotes)[:]
+    assert len(set(pages)) == len(set(quotes))
+    assert ranked[0] == pages[0]
+    assert ranked[1000:1005] == ()
+
+
+def test_unknown_keywords_and_empty_input():
+    ranker = QuotesRanker(_analyze, max_quotes=10)
+
+    assert ranker.rank(('love', ), ())[:] == ()
+    assert len(ranker.rank(('unknown', ), _quotes(20))) == 20
+
+
+def test_analyzed_quotes_are_bounded_and_reused():
+    calls = []
+
+    def analyze(text: str):
+        calls.append(text)
+        return _analyze(text)
+
+    quotes = _quotes(5, seed=2)
+    ranker = QuotesRanker(analyze, max_quotes=3)
+
+    ranker.index(quotes[:3])
+    ranker.rank(('love', ), quotes[:3])
+    assert len(calls) == 4  # three quotes and the keyword
+
+    ranker.index(quotes[3:])
+    assert len(ranker._terms) == 3
+
+
+def test_matches_count_quotes_with_keywords():
+    quotes = (
+        Quote(quote='war and war', author='a'),
+        Quote(quote='loving life', author='b'),
+        Quote(quote='love peace', author='c'),
+    )
+    ranker = QuotesRanker(_analyze, max_quotes=1000)
+
+    assert ranker.rank(('love', ), quotes).matches == 2
+    assert ranker.rank(('dream', ), quotes).matches == 0
+
+
+def test_missing_quotes_are_analyzed_in_one_batch():
+    batches = []
+
+    def analyze_many(texts):
+        batches.append(texts)
+        return [_analyze(text) for text in texts]
+
+    quotes = _quotes(20)
+    ranker = QuotesRanker(_analyze, max_quotes=1000, analyze_many=analyze_many)
+    ranker.index(quotes[:5])
+
+    assert ranker.rank(('love', ), quotes)[:] == _rank(('love', ), quotes)
+    assert batches == [
+        tuple(quote.quote for quote in quotes[:5]), tuple(quote.quote for quote in quotes[5:])]
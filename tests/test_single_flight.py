@@ -0,0 +1,109 @@
+import asyncio
+from threading import Barrier, Thread
+from time import sleep
+
+import pytest
+
+from quotes_suggestions_service.utils.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def _run_concurrently(function, count: int):
+    results = [None] * count
+    barrier = Barrier(count)
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = function()
+        except Exception as error:
+            results[index] = error
+
+    threads = [Thread(target=run, args=(index, )) for index in range(count)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    return results
+
+
+def test_concurrent_calls_are_coalesced():
+    single_flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        sleep(0.2)
+        return 'quotes'
+
+    results = _run_concurrently(lambda: single_flight.do('key', fetch), 5)
+
+    assert results == ['quotes'] * 5
+    assert len(calls) == 1
+
+
+def test_followers_get_leader_exception():
+    single_flight = SingleFlight()
+    error = RuntimeError('upstream is down')
+
+    def fetch():
+        sleep(0.2)
+        raise error
+
+    results = _run_concurrently(lambda: single_flight.do('key', fetch), 5)
+
+    assert all(result is error for result in results)
+    # The failed call isn't remembered
+    assert single_flight.do('key', lambda: 'quotes') == 'quotes'
+
+
+def test_async_concurrent_calls_are_coalesced():
+    single_flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'quotes'
+
+    async def main():
+        return await asyncio.gather(*(single_flight.do('key', fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['quotes'] * 5
+    assert len(calls) == 1
+
+
+def test_async_waiter_cancellation_does_not_cancel_call():
+    single_flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.1)
+        return 'quotes'
+
+    async def main():
+        cancelled = asyncio.ensure_future(single_flight.do('key', fetch))
+        waiter = asyncio.ensure_future(single_flight.do('key', fetch))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        return await waiter
+
+    assert asyncio.run(main()) == 'quotes'
+
+
+def test_async_followers_get_leader_exception():
+    single_flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.1)
+        raise RuntimeError('upstream is down')
+
+    async def main():
+        return await asyncio.gather(
+            *(single_flight.do('key', fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert results[0] is results[1] is results[2]
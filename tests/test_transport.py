@@ -0,0 +1,79 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import monotonic
+
+import pytest
+
+from quotes_suggestions_service.clients.transport import (
+    DeadlineExceeded, HostRateLimiter, HttpTransport, fetch_deadline)
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    yield f'http://127.0.0.1:{server.server_port}'
+
+    server.shutdown()
+    server.server_close()
+
+
+def _transport() -> HttpTransport:
+    return HttpTransport(
+        connect_timeout=1, read_timeout=1, retries=0, backoff_factor=0, pool_maxsize=2)
+
+
+def test_connections_are_reused_and_counted(server_url):
+    transport = _transport()
+
+    for page in range(3):
+        assert transport.get(f'{server_url}/page/{page}').text == 'ok'
+
+    stats = transport.stats.snapshot()['127.0.0.1']
+    assert (stats['requests'], stats['connections'], stats['pool_hits']) == (3, 1, 2)
+    assert stats['connect_time'] > 0
+
+
+def test_timeouts_are_shortened_to_the_fetch_deadline():
+    transport = _transport()
+
+    token = fetch_deadline.set(monotonic() + 0.5)
+    try:
+        assert all(timeout <= 0.5 for timeout in transport._get_timeout())
+    finally:
+        fetch_deadline.reset(token)
+    assert transport._get_timeout() == (1, 1)
+
+    token = fetch_deadline.set(monotonic() - 1)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            transport.get('http://127.0.0.1:1/')
+    finally:
+        fetch_deadline.reset(token)
+
+
+def test_requests_to_every_host_are_spaced_out():
+    limiter = HostRateLimiter(rate=20)
+    started = monotonic()
+
+    for _ in range(3):
+        limiter.wait('www.brainyquote.com')
+    # Other hosts have their own turns
+    limiter.wait('en.wikiquote.org')
+
+    assert 0.1 <= monotonic() - started < 0.2
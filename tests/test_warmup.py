@@ -0,0 +1,112 @@
+import pytest
+
+pytest.importorskip('nltk')
+
+from quotes_suggestions_service.clients.base import QuotesApiClient  # noqa: E402
+from quotes_suggestions_service.clients.dtos import Quote  # noqa: E402
+from quotes_suggestions_service.quotes_generator import QuotesGenerator  # noqa: E402
+from quotes_suggestions_service.utils.ranking import QuotesRanker  # noqa: E402
+from quotes_suggestions_service.warmup import (  # noqa: E402
+    WarmUpState, get_pending_sub_queries, get_sub_queries, parse_query, read_queries, warm_up,
+)
+
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+class _RecordingClient(QuotesApiClient):
+
+    name = 'recording'
+
+    def __init__(self):
+        self.calls = []
+
+    def get_quotes(self, authors, keywords):
+        self.calls.append((authors, keywords))
+        if 'broken' in authors:
+            raise ConnectionError('upstream is down')
+
+        return (Quote(quote=f'quote of {authors or keywords}', author='author'), )
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = _RecordingClient()
+    monkeypatch.setattr(QuotesGenerator, 'quotes_clients', (client, ))
+    monkeypatch.setattr(QuotesGenerator, 'corpus', None)
+    # Fetched quotes are indexed for ranking, it isn't a part of the warm-up
+    monkeypatch.setattr(QuotesGenerator, 'ranker', QuotesRanker(str.split, max_quotes=100))
+    monkeypatch.setattr(QuotesGenerator.cache_storage, 'storage', fakeredis.FakeRedis())
+
+    return client
+
+
+def test_queries_are_read_from_access_log_lines_and_query_strings():
+    lines = (
+        '10.0.0.1 - - [18/Oct/2026:10:00:00 +0000] '
+        '"GET /suggestions?authors=Mark%20Twain&keywords=truth HTTP/1.1" 200 512',
+        'keywords=love,life&limit=3',
+        'authors=Oscar+Wilde',
+        '"GET /metrics HTTP/1.1" 200 128',
+        '',
+    )
+
+    assert list(read_queries(lines)) == [
+        (('Mark Twain', ), ('truth', )),
+        ((), ('love', 'life')),
+        (('Oscar Wilde', ), ()),
+    ]
+    assert parse_query('"GET /suggestions?limit=3 HTTP/1.1"') is None
+
+
+def test_sub_queries_are_unique_and_most_requested_first(client):
+    sub_queries = get_sub_queries(
+        QuotesGenerator(), [((), ('life', )), ((), ('love', 'life')), (('Life', ), ())])
+
+    assert [sub_query[1:] for sub_query in sub_queries.values()] == [
+        ((), ('life', )), ((), ('love', )), (('Life', ), ())]
+
+
+def test_fetched_and_fresh_sub_queries_are_skipped(client, tmp_path):
+    generator = QuotesGenerator()
+    sub_queries = get_sub_queries(
+        generator, [(('Mark Twain', ), ()), (('Oscar Wilde', ), ()), (('broken', ), ())])
+    state = WarmUpState(tmp_path / 'state')
+    reports = []
+
+    warm_up(
+        generator, get_pending_sub_queries(generator, sub_queries, state), state, 2,
+        lambda sub_key, quotes, error: reports.append((sub_key, quotes, error)))
+
+    assert sorted(client.calls) == [
+        (('Mark Twain', ), ()), (('Oscar Wilde', ), ()), (('broken', ), ())]
+    assert sum(error is not None for _, _, error in reports) == 1
+    # Only the stored results are recorded, the failed one is fetched again
+    assert WarmUpState(tmp_path / 'state').done == state.done
+    assert len(state.done) == 2
+    assert list(get_pending_sub_queries(generator, sub_queries, state).values()) == [
+        (client, ('broken', ), ())]
+
+    # Stored results outlive the soft TTL, fetched ones aren't fetched again by the run
+    generator.cache_storage.storage.delete(*(
+        generator.cache_storage._get_freshness_key(sub_key) for sub_key in state.done))
+    assert all(ttl > 3600 for ttl in generator.cache_storage.get_ttls(state.done).values())
+    assert len(get_pending_sub_queries(generator, sub_queries, state)) == 1
+    assert len(get_pending_sub_queries(generator, sub_queries, WarmUpState())) == 3
+    assert len(get_pending_sub_queries(generator, sub_queries, state, force=True)) == 1
+
+    # Results which have expired since are fetched again
+    generator.cache_storage.reset_cache()
+    assert len(get_pending_sub_queries(generator, sub_queries, state)) == 3
+
+
+def test_state_of_older_run_is_discarded(tmp_path):
+    path = tmp_path / 'state'
+    state = WarmUpState(path, max_age=60)
+    state.add('raw:recording:authors=marktwain;keywords=')
+
+    assert WarmUpState(path, max_age=60).done == state.done
+
+    path.write_text(f'started={state.started - 120}\n' + 'raw:recording:authors=x;keywords=\n')
+    assert WarmUpState(path, max_age=60).done == set()
+    assert WarmUpState(path, max_age=60).done == set()
@@ -0,0 +1,108 @@
+import json
+from pathlib import Path
+
+import pytest
+import requests
+
+from quotes_suggestions_service.clients.wikiquote import WikiQuoteClient
+from quotes_suggestions_service.utils.enums import Localization
+from quotes_suggestions_service.clients.wikiquote.parsers import LxmlQuotesParser, SoupQuotesParser
+
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'wikiquote'
+PAGES = ('john_lennon', 'mark_twain')
+
+
+def _fields(quotes):
+    # `Quote.__eq__` ignores descriptions, so all the fields are compared explicitly
+    return sorted((quote.quote, quote.author, quote.description) for quote in quotes)
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_lxml_parser_matches_soup_parser(page):
+    raw_response = (FIXTURES / f'{page}.html').read_text()
+
+    expected = _fields(SoupQuotesParser().parse('Author', raw_response))
+
+    assert len(expected) != 0
+    assert _fields(LxmlQuotesParser().parse('Author', raw_response)) == expected
+
+
+def test_extra_blocks_and_other_sections_are_skipped():
+    raw_response = (FIXTURES / 'john_lennon.html').read_text()
+
+    quotes = {quote.quote for quote in LxmlQuotesParser().parse('John Lennon', raw_response)}
+
+    assert 'All you need is love.' in quotes
+    assert not {'Disputed quote about & love.', 'Misattributed quote.', 'He was a genius.'} & quotes
+
+
+def test_page_without_content_has_no_quotes():
+    assert LxmlQuotesParser().parse('Author', '<p>Nothing</p>') == set()
+
+
+class _Response:
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        # Responses are decoded from JSON, the same way as real ones
+        return json.loads(json.dumps(self.data))
+
+
+class _Transport:
+
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def get(self, url, params):
+        self.requests.append(params)
+        return _Response(self.data)
+
+
+def test_titles_are_resolved_in_one_query():
+    client = WikiQuoteClient(Localization.ENGLISH)
+    client.transport = _Transport({'query': {
+        'normalized': [{'from': 'john lennon', 'to': 'John lennon'}],
+        'redirects': [{'from': 'John lennon', 'to': 'John Lennon'}],
+        'pages': {
+            '1': {'pageid': 1, 'title': 'John Lennon'},
+            '2': {'pageid': 2, 'title': 'Mark Twain'},
+            '-1': {'title': 'Nobody', 'missing': ''},
+        },
+    }})
+
+    client.prepare_query(('john lennon', 'Mark Twain', 'Nobody'), ())
+
+    assert client._resolve_titles(('john lennon', 'Nobody', 'Mark Twain')) == \
+        ('John Lennon', 'Mark Twain')
+    assert len(client.transport.requests) == 1
+    assert client.transport.requests[0]['titles'] == 'john lennon|Mark Twain|Nobody'
+    assert client.transport.requests[0]['redirects'] == 1
+
+
+def test_single_title_is_left_to_parse_redirects():
+    client = WikiQuoteClient(Localization.ENGLISH)
+    client.transport = _Transport({})
+
+    assert client._resolve_titles(('john lennon', )) == ('john lennon', )
+    assert client.transport.requests == []
+    assert client._get_url_parameters('john lennon').mapping()['redirects'] == 1
+
+
+def test_titles_are_left_unresolved_when_query_fails():
+    class _BrokenTransport(_Transport):
+
+        def get(self, url, params):
+            super().get(url, params)
+            raise requests.ConnectionError('upstream is down')
+
+    client = WikiQuoteClient(Localization.ENGLISH)
+    client.transport = _BrokenTransport({})
+
+    client.prepare_query(('john lennon', 'Mark Twain'), ())
+
+    assert client._resolve_titles(('john lennon', )) == ('john lennon', )
+    assert len(client.transport.requests) == 1